@@ -1,13 +1,32 @@
-import hashlib, csv, datetime, yaml
+import hashlib, csv, datetime, yaml, json, mmap, os, argparse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+MANIFEST = Path("requirements/library/sources_manifest__v0_1.csv")
+
+# (path, size, mtime_ns, inode) -> sha256; unchanged files are not re-read.
+STAT_CACHE = Path("requirements/.cache/hash_stat_cache.json")
+
+MMAP_MIN_BYTES = 1024 * 1024
 
 def sha256_file(p: Path) -> str:
     h = hashlib.sha256()
     with p.open("rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
-            h.update(chunk)
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_MIN_BYTES:
+            # zero-copy: hashlib releases the GIL on large buffers, so threads hash in parallel
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+        else:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
     return h.hexdigest()
 
+def hash_one(p: Path) -> str:
+    with metrics.span("hash", doc=p.name, path=str(p), bytes=p.stat().st_size):
+        return sha256_file(p)
+
 def infer_format(p: Path) -> str:
     suf = p.suffix.lower()
     if suf in (".html", ".htm", ".xhtml"):
@@ -16,52 +35,127 @@ def infer_format(p: Path) -> str:
         return "pdf"
     return suf.lstrip(".") or "unknown"
 
-cfg = yaml.safe_load(Path("requirements/config/instruments.yml").read_text(encoding="utf-8"))
-rows = []
-now = datetime.datetime.utcnow().isoformat()
-
-for inst in cfg["instruments"]:
-    for v in inst["versions"]:
-        # Primary source (always hashed)
-        primary_path = Path(v["path"])
-        if not primary_path.exists():
-            raise FileNotFoundError(f"Missing primary: {primary_path}")
-
-        rows.append({
-            "instrument_code": inst["code"],
-            "title": inst.get("title",""),
-            "lang": v["lang"],
-            "artifact_role": "primary",
-            "artifact_format": infer_format(primary_path),
-            "file_path": str(primary_path),
-            "sha256": sha256_file(primary_path),
-            "source_url": v.get("source_url",""),
-            "retrieved_at_utc": v.get("retrieved_at_utc","") or now,
-        })
-
-        # Optional extra artifacts (PDF copies etc.)
-        for a in v.get("artifacts", []):
-            ap = Path(a["path"])
-            if not ap.exists():
-                raise FileNotFoundError(f"Missing artifact: {ap}")
-
-            rows.append({
+def stat_key(p: Path):
+    st = p.stat()
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+def load_stat_cache(path: Path):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def hash_files(paths, cache, workers: int):
+    """
+    path -> sha256. Only files whose (size, mtime_ns, inode) changed since the last run are hashed.
+    Updates `cache` in place; returns (digests, number of files actually hashed).
+    """
+    digests, todo = {}, []
+    with metrics.span("stat", records=len(paths)):
+        for p in paths:
+            key = str(p)
+            st = stat_key(p)
+            hit = cache.get(key)
+            if hit and hit["stat"] == st:
+                digests[key] = hit["sha256"]
+            else:
+                todo.append((p, st))
+
+    with metrics.span("hash_all", records=len(todo), bytes=sum(st[0] for _, st in todo)), \
+            ThreadPoolExecutor(max_workers=workers) as ex:
+        for (p, st), sha in zip(todo, ex.map(hash_one, [p for p, _ in todo])):
+            digests[str(p)] = sha
+            cache[str(p)] = {"stat": st, "sha256": sha}
+    return digests, len(todo)
+
+def load_manifest_rows(path: Path):
+    if not path.exists():
+        return []
+    with path.open(newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+def main():
+    ap = argparse.ArgumentParser(description="Hash primary sources and artifacts into the sources manifest.")
+    ap.add_argument("--workers", type=int, default=min(8, (os.cpu_count() or 1) + 4), help="hashing threads")
+    ap.add_argument("--no-stat-cache", action="store_true", help=f"re-hash every file, ignoring {STAT_CACHE}")
+    args = ap.parse_args()
+
+    cfg = yaml.safe_load(Path("requirements/config/instruments.yml").read_text(encoding="utf-8"))
+    now = datetime.datetime.utcnow().isoformat()
+
+    # Collect (row template, path) first, then hash everything in one batch.
+    entries = []
+    for inst in cfg["instruments"]:
+        for v in inst["versions"]:
+            # Primary source (always hashed)
+            primary_path = Path(v["path"])
+            if not primary_path.exists():
+                raise FileNotFoundError(f"Missing primary: {primary_path}")
+
+            entries.append(({
                 "instrument_code": inst["code"],
                 "title": inst.get("title",""),
                 "lang": v["lang"],
-                "artifact_role": a.get("role", "secondary"),
-                "artifact_format": a.get("format", infer_format(ap)),
-                "file_path": str(ap),
-                "sha256": sha256_file(ap),
-                "source_url": a.get("source_url",""),
-                "retrieved_at_utc": v.get("retrieved_at_utc","") or now,
-            })
-
-out = Path("requirements/library/sources_manifest__v0_1.csv")
-out.parent.mkdir(parents=True, exist_ok=True)
-with out.open("w", newline="", encoding="utf-8") as f:
-    w = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
-    w.writeheader()
-    w.writerows(rows)
-
-print(f"Wrote {out} ({len(rows)} rows)")
+                "artifact_role": "primary",
+                "artifact_format": infer_format(primary_path),
+                "file_path": str(primary_path),
+                "source_url": v.get("source_url",""),
+                "retrieved_at_utc": v.get("retrieved_at_utc",""),
+            }, primary_path))
+
+            # Optional extra artifacts (PDF copies etc.)
+            for a in v.get("artifacts", []):
+                art_path = Path(a["path"])
+                if not art_path.exists():
+                    raise FileNotFoundError(f"Missing artifact: {art_path}")
+
+                entries.append(({
+                    "instrument_code": inst["code"],
+                    "title": inst.get("title",""),
+                    "lang": v["lang"],
+                    "artifact_role": a.get("role", "secondary"),
+                    "artifact_format": a.get("format", infer_format(art_path)),
+                    "file_path": str(art_path),
+                    "source_url": a.get("source_url",""),
+                    "retrieved_at_utc": v.get("retrieved_at_utc",""),
+                }, art_path))
+
+    cache = {} if args.no_stat_cache else load_stat_cache(STAT_CACHE)
+    digests, n_hashed = hash_files(list(dict.fromkeys(p for _, p in entries)), cache, args.workers)
+    STAT_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STAT_CACHE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(cache, indent=0, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, STAT_CACHE)
+
+    # Keep the previous retrieved_at_utc for unchanged files, so an unchanged corpus yields an unchanged manifest.
+    previous_rows = load_manifest_rows(MANIFEST)
+    previous = {r["file_path"]: r for r in previous_rows}
+    rows = []
+    for tmpl, p in entries:
+        sha = digests[str(p)]
+        prev = previous.get(str(p))
+        retrieved = tmpl["retrieved_at_utc"]
+        if not retrieved:
+            retrieved = prev["retrieved_at_utc"] if prev and prev["sha256"] == sha else now
+        row = {k: tmpl[k] for k in ("instrument_code", "title", "lang", "artifact_role", "artifact_format", "file_path")}
+        row.update({"sha256": sha, "source_url": tmpl["source_url"], "retrieved_at_utc": retrieved})
+        rows.append(row)
+
+    if rows == previous_rows:
+        print(f"Unchanged {MANIFEST} ({len(rows)} rows, {n_hashed} files hashed)")
+        return
+
+    MANIFEST.parent.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST.with_name(MANIFEST.name + ".tmp")
+    with metrics.span("write", path=str(MANIFEST), records=len(rows)):
+        with tmp.open("w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            w.writeheader()
+            w.writerows(rows)
+        os.replace(tmp, MANIFEST)
+
+    print(f"Wrote {MANIFEST} ({len(rows)} rows, {n_hashed} files hashed)")
+
+if __name__ == "__main__":
+    with metrics.stage("01"):
+        main()
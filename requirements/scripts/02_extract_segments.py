@@ -1,10 +1,16 @@
-import re, json, yaml
+import re, json, yaml, os, shutil, hashlib, argparse
 from pathlib import Path
-import pdfplumber
-import pandas as pd
-from bs4 import BeautifulSoup
-
+from concurrent.futures import ProcessPoolExecutor
 import csv
+import metrics
+import jsonl_store
+import pipeline_io
+
+# parsers are loaded on first use: an all-HTML run never imports pdfplumber / pypdfium2
+pdfplumber = pipeline_io.lazy_import("pdfplumber")
+pypdfium2 = pipeline_io.lazy_import("pypdfium2")   # ships with pdfplumber; only used for the cheap page index
+bs4 = pipeline_io.lazy_import("bs4")
+etree = pipeline_io.lazy_import("lxml.etree")
 
 def load_manifest_by_path(path: str):
     m = {}
@@ -31,49 +37,209 @@ INCLUDE_ARTICLES = {
 # Safety: alles > 99 ist fast sicher NICHT Teil der Instrument-Artikel (z.B. "Article 114 thereof")
 MAX_ARTICLE_NO = 99
 
+# Bump whenever normalize_text / tokenize / extract_* change their output -> invalidates the cache.
+EXTRACTOR_VERSION = "3"
+
+# Content-addressed cache: key = (source sha256 from the manifest, extractor version, article filter).
+# Unchanged sources are neither re-parsed nor re-split. Re-run 01_hash_sources.py after replacing a source.
+CACHE_DIR = Path("requirements/.cache/extract")
+CACHE_MAX_MB = 512
+
 
 ARTICLE_PAT = {
+    # PDF page index (pdf_article_pages); the tokenizer matches headings line by line (ARTICLE_LINE).
     # Heading form: "Article 19" or "Article 19 Title..." (line start).
     # Require start-of-line to avoid "Article 114 thereof" in running text.
     "en": re.compile(r"(?im)^\s*article\s+(\d+)\b[^\n]*$"),
     "de": re.compile(r"(?im)^\s*artikel\s+(\d+)\b[^\n]*$"),
 }
 
-ARTICLE_PAT_FALLBACK_EN = re.compile(r"(?i)(?:^|\n)\s*article\s+(\d+)\b")
-
-
+# EUR-Lex structural markup: <div class="eli-subdivision" id="art_17"> ... <div id="017.003"> ...
+ART_ID_PAT = re.compile(r"art_(\d+)$")
+PARA_ID_PAT = re.compile(r"(\d{3})\.(\d{3})$")
 
-
-
-
-POINT_PAT = re.compile(r"(?m)^\s*\(\s*([a-z])\s*\)\s+")
-
-PARA_PAT = re.compile(r"(?m)^\s*(?:\(\s*(\d+)\s*\)|(\d+)\.)\s+")
+def is_xhtml(head: str) -> bool:
+    return head.lstrip().startswith("<?xml") or "<xhtml" in head[:2000].lower()
 
 def extract_html_text(html_path: Path) -> str:
-    raw = html_path.read_text(encoding="utf-8", errors="ignore")
-
-    # EUR-Lex often serves XHTML (XML). Detect and parse accordingly.
-    if raw.lstrip().startswith("<?xml") or "<xhtml" in raw[:2000].lower():
-        soup = BeautifulSoup(raw, "lxml-xml")   # XML parser
-    else:
-        soup = BeautifulSoup(raw, "lxml")       # HTML parser
+    with metrics.span("read", path=str(html_path)) as sp:
+        raw = html_path.read_text(encoding="utf-8", errors="ignore")
+        sp["bytes"] = len(raw)
+
+    with metrics.span("parse", parser="bs4"):
+        # EUR-Lex often serves XHTML (XML). Detect and parse accordingly.
+        if is_xhtml(raw):
+            soup = bs4.BeautifulSoup(raw, "lxml-xml")   # XML parser
+        else:
+            soup = bs4.BeautifulSoup(raw, "lxml")       # HTML parser
+
+        for t in soup(["script", "style", "noscript"]):
+            t.decompose()
+
+    with metrics.span("normalize"):
+        text = soup.get_text("\n")
+        return normalize_text(text)
+
+
+def extract_html_segments(html_path: Path, instrument_code: str, granularity: str = "paragraph"):
+    """
+    Single streaming pass over the EUR-Lex markup: article and paragraph numbers come from the
+    element ids, not from regexes over flattened text. Everything outside a wanted paragraph
+    (recitals, annexes, articles not in INCLUDE_ARTICLES) is discarded as soon as it is parsed.
+    Articles without numbered paragraph divs are skipped, as in the regex splitter.
+    Returns None if the document has no article subdivisions (caller falls back to regex).
+    granularity="point" splits each paragraph's text into intro and points (see tree_segments).
+    """
+    with html_path.open("r", encoding="utf-8", errors="ignore") as f:
+        head = f.read(2000)
+
+    allowed = INCLUDE_ARTICLES.get(instrument_code)
+    context = etree.iterparse(
+        str(html_path), events=("start", "end"), html=not is_xhtml(head),
+        recover=True, huge_tree=True, no_network=True, resolve_entities=False,
+        remove_comments=True, remove_pis=True,
+    )
 
-    for t in soup(["script", "style", "noscript"]):
-        t.decompose()
-
-    text = soup.get_text("\n")
-    return normalize_text(text)
+    out = []
+    seen_articles = False
+    art_el, art_no, keep = None, None, False
+    para_el, pno = None, None
+    for event, el in context:
+        if not isinstance(el.tag, str):
+            continue
+        tag = el.tag.rpartition("}")[2]
+
+        if event == "start":
+            if tag != "div":
+                continue
+            el_id = el.get("id") or ""
+            if art_el is None:
+                m = ART_ID_PAT.match(el_id)
+                if m:
+                    seen_articles = True
+                    art_el, art_no = el, int(m.group(1))
+                    keep = art_no <= MAX_ARTICLE_NO and (allowed is None or art_no in allowed)
+            elif keep and para_el is None:
+                m = PARA_ID_PAT.match(el_id)
+                if m and int(m.group(1)) == art_no:
+                    para_el, pno = el, int(m.group(2))
+            continue
+
+        if el is para_el:
+            text = normalize_text("\n".join(t for t in el.itertext() if t.strip()))
+            if text and granularity == "point":
+                lines = text.split("\n")
+                intro, points = paragraph_points(lines, 0, len(lines), point_marks(lines))
+                out += tree_segments([(art_no, [(pno, text, intro, points)])], granularity)
+            elif text:
+                out.append([f"Art. {art_no}({pno})", text])
+            para_el = None
+        elif para_el is not None:
+            if tag == "a" and (el.get("href") or "").startswith("#ntr"):
+                el.clear(keep_tail=True)   # footnote marker "(37)", would read as a paragraph number
+            continue   # still collecting the paragraph's subtree
+        if el is art_el:
+            art_el, art_no, keep = None, None, False
+
+        # Bounded memory: drop finished subtrees (and already processed siblings).
+        el.clear(keep_tail=True)
+        parent = el.getparent()
+        if parent is not None:
+            while el.getprevious() is not None:
+                del parent[0]
+
+    return out if seen_articles else None
+
+
+def pdf_article_pages(pdf_path: Path, lang: str, allowed):
+    """
+    Cheap page -> article index from pdfium's text layer (no layout analysis).
+    Returns the sorted page numbers covering the allowed articles, or None if the
+    headings cannot be located reliably (caller then extracts every page).
+    """
+    pat = ARTICLE_PAT[lang]
+    heads = []   # (art_no, page_no), article numbers strictly increasing
+    doc = pypdfium2.PdfDocument(str(pdf_path))
+    try:
+        n_pages = len(doc)
+        last = 0
+        for i in range(n_pages):
+            page = doc[i]
+            textpage = page.get_textpage()
+            txt = textpage.get_text_range()
+            textpage.close()
+            page.close()
+            for m in pat.finditer(txt):
+                art = int(m.group(1))
+                # headings come in order; "Article 46" wrapped to a line start in running text does not
+                if last < art <= min(last + 3, MAX_ARTICLE_NO):
+                    heads.append((art, i))
+                    last = art
+    finally:
+        doc.close()
+
+    if not heads:
+        return None
+    spans = {}
+    for k, (art, first) in enumerate(heads):
+        spans[art] = (first, heads[k+1][1] if k+1 < len(heads) else n_pages - 1)
+    wanted = set(spans) if allowed is None else allowed
+    if any(a not in spans for a in wanted):
+        return None
+    return sorted({p for a in wanted for p in range(spans[a][0], spans[a][1] + 1)})
+
+
+def extract_pdf_pages(job):
+    # job = (pdf_path, page_nos); top-level for ProcessPoolExecutor
+    pdf_path, page_nos = job
+    out = []
+    with pdfplumber.open(str(pdf_path)) as p:
+        for i in page_nos:
+            page = p.pages[i]
+            out.append(page.extract_text() or "")
+            page.flush_cache()   # drop parsed layout objects, keeps RSS flat on large PDFs
+    return out
 
 
-def extract_pdf_text(pdf_path: Path) -> str:
-    parts = []
-    with pdfplumber.open(str(pdf_path)) as p:
-        for page in p.pages:
-            t = page.extract_text() or ""
-            if t.strip():
-                parts.append(t)
-    return normalize_text("\n".join(parts))
+def extract_pdf_text(pdf_path: Path, lang: str = None, allowed=None, sha: str = None, workers: int = 1) -> str:
+    """
+    With lang set, only the pages holding articles in `allowed` are extracted (see pdf_article_pages).
+    With sha set, page texts are cached by (pdf sha256, page number).
+    """
+    if lang is not None:
+        with metrics.span("pdf_index", path=str(pdf_path)) as sp:
+            page_nos = pdf_article_pages(pdf_path, lang, allowed)
+            sp["pages"] = len(page_nos) if page_nos is not None else None
+    else:
+        page_nos = None
+    if page_nos is None:
+        with pdfplumber.open(str(pdf_path)) as p:
+            page_nos = list(range(len(p.pages)))
+
+    texts = {}
+    if sha:
+        for i in page_nos:
+            t = cache_get(cache_key("pdf_page", EXTRACTOR_VERSION, sha, i))
+            if t is not None:
+                texts[i] = t
+    todo = [i for i in page_nos if i not in texts]
+
+    with metrics.span("pdf_extract", path=str(pdf_path), pages=len(todo), cached_pages=len(texts)):
+        if todo and workers > 1 and len(todo) > 1:
+            n = min(workers, len(todo))
+            chunks = [todo[k::n] for k in range(n)]
+            with ProcessPoolExecutor(max_workers=n) as ex:
+                for chunk, chunk_texts in zip(chunks, ex.map(extract_pdf_pages, [(pdf_path, c) for c in chunks])):
+                    texts.update(zip(chunk, chunk_texts))
+        elif todo:
+            texts.update(zip(todo, extract_pdf_pages((pdf_path, todo))))
+        if sha:
+            for i in todo:
+                cache_put(cache_key("pdf_page", EXTRACTOR_VERSION, sha, i), texts[i])
+
+    parts = [texts[i] for i in page_nos if texts[i].strip()]
+    with metrics.span("normalize"):
+        return normalize_text("\n".join(parts))
 
 def extract_source_text(path: Path) -> str:
     if path.suffix.lower() == ".pdf":
@@ -85,148 +251,363 @@ def extract_source_text(path: Path) -> str:
 
 
 
-def split_articles(text: str, lang: str):
-    pat = ARTICLE_PAT[lang]
-    matches = list(pat.finditer(text))
-
-    # fallback for EN if too few matches
-    if lang == "en" and len(matches) < 10:
-        matches = list(ARTICLE_PAT_FALLBACK_EN.finditer(text))
-
-    if not matches:
-        return []
-    out = []
-    for i, m in enumerate(matches):
-        start = m.start()
-        end = matches[i+1].start() if i+1 < len(matches) else len(text)
-        art_no = m.group(1)
-        art_block = text[start:end].strip()
-        out.append((art_no, art_block))
-    return out
-
-
-def split_by_blank_lines(body: str):
-    # Split on empty lines (most reliable separator when numbering is missing)
-    parts = [p.strip() for p in re.split(r"\n\s*\n+", body) if p.strip()]
-    # If PDF has no empty lines, fallback to “hard line breaks” that look like new paragraphs
-    if len(parts) <= 1:
-        parts = [p.strip() for p in re.split(r"\n(?=[A-ZÄÖÜ])", body) if p.strip()]
-    return parts
-
+# -------------------------
+# Text tokenizer (PDFs, HTML without EUR-Lex ids, --parser regex)
+# -------------------------
+#
+# One pass over the lines of the normalized text classifies every line once (article heading,
+# paragraph marker, point marker, blank, capitalized) and keeps only line indexes; the
+# article -> paragraph -> point tree and its texts are then cut from those line ranges.
+# Paragraph rules are the ones of the former regex splitter: title lines before the first
+# numbered paragraph are dropped, and an article with fewer than 2 (or EXPECTED_MIN_PARAS)
+# numbered paragraphs is split at blank lines, else before capitalized lines.
+# Points "(a)" / "a)" only count in sequence a, b, c, ..., so a roman "(i)" inside point (c)
+# stays part of it.
 
+ARTICLE_LINE = {
+    "en": re.compile(r"\s*article\s+(\d+)\b", re.I),
+    "de": re.compile(r"\s*artikel\s+(\d+)\b", re.I),
+}
+# group 3 is "" when the marker ends the line (then the text starts on the next one)
+PARA_LINE = re.compile(r"\s*(?:\(\s*(\d+)\s*\)|(\d+)\.)(\s|$)")
+POINT_LINE = re.compile(r"\s*\(?\s*([a-z])\s*\)(\s|$)")
+CAPITALS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÜ")
 
 EXPECTED_MIN_PARAS = {
     19: 2,  # we at least need (1) and (2)
     30: 3,  # we at least need (1)(2)(3)
 }
 
-def split_paragraphs(art_block: str, art_no: int):
-    lines = art_block.splitlines()
-    body = "\n".join(lines[1:]).strip() if len(lines) > 1 else ""
+def join_lines(lines, s: int, e: int) -> str:
+    return "\n".join(lines[s:e]).strip()
 
-    # Drop title lines until paragraph marker appears (common in EU regs)
-    body_lines = body.splitlines()
-    while body_lines and not re.match(r"^\s*(?:\(\s*\d+\s*\)|\d+\.)\s+", body_lines[0]):
-        body_lines = body_lines[1:]
-    body = "\n".join(body_lines).strip()
+def point_marks(lines):
+    """
+    [(line index, letter, marker ends the line)] of the candidate point markers in `lines`.
+    """
+    out = []
+    for i, line in enumerate(lines):
+        m = POINT_LINE.match(line)
+        if m:
+            out.append((i, m.group(1), not m.group(2)))
+    return out
 
-    paras = list(PARA_PAT.finditer(body))
+def paragraph_points(lines, s: int, e: int, marks):
+    """
+    (intro, [(letter, text)]) of the paragraph lines[s:e]; `marks` are its point_marks, in order.
+    """
+    starts, expected = [], "a"
+    for i, letter, eol in marks:
+        if letter == expected and not (eol and i == e - 1):
+            starts.append((i, letter))
+            expected = chr(ord(letter) + 1)
+    if not starts:
+        return join_lines(lines, s, e), []
+    bounds = [i for i, _ in starts[1:]] + [e]
+    return join_lines(lines, s, starts[0][0]), [(letter, join_lines(lines, i, b))
+                                                 for (i, letter), b in zip(starts, bounds)]
+
+def fallback_paragraphs(lines, start: int, end: int, blanks, capitals):
+    """
+    Unnumbered paragraphs as line ranges: runs between blank lines, or if there are none,
+    ranges starting at capitalized lines. Whitespace-only ranges are dropped.
+    """
+    cuts = [i for i in blanks if start < i < end]
+    if cuts:
+        ranges, s = [], start
+        for c in cuts + [end]:
+            ranges.append((s, c))
+            s = c + 1
+        ranges = [r for r in ranges if join_lines(lines, *r)]
+        if len(ranges) > 1:
+            return ranges
+    cuts = [i for i in capitals if start < i < end]
+    ranges = list(zip([start] + cuts, cuts + [end]))
+    return [r for r in ranges if join_lines(lines, *r)]
+
+def article_paragraphs(lines, art_no: int, start, end: int, paras, points, blanks, capitals):
+    """
+    [(pno, text, intro, [(letter, text)])] of one article body lines[start:end].
+    """
+    if start is None:
+        return []   # no numbered paragraph at all: nothing after the title lines
+    while end > start and (not lines[end - 1] or lines[end - 1].isspace()):
+        end -= 1
+    if paras and paras[-1][2] and paras[-1][0] == end - 1:
+        paras.pop()   # a bare "3." on the last line has no text to number
 
-    # normal path: numbering detected
     if len(paras) >= 2:
-        out = []
-        for i, m in enumerate(paras):
-            pno = m.group(1) or m.group(2)
-            start = m.start()
-            end = paras[i+1].start() if i+1 < len(paras) else len(body)
-            out.append((pno, body[start:end].strip()))
-        # If article is known to have more paragraphs but numbering is incomplete, fallback
+        starts = [i for i, _, _ in paras]
+        ranges = [(pno, s, e) for (s, pno, _), e in zip(paras, starts[1:] + [end])]
         exp = EXPECTED_MIN_PARAS.get(art_no)
-        if exp and len(out) < exp:
-            parts = split_by_blank_lines(body)
+        if exp and len(ranges) < exp:
+            parts = fallback_paragraphs(lines, start, end, blanks, capitals)
             if len(parts) >= exp:
-                return [(str(i+1), parts[i]) for i in range(len(parts))]
-        return out
-
-    # fallback path: numbering missing → split by blank lines / hard breaks
-    parts = split_by_blank_lines(body)
-    if len(parts) >= 2:
-        return [(str(i+1), parts[i]) for i in range(len(parts))]
-
-    return [("1", body)] if body else []
-
+                ranges = [(str(k + 1), s, e) for k, (s, e) in enumerate(parts)]
+    else:
+        parts = fallback_paragraphs(lines, start, end, blanks, capitals)
+        if len(parts) >= 2:
+            ranges = [(str(k + 1), s, e) for k, (s, e) in enumerate(parts)]
+        else:
+            ranges = [("1", start, end)] if join_lines(lines, start, end) else []
+
+    out, k = [], 0
+    for pno, s, e in ranges:
+        while k < len(points) and points[k][0] < s:
+            k += 1
+        j = k
+        while j < len(points) and points[j][0] < e:
+            j += 1
+        intro, pts = paragraph_points(lines, s, e, points[k:j])
+        out.append((pno, join_lines(lines, s, e), intro, pts))
+        k = j
+    return out
 
-def split_points(paragraph_text: str):
-    pts = list(POINT_PAT.finditer(paragraph_text))
-    if not pts:
-        return [(None, paragraph_text)]
+def tokenize(text: str, lang: str, allowed=None):
+    """
+    Article -> paragraph -> point tree of normalized text:
+    [(art_no, [(pno, text, intro, [(letter, text), ...]), ...]), ...] for the articles up to
+    MAX_ARTICLE_NO in `allowed` (None: all). intro is the paragraph text before its first point.
+    """
+    lines = text.split("\n")
+    art_pat = ARTICLE_LINE[lang]
+    arts = []   # [art_no, first body line, end line, paragraph marks, point marks, blank lines, capitalized lines]
+    cur = None
+    for i, line in enumerate(lines):
+        m = art_pat.match(line)
+        if m:
+            if cur is not None:
+                cur[2] = i
+            n = int(m.group(1))
+            cur = None
+            if n <= MAX_ARTICLE_NO and (allowed is None or n in allowed):
+                cur = [m.group(1), None, len(lines), [], [], [], []]
+                arts.append(cur)
+            continue
+        if cur is None:
+            continue
+        m = PARA_LINE.match(line)
+        if cur[1] is None:
+            # title lines until the first numbered paragraph (with text on its line)
+            if m and m.group(3):
+                cur[1] = i
+                cur[3].append((i, m.group(1) or m.group(2), False))
+            continue
+        if m:
+            cur[3].append((i, m.group(1) or m.group(2), not m.group(3)))
+        else:
+            m = POINT_LINE.match(line)
+            if m:
+                cur[4].append((i, m.group(1), not m.group(2)))
+        if not line or line.isspace():
+            cur[5].append(i)
+        elif line[0] in CAPITALS:
+            cur[6].append(i)
+
+    return [(art_no, article_paragraphs(lines, int(art_no), start, end, paras, points, blanks, capitals))
+            for art_no, start, end, paras, points, blanks, capitals in arts]
+
+def tree_segments(tree, granularity: str = "paragraph"):
+    """
+    [legal_ref, text] pairs of a tokenize() tree. granularity="point": a paragraph with points
+    yields its intro as Art. N(p) (if any) and every point as Art. N(p)(x).
+    """
     out = []
-    for i, m in enumerate(pts):
-        letter = m.group(1)
-        start = m.start()
-        end = pts[i+1].start() if i+1 < len(pts) else len(paragraph_text)
-        txt = paragraph_text[start:end].strip()
-        out.append((letter, txt))
+    for art_no, paras in tree:
+        for pno, text, intro, points in paras:
+            ref = f"Art. {art_no}({pno})"
+            if granularity == "point" and points:
+                if intro:
+                    out.append([ref, intro])
+                out += [[f"{ref}({letter})", ptxt] for letter, ptxt in points]
+            else:
+                out.append([ref, text])
+    return out
+
+def segment_text(instrument_code: str, lang: str, text: str, granularity: str = "paragraph"):
+    """
+    Split normalized text into [legal_ref, text] pairs for the articles we keep.
+    """
+    with metrics.span("tokenize", bytes=len(text)) as sp:
+        tree = tokenize(text, lang, INCLUDE_ARTICLES.get(instrument_code))
+        out = tree_segments(tree, granularity)
+        sp["articles"] = len(tree)
+        sp["records"] = len(out)
     return out
 
-def emit_segments(instrument_code: str, lang: str, text: str, source_sha256: str, out_path: Path):
-    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+def cache_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def cache_path(key: str) -> Path:
+    return CACHE_DIR / key[:2] / f"{key}.json"
+
+
+def cache_get(key: str):
+    p = cache_path(key)
+    try:
+        value = pipeline_io.loads(p.read_bytes())
+    except (FileNotFoundError, ValueError):
+        return None
+    os.utime(p)   # mtime = last use, drives LRU eviction
+    return value
+
+
+def cache_put(key: str, value):
+    p = cache_path(key)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(value, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, p)   # atomic: readers never see half-written entries
+
+
+def cache_evict(max_bytes: int):
+    """
+    Drop least recently used entries until the cache fits into max_bytes.
+    """
+    if not CACHE_DIR.exists():
+        return 0
+    entries = []
+    for p in CACHE_DIR.glob("*/*.json"):
+        st = p.stat()
+        entries.append((st.st_mtime_ns, st.st_size, p))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, p in sorted(entries):
+        if total <= max_bytes:
+            break
+        p.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def load_segments(instrument_code: str, lang: str, src_path: Path, sha: str, use_cache: bool = True,
+                  parser: str = "structural", pdf_workers: int = 1, granularity: str = "paragraph"):
+    """
+    Returns ([legal_ref, text] pairs, cache_hit). Normalized text and segments are cached separately,
+    so changing INCLUDE_ARTICLES re-splits but does not re-parse.
+    parser="structural" reads HTML article/paragraph ids directly; PDFs and HTML without
+    EUR-Lex subdivisions (and parser="regex") go through the text + regex splitter.
+    PDFs only extract the pages of the wanted articles, cached per page instead of per document.
+    """
+    size = src_path.stat().st_size
+    text_key = cache_key("text", EXTRACTOR_VERSION, sha, size)
+    allowed = INCLUDE_ARTICLES.get(instrument_code)
+    seg_key = cache_key("segments", EXTRACTOR_VERSION, parser, granularity, sha, size, lang,
+                        sorted(allowed) if allowed is not None else None, MAX_ARTICLE_NO)
+
+    if use_cache:
+        with metrics.span("cache_lookup") as sp:
+            segments = cache_get(seg_key)
+            sp["hit"] = segments is not None
+        if segments is not None:
+            return segments, True
+
+    segments = None
+    if parser == "structural" and src_path.suffix.lower() in (".html", ".htm"):
+        with metrics.span("parse", parser="structural", bytes=size) as sp:
+            segments = extract_html_segments(src_path, instrument_code, granularity)
+            sp["records"] = len(segments) if segments is not None else None
+
+    if segments is None and src_path.suffix.lower() == ".pdf":
+        text = extract_pdf_text(src_path, lang, allowed, sha if use_cache else None, pdf_workers)
+        segments = segment_text(instrument_code, lang, text, granularity)
+
+    if segments is None:
+        text = cache_get(text_key) if use_cache else None
+        if text is None:
+            text = extract_source_text(src_path)
+            if use_cache:
+                cache_put(text_key, text)
+        segments = segment_text(instrument_code, lang, text, granularity)
+    if use_cache:
+        cache_put(seg_key, segments)
+    return segments, False
+
+
+def extract_job(job):
+    # Top-level so ProcessPoolExecutor can pickle it: job = (instrument_code, lang, src_path, sha, options)
+    instrument_code, lang, src_path, sha, options = job
+    with metrics.span("document", doc=f"{instrument_code}/{lang}", path=str(src_path),
+                      bytes=src_path.stat().st_size) as sp:
+        segments, hit = load_segments(instrument_code, lang, src_path, sha, **options)
+        sp.update(records=len(segments), cache_hit=hit)
+    return segments, hit
+
+
+SEGMENT_KEY = jsonl_store.field_key("instrument_code", "legal_ref")
+
+def emit_segments(instrument_code: str, lang: str, segments, source_sha256: str, writer):
+    """
+    Writes one document's segments through `writer` (a jsonl_store.ShardedWriter that stays open for the run).
+    """
     n = 0
-    with out_path.open("a", encoding="utf-8") as f:
-        for art_no, art_block in split_articles(text, lang):
-            art_int = int(art_no)
-            if art_int > MAX_ARTICLE_NO:
-                continue
-            allowed = INCLUDE_ARTICLES.get(instrument_code)
-            if allowed is not None and art_int not in allowed:
-                continue
-            paras = split_paragraphs(art_block, int(art_no))
-            for pno, ptxt in paras:
-                legal_ref = f"Art. {art_no}({pno})"
-                rec = {
-                        "instrument_code": instrument_code,
-                        "lang": lang,
-                        "legal_ref": legal_ref,
-                        "text": ptxt.strip(),   # enthält ggf. (a)(b)(c) inline
-                        "source_sha256": source_sha256,
-                }
-                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-                n += 1
+    for legal_ref, ptxt in segments:
+        writer.write(pipeline_io.Segment(instrument_code, lang, legal_ref, ptxt, source_sha256))
+        n += 1
     return n
 
-def get_sha(manifest: pd.DataFrame, instrument_code: str, lang: str) -> str:
-    mask = (manifest["instrument_code"] == instrument_code) & (manifest["lang"] == lang)
-    series = manifest.loc[mask, "sha256"]   # -> Series
-    if series.empty:
-        raise KeyError(f"No sha256 found for ({instrument_code}, {lang}). Check sources_manifest__v0_1.csv")
-    if len(series) > 1:
-        # optional: warn, but take first
-        #  print(f"Warning: multiple sha256 rows for ({instrument_code}, {lang}). Taking first.")
-        pass
-    return str(series.iloc[0])
-
 def main():
+    ap = argparse.ArgumentParser(description="Extract article/paragraph segments from the primary sources.")
+    ap.add_argument("--no-cache", action="store_true", help="ignore and do not update the extraction cache")
+    ap.add_argument("--clear-cache", action="store_true", help=f"delete {CACHE_DIR} before extracting")
+    ap.add_argument("--cache-max-mb", type=int, default=CACHE_MAX_MB, help="evict LRU cache entries above this size")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="extract (instrument, lang) pairs in N processes; output order is unchanged")
+    ap.add_argument("--parser", choices=["structural", "regex"], default="structural",
+                    help="structural: EUR-Lex article/paragraph ids via lxml iterparse; regex: flattened text + line tokenizer")
+    ap.add_argument("--granularity", choices=["paragraph", "point"], default="paragraph",
+                    help="point: one segment per point, legal_ref Art. 30(2)(a), plus the paragraph's intro as Art. 30(2)")
+    ap.add_argument("--pdf-workers", type=int, default=1, help="extract the pages of a PDF source in N processes")
+    args = ap.parse_args()
+
+    if args.clear_cache:
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    use_cache = not args.no_cache
+    options = {"use_cache": use_cache, "parser": args.parser, "pdf_workers": args.pdf_workers,
+               "granularity": args.granularity}
+
     cfg = yaml.safe_load(Path("requirements/config/instruments.yml").read_text(encoding="utf-8"))
     manifest_by_path = load_manifest_by_path("requirements/library/sources_manifest__v0_1.csv")
 
     out_en = Path("requirements/extracted/segments__EN.jsonl")
     out_de = Path("requirements/extracted/segments__DE.jsonl")
-    # clear outputs
-    out_en.write_text("", encoding="utf-8")
-    out_de.write_text("", encoding="utf-8")
 
+    jobs = []
     for inst in cfg["instruments"]:
         for v in inst["versions"]:
-            lang = v["lang"]
-            pdf_path = Path(v["path"])
             src_path = Path(v["path"])
             sha = manifest_by_path.get(str(src_path))
             if not sha:
                 raise KeyError(f"No sha256 for primary file_path={src_path} in sources_manifest__v0_1.csv")
-            text = extract_source_text(pdf_path)
-            out_path = out_en if lang == "en" else out_de
-            count = emit_segments(inst["code"], lang, text, sha, out_path)
-            print(f"{inst['code']} {lang}: {count} segments")
+            jobs.append((inst["code"], v["lang"], src_path, sha, options))
+
+    # Workers only parse and split; all writes happen here in config order,
+    # so the output is byte-identical to a sequential run.
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(jobs))) as ex:
+            results = list(ex.map(extract_job, jobs))
+    else:
+        results = map(extract_job, jobs)
+
+    # both outputs (and their shards / index, see jsonl_store.py) stay open for the whole run
+    key_name = "instrument_code|legal_ref"
+    with jsonl_store.ShardedWriter(out_en, SEGMENT_KEY, key_name=key_name) as w_en, \
+            jsonl_store.ShardedWriter(out_de, SEGMENT_KEY, key_name=key_name) as w_de:
+        for (code, lang, _, sha, _), (segments, hit) in zip(jobs, results):
+            writer = w_en if lang == "en" else w_de
+            with metrics.span("write", doc=f"{code}/{lang}", path=str(writer.path)) as sp:
+                count = emit_segments(code, lang, segments, sha, writer)
+                sp["records"] = count
+            print(f"{code} {lang}: {count} segments" + (" (cached)" if hit else ""))
+
+    if use_cache:
+        evicted = cache_evict(args.cache_max_mb * 1024 * 1024)
+        if evicted:
+            print(f"Evicted {evicted} cache entries from {CACHE_DIR}")
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("02"):
+        main()
@@ -1,15 +1,15 @@
-import json, re
+import json, re, heapq, math, tempfile, contextlib, argparse
 from pathlib import Path
 from collections import defaultdict
+from itertools import groupby
+import metrics
+import jsonl_store
+import pipeline_io
+from pipeline_io import Segment, BilingualRow
 
-WS_RE = re.compile(r"\s+")
+np = pipeline_io.lazy_import("numpy")   # only the content fallback (articles with unmatched keys) needs it
 
-def iter_jsonl(p: Path):
-    with p.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                yield json.loads(line)
+WS_RE = re.compile(r"\s+")
 
 def norm_legal_ref(s: str) -> str:
     """
@@ -42,77 +42,319 @@ def pick_best(rs):
         return None
     return max(rs, key=lambda r: (len(r.get("text", "")), r.get("source_sha256", "")))
 
-def main():
-    # join_mode:
-    # - "left": EN is canonical (recommended for requirements library)
-    # - "inner": only bilingual keys (useful for pure alignment datasets)
-    join_mode = "left"   # <-- set to "inner" if you really want only bilingual rows
+# -------------------------
+# Content-based fallback for keys present on one side only
+# -------------------------
+#
+# When EN and DE paragraphs of one article are numbered differently (e.g. the blank-line
+# fallback of split_paragraphs), their keys never meet. Within each (instrument, article),
+# the leftover EN and DE keys are scored on language-independent anchors and assigned
+# optimally (Hungarian algorithm); pairs below MIN_CONFIDENCE stay unmatched.
 
-    en_idx = index_segments(iter_jsonl(Path("requirements/extracted/segments__EN.jsonl")))
-    de_idx = index_segments(iter_jsonl(Path("requirements/extracted/segments__DE.jsonl")))
+ARTICLE_PAT = re.compile(r"^(Art\.\s*\d+)")
+LEAD_NO_PAT = re.compile(r"^\s*(?:\(\s*\d+\s*\)|\d+\.)\s+")
+NUMBER_PAT = re.compile(r"\d+(?:[.,/]\d+)*")
+THOUSANDS_PAT = re.compile(r"\d{1,3}(?:[.,]\d{3})+")
+XREF_PAT = re.compile(r"\b(?:Articles?|Artikel[ns]?|Art\.)\s*(\d+)", re.IGNORECASE)
+POINT_PAT = re.compile(r"(?:^|[\s(])([a-z])\)", re.MULTILINE)
+MONTHS = {m: i for i, m in enumerate(
+    "january february march april may june july august september october november december".split(), 1)}
+MONTHS.update({m: i for i, m in enumerate(
+    "januar februar märz april mai juni juli august september oktober november dezember".split(), 1)})
+MONTH_PAT = re.compile(r"\b(" + "|".join(MONTHS) + r")\b", re.IGNORECASE)
 
-    en_keys = set(en_idx.keys())
-    de_keys = set(de_idx.keys())
+DE_EN_LENGTH_RATIO = 1.15     # German paragraphs run ~15% longer than English ones
+W_ANCHORS, W_LENGTH, W_POSITION = 0.6, 0.25, 0.15
+NO_ANCHORS = 0.5              # neutral anchor score when neither text has any
+MIN_CONFIDENCE = 0.6
 
-    if join_mode == "inner":
-        keys = sorted(en_keys & de_keys)
-    else:
-        keys = sorted(en_keys)  # LEFT JOIN from EN
+def article_key(k):
+    m = ARTICLE_PAT.match(k[1])
+    return (k[0], m.group(1) if m else k[1])
 
-    # Diagnostics
-    dup_en = sorted([k for k, rs in en_idx.items() if len(rs) > 1])
-    dup_de = sorted([k for k, rs in de_idx.items() if len(rs) > 1])
+REF_PART = re.compile(r"\d+|[a-z]")
+
+def ref_order(k):
+    """
+    Numeric order of a key's legal_ref ("Art. 5(2)" before "Art. 5(10)"), for the position signal.
+    """
+    return tuple((0, int(p), "") if p.isdigit() else (1, 0, p) for p in REF_PART.findall(k[1]))
+
+def anchors(text: str):
+    """
+    Counter of language-independent tokens: numbers, months, article cross-references, point letters.
+    """
+    text = LEAD_NO_PAT.sub("", text or "", count=1)
+    out = defaultdict(int)
+    for n in NUMBER_PAT.findall(text):
+        n = re.sub(r"[.,]", "", n) if THOUSANDS_PAT.fullmatch(n) else n.replace(",", ".")
+        out["n" + n] += 1
+    for m in MONTH_PAT.findall(text):
+        out[f"m{MONTHS[m.lower()]}"] += 1
+    for a in XREF_PAT.findall(text):
+        out["a" + a] += 1
+    for p in POINT_PAT.findall(text):
+        out["p" + p] += 1
+    return out
+
+def pair_scores(en_texts, de_texts):
+    """
+    len(en) x len(de) confidence matrix in [0, 1]: weighted Jaccard of the anchor counts,
+    agreement of the length ratio with DE_EN_LENGTH_RATIO, and relative position in the article.
+    """
+    if not en_texts or not de_texts:
+        return np.zeros((len(en_texts), len(de_texts)))
+    from scipy.spatial.distance import cdist   # scipy costs ~0.5s to import; most runs never get here
+    en_a, de_a = [anchors(t) for t in en_texts], [anchors(t) for t in de_texts]
+    vocab = {tok: j for j, tok in enumerate(sorted({t for a in en_a + de_a for t in a}))}
 
-    only_en = sorted(en_keys - de_keys)
-    only_de = sorted(de_keys - en_keys)
+    def counts(rows):
+        m = np.zeros((len(rows), len(vocab)), dtype=np.float32)
+        for i, a in enumerate(rows):
+            for tok, c in a.items():
+                m[i, vocab[tok]] = c
+        return m
+
+    # sum(min) and sum(max) from the row sums and the L1 distance, without an E x D x vocab array
+    E, D = counts(en_a), counts(de_a)
+    total = E.sum(axis=1)[:, None] + D.sum(axis=1)[None, :]
+    l1 = cdist(E, D, "cityblock") if len(vocab) else np.zeros_like(total)
+    union, inter = (total + l1) / 2, (total - l1) / 2
+    anchor = np.where(union > 0, inter / np.maximum(union, 1), NO_ANCHORS)
+
+    len_en = np.array([max(len(t), 1) for t in en_texts], dtype=np.float64)[:, None]
+    len_de = np.array([max(len(t), 1) for t in de_texts], dtype=np.float64)[None, :]
+    length = np.exp(-np.abs(np.log(len_de / len_en) - math.log(DE_EN_LENGTH_RATIO)))
+
+    pos_en = (np.arange(len(en_texts)) + 0.5)[:, None] / len(en_texts)
+    pos_de = (np.arange(len(de_texts)) + 0.5)[None, :] / len(de_texts)
+    position = 1 - np.abs(pos_en - pos_de)
+
+    return W_ANCHORS * anchor + W_LENGTH * length + W_POSITION * position
+
+def content_pairs(only_en, only_de):
+    """
+    only_en / only_de: [(key, best record)] of one article.
+    Returns {en key: (de key, de record, confidence)} for the optimal assignment above MIN_CONFIDENCE.
+    """
+    if not only_en or not only_de:
+        return {}
+    only_en = sorted(only_en, key=lambda kr: ref_order(kr[0]))
+    only_de = sorted(only_de, key=lambda kr: ref_order(kr[0]))
+    from scipy.optimize import linear_sum_assignment
+    scores = pair_scores([r["text"] for _, r in only_en], [r["text"] for _, r in only_de])
+    rows, cols = linear_sum_assignment(scores, maximize=True)
+    out = {}
+    for i, j in zip(rows, cols):
+        if scores[i, j] >= MIN_CONFIDENCE:
+            out[only_en[i][0]] = (only_de[j][0], only_de[j][1], round(float(scores[i, j]), 4))
+    return out
+
+def sort_key(r):
+    return (r["instrument_code"], norm_legal_ref(r["legal_ref"]))
+
+def indexed_groups(en_path: Path, de_path: Path):
+    """
+    In-memory mode: (key, en records, de records) for every key of either side, in key order.
+    """
+    with metrics.span("read_index", doc="en") as sp:
+        en_idx = index_segments(pipeline_io.iter_jsonl(en_path, Segment))
+        sp["records"] = sum(len(rs) for rs in en_idx.values())
+    with metrics.span("read_index", doc="de") as sp:
+        de_idx = index_segments(pipeline_io.iter_jsonl(de_path, Segment))
+        sp["records"] = sum(len(rs) for rs in de_idx.values())
+    for k in sorted(en_idx.keys() | de_idx.keys()):
+        yield k, en_idx.get(k, []), de_idx.get(k, [])
+
+def sorted_runs(records, tmp_dir: Path, chunk_records: int, name: str):
+    """
+    External sort, phase 1: sorted runs of at most chunk_records records, spilled to tmp_dir
+    as JSON lines [instrument_code, norm_ref, seq, record]. seq (input position) keeps
+    duplicates in file order, so pick_best breaks ties exactly like the in-memory mode.
+    Returns the run files, or the single in-memory run if everything fit in one chunk.
+    """
+    runs, chunk = [], []
 
+    def spill():
+        chunk.sort(key=lambda e: (e[0], e[1], e[2]))
+        path = tmp_dir / f"{name}_{len(runs):05d}.jsonl"
+        with pipeline_io.JsonlWriter(path, compact=True) as f:
+            for e in chunk:
+                f.write(e)
+        runs.append(path)
+        chunk.clear()
+
+    for seq, r in enumerate(records):
+        k = sort_key(r)
+        chunk.append([k[0], k[1], seq, r])
+        if len(chunk) >= chunk_records:
+            spill()
+    if not runs:
+        chunk.sort(key=lambda e: (e[0], e[1], e[2]))
+        return [chunk]
+    if chunk:
+        spill()
+    return runs
+
+def merged_groups(runs):
+    """
+    External sort, phase 2: k-way merge of the runs, grouped by key -> (key, [records]).
+    """
+    iters = [iter(run) if isinstance(run, list) else pipeline_io.iter_jsonl(run) for run in runs]
+    merged = heapq.merge(*iters, key=lambda e: (e[0], e[1], e[2]))
+    for k, group in groupby(merged, key=lambda e: (e[0], e[1])):
+        yield k, [e[3] for e in group]
+
+def streamed_groups(en_path: Path, de_path: Path, tmp_dir: Path, chunk_records: int):
+    """
+    Streaming mode: merge join of both sorted sides; only one key group per side is in memory
+    (plus one buffered record per run during the merge).
+    """
+    with metrics.span("sort_runs", doc="en") as sp:
+        en_runs = sorted_runs(pipeline_io.iter_jsonl(en_path, Segment), tmp_dir, chunk_records, "en")
+        sp["records"] = len(en_runs)
+    with metrics.span("sort_runs", doc="de") as sp:
+        de_runs = sorted_runs(pipeline_io.iter_jsonl(de_path, Segment), tmp_dir, chunk_records, "de")
+        sp["records"] = len(de_runs)
+
+    en, de = merged_groups(en_runs), merged_groups(de_runs)
+    a, b = next(en, None), next(de, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[0] < b[0]):
+            yield a[0], a[1], []
+            a = next(en, None)
+        elif a is None or b[0] < a[0]:
+            yield b[0], [], b[1]
+            b = next(de, None)
+        else:
+            yield a[0], a[1], b[1]
+            a, b = next(en, None), next(de, None)
+
+def align(groups, join_mode: str, out: Path, n_examples: int = 20, fallback: bool = True):
+    """
+    Writes the joined rows for `groups` (key order), with their shards and index, and returns the alignment report.
+    Counters and examples are accumulated as groups stream past; groups are buffered one
+    article at a time so the content-based fallback can pair that article's leftover keys.
+    """
+    counts = {"en_keys": 0, "de_keys": 0, "output_rows": 0, "rows_with_de": 0,
+              "only_en": 0, "only_de": 0, "duplicates_en": 0, "duplicates_de": 0, "content_aligned": 0}
+    examples = {"only_en": [], "only_de": [], "duplicates_en": [], "duplicates_de": [], "content_aligned": []}
+
+    def count(name, k):
+        counts[name] += 1
+        if len(examples[name]) < n_examples:
+            examples[name].append(list(k))
+
+    with jsonl_store.ShardedWriter(out, jsonl_store.field_key("instrument_code", "legal_ref"),
+                                   key_name="instrument_code|legal_ref") as f:
+        for _, article in groupby(groups, key=lambda g: article_key(g[0])):
+            article = list(article)
+            only_en, only_de = [], []
+            for k, en_rs, de_rs in article:
+                counts["en_keys"] += bool(en_rs)
+                counts["de_keys"] += bool(de_rs)
+                if len(en_rs) > 1:
+                    count("duplicates_en", k)
+                if len(de_rs) > 1:
+                    count("duplicates_de", k)
+                if en_rs and not de_rs:
+                    count("only_en", k)
+                    if fallback and pick_best(en_rs) is not None:
+                        only_en.append((k, pick_best(en_rs)))
+                if de_rs and not en_rs:
+                    count("only_de", k)
+                    if fallback and pick_best(de_rs) is not None:
+                        only_de.append((k, pick_best(de_rs)))
+            paired = content_pairs(only_en, only_de)
+
+            for k, en_rs, de_rs in article:
+                pair = paired.get(k)
+                # "left": every EN key; "inner": keys on both sides (or paired by content)
+                if not en_rs or (join_mode == "inner" and not de_rs and pair is None):
+                    continue
+                counts["output_rows"] += 1
+
+                r_en = pick_best(en_rs)
+                r_de = pick_best(de_rs) if pair is None else pair[1]
+
+                if r_en is None:
+                    # EN key whose records are all empty; counted as an output row, like before.
+                    continue
+
+                if r_de is not None:
+                    counts["rows_with_de"] += 1
+
+                rec = BilingualRow(
+                    instrument_code=k[0],
+                    legal_ref=k[1],
+                    text_en=r_en["text"],
+                    text_de=(r_de["text"] if r_de else ""),
+                    source_sha256_en=r_en.get("source_sha256", ""),
+                    source_sha256_de=(r_de.get("source_sha256", "") if r_de else ""),
+                    has_de=bool(r_de),
+                )
+                if pair is not None:
+                    counts["content_aligned"] += 1
+                    if len(examples["content_aligned"]) < n_examples:
+                        examples["content_aligned"].append([k[0], k[1], pair[0][1], pair[2]])
+                    rec.legal_ref_de, rec.align_method, rec.align_confidence = pair[0][1], "content", pair[2]
+                f.write(rec)
+
+    return {
+        "join_mode": join_mode,
+        "en_keys": counts["en_keys"],
+        "de_keys": counts["de_keys"],
+        "output_rows": counts["output_rows"],
+        "rows_with_de": counts["rows_with_de"],
+        "rows_missing_de": counts["output_rows"] - counts["rows_with_de"],
+        "only_en": counts["only_en"],
+        "only_de": counts["only_de"],
+        "duplicates_en": counts["duplicates_en"],
+        "duplicates_de": counts["duplicates_de"],
+        "content_aligned": counts["content_aligned"],
+        "only_en_examples": examples["only_en"],
+        "only_de_examples": examples["only_de"],
+        "duplicates_en_examples": examples["duplicates_en"],
+        "duplicates_de_examples": examples["duplicates_de"],
+        "content_aligned_examples": examples["content_aligned"],
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Join EN and DE segments on (instrument_code, legal_ref).")
+    # join_mode:
+    # - "left": EN is canonical (recommended for requirements library)
+    # - "inner": only bilingual keys (useful for pure alignment datasets)
+    ap.add_argument("--join-mode", choices=["left", "inner"], default="left")
+    ap.add_argument("--stream", action="store_true",
+                    help="external sort + merge join with bounded memory (for corpora that do not fit in RAM)")
+    ap.add_argument("--chunk-records", type=int, default=200_000, help="--stream: records per sorted run")
+    ap.add_argument("--tmp-dir", type=Path, help="--stream: directory for sorted runs (default: system temp)")
+    ap.add_argument("--no-fallback", action="store_true",
+                    help="do not pair one-sided keys of an article by content (anchors, length, position)")
+    args = ap.parse_args()
+    join_mode = args.join_mode
+
+    en_path = Path("requirements/extracted/segments__EN.jsonl")
+    de_path = Path("requirements/extracted/segments__DE.jsonl")
     out = Path("requirements/extracted/bilingual_segments.jsonl")
     out.parent.mkdir(parents=True, exist_ok=True)
 
-    n_has_de = 0
-    with out.open("w", encoding="utf-8") as f:
-        for k in keys:
-            r_en = pick_best(en_idx.get(k, []))
-            r_de = pick_best(de_idx.get(k, []))
-
-            if r_en is None:
-                # Should never happen in left join; keep as hard guard.
-                continue
-
-            if r_de is not None:
-                n_has_de += 1
-
-            rec = {
-                "instrument_code": k[0],
-                "legal_ref": k[1],
-                "text_en": r_en["text"],
-                "text_de": (r_de["text"] if r_de else ""),
-                "source_sha256_en": r_en.get("source_sha256", ""),
-                "source_sha256_de": (r_de.get("source_sha256", "") if r_de else ""),
-                "has_de": bool(r_de),
-            }
-            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    with contextlib.ExitStack() as stack:
+        if args.stream:
+            tmp_dir = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="align_", dir=args.tmp_dir)))
+            groups = streamed_groups(en_path, de_path, tmp_dir, args.chunk_records)
+        else:
+            groups = indexed_groups(en_path, de_path)
+        with metrics.span("join_write", path=str(out)) as sp:
+            report_data = align(groups, join_mode, out, fallback=not args.no_fallback)
+            sp["records"] = report_data["output_rows"]
 
     report = Path("requirements/extracted/bilingual_alignment_report.json")
-    report.write_text(json.dumps({
-        "join_mode": join_mode,
-        "en_keys": len(en_keys),
-        "de_keys": len(de_keys),
-        "output_rows": len(keys),
-        "rows_with_de": n_has_de,
-        "rows_missing_de": (len(keys) - n_has_de),
-        "only_en": len(only_en),
-        "only_de": len(only_de),
-        "duplicates_en": len(dup_en),
-        "duplicates_de": len(dup_de),
-        "only_en_examples": only_en[:20],
-        "only_de_examples": only_de[:20],
-        "duplicates_en_examples": dup_en[:20],
-        "duplicates_de_examples": dup_de[:20],
-    }, ensure_ascii=False, indent=2), encoding="utf-8")
-
-    print(f"Wrote {out} with {len(keys)} rows (join_mode={join_mode})")
+    pipeline_io.write_text(report, json.dumps(report_data, ensure_ascii=False, indent=2))
+
+    print(f"Wrote {out} with {report_data['output_rows']} rows (join_mode={join_mode}{', streamed' if args.stream else ''})")
     print(f"Wrote alignment report: {report}")
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("03"):
+        main()
@@ -0,0 +1,42 @@
+import json, hashlib, argparse
+from pathlib import Path
+import metrics
+import dedup
+import pipeline_io
+
+VERSION = "v0_1"
+
+def main():
+    ap = argparse.ArgumentParser(description="Cluster near-duplicate requirements (MinHash + LSH).")
+    ap.add_argument("--threshold", type=float, default=dedup.THRESHOLD, help="min estimated Jaccard similarity")
+    ap.add_argument("--inp", type=Path, default=Path(f"requirements/library/requirements__{VERSION}.jsonl"))
+    ap.add_argument("--out", type=Path, default=dedup.CLUSTERS)
+    args = ap.parse_args()
+
+    with metrics.span("read", path=str(args.inp)) as sp:
+        sha = hashlib.sha256()
+        reqs = pipeline_io.load_jsonl(args.inp, pipeline_io.Requirement, sha=sha)
+        sp["records"] = len(reqs)
+
+    clusters = dedup.cluster(reqs, args.threshold)
+    report = {
+        "version": VERSION,
+        "source_sha256": sha.hexdigest(),
+        "params": {"shingle": dedup.SHINGLE, "num_perm": dedup.NUM_PERM, "bands": dedup.BANDS,
+                   "rows": dedup.ROWS, "threshold": args.threshold, "seed": dedup.SEED},
+        "requirements_count": len(reqs),
+        "clusters_count": len(clusters),
+        "duplicates_count": sum(len(c["members"]) for c in clusters),
+        "clusters": clusters,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    with metrics.span("write", path=str(args.out), records=len(clusters)):
+        if not args.out.exists() or args.out.read_text(encoding="utf-8") != text:
+            args.out.parent.mkdir(parents=True, exist_ok=True)
+            pipeline_io.write_text(args.out, text)
+    print(f"Wrote {args.out}: {report['clusters_count']} clusters, "
+          f"{report['duplicates_count']} of {len(reqs)} requirements are near-duplicates")
+
+if __name__ == "__main__":
+    with metrics.stage("05"):
+        main()
@@ -1,39 +1,315 @@
-import yaml, json
+import yaml, hashlib, argparse
 from pathlib import Path
+import numpy as np
+from scipy import sparse
+import metrics
+import jsonl_store
+import pipeline_io
+import search_index
+import library_db
+import dedup
+import library_diff
 
-def load_req(req_jsonl: Path):
-    reqs = []
-    for line in req_jsonl.read_text(encoding="utf-8").splitlines():
-        if line.strip():
-            reqs.append(json.loads(line))
-    return reqs
+# Ranked mapping: score = W_TEXT * tfidf cosine (mean of EN and DE) + W_TAG * workflow tag match
+#                        + W_EVIDENCE * share of the question's required evidence types the requirement covers
+W_TEXT, W_TAG, W_EVIDENCE = 0.6, 0.25, 0.15
+SUPPORTING_WEIGHT = 0.5   # supporting evidence types count half
+TOP_K = 25
+CHUNK = 256               # questions scored per dense block (CHUNK x len(reqs) floats)
 
-def main():
-    aq = yaml.safe_load(Path("requirements/config/audit_questions_de_en.yml").read_text(encoding="utf-8"))["audit_questions"]
-    reqs = load_req(Path("requirements/library/requirements__v0_1.jsonl"))
+WORKFLOW_TAGS = {"ROI": ("RoI", "TPRM"), "TPRM": ("RoI", "TPRM")}
+DEFAULT_TAGS = ("INCIDENT",)
 
-    out = Path("requirements/library/audit_question_map__v0_1.jsonl")
-    out.parent.mkdir(parents=True, exist_ok=True)
+def term_counts(texts, analyzer, vocab, grow):
+    """
+    len(texts) x len(vocab) CSR of term frequencies. With grow=False, terms missing from `vocab` are dropped.
+    """
+    indptr, indices, data = [0], [], []
+    for text in texts:
+        counts = {}
+        for t in analyzer(text):
+            j = vocab.get(t)
+            if j is None:
+                if not grow:
+                    continue
+                j = vocab[t] = len(vocab)
+            counts[j] = counts.get(j, 0) + 1
+        indices += counts.keys()
+        data += counts.values()
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32),
+                              np.asarray(indptr)), shape=(len(texts), len(vocab)))
+
+def tfidf(tf, idf):
+    """
+    Sublinear tf-idf with l2-normalized rows.
+    """
+    m = tf.tocsr(copy=True)
+    m.data = (1 + np.log(m.data)) * idf[m.indices]
+    norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ m
+
+def text_matrices(aq, reqs, index=None, rows=None, cols=None):
+    """
+    Per language: (question tf-idf CSR, requirement tf-idf transposed to CSC). Vocabulary and idf are
+    fitted on the requirements. When `index` (a search_index.SearchIndex over the same library) is
+    given, requirement term counts come from its postings and only the questions are tokenized;
+    `rows` are then the library positions of `reqs` if they are a subset of the library.
+    With `cols` (positions in `reqs`) only those requirements are returned, idf still fitted on all.
+    """
+    if index is not None:
+        de_vocab = index.header["fields"]["de"]["terms"].keys()
+    else:
+        de_vocab = search_index.german_vocab(r["text_de"] for r in reqs)
+    analyzers = {"en": search_index.Analyzer("en"),
+                 "de": search_index.Analyzer("de", search_index.CompoundSplitter(de_vocab))}
+    out = []
+    for lang in ("en", "de"):
+        if index is not None:
+            terms, r_tf = index.term_counts(lang)
+            if rows is not None:
+                r_tf = r_tf.tocsr()[rows]
+            vocab = {t: j for j, t in enumerate(terms)}
+        else:
+            vocab = {}
+            r_tf = term_counts([r[f"text_{lang}"] for r in reqs], analyzers[lang], vocab, grow=True)
+        q_tf = term_counts([q[f"text_{lang}"] for q in aq], analyzers[lang], vocab, grow=False)
+        df = np.diff(r_tf.tocsc().indptr)
+        idf = (np.log((1 + len(reqs)) / (1 + df)) + 1).astype(np.float32)
+        r_m = tfidf(r_tf, idf)
+        out.append((tfidf(q_tf, idf), (r_m if cols is None else r_m.tocsr()[cols]).T.tocsc()))
+    return out
+
+def indicator(items_per_row, values, weights=None):
+    """
+    rows x len(values) CSR, 1 (or weights[k]) where the row's k-th item list contains the value.
+    """
+    col = {v: j for j, v in enumerate(values)}
+    indptr, indices, data = [0], [], []
+    for items in items_per_row:
+        seen = {}
+        for k, group in enumerate(items):
+            w = 1.0 if weights is None else weights[k]
+            for v in group:
+                j = col.get(v)
+                if j is not None and seen.get(j, 0) < w:
+                    seen[j] = w
+        indices += seen.keys()
+        data += seen.values()
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32),
+                              np.asarray(indptr)), shape=(len(items_per_row), len(values)))
+
+def score_blocks(aq, reqs, index=None, rows=None, cols=None):
+    """
+    Yields (question offset, dense score block) for CHUNK questions at a time; block columns are
+    `reqs`, or reqs[cols] when given.
+    """
+    text = text_matrices(aq, reqs, index, rows, cols)
+    if cols is not None:
+        reqs = [reqs[j] for j in cols]
 
-    with out.open("w", encoding="utf-8") as f:
-        for q in aq:
-            wf = q["workflow"]
-            # very simple mapping:
-            if wf in ("ROI","TPRM"):
-                related = [r["req_id"] for r in reqs if ("RoI" in r["topic_tags"] or "TPRM" in r["topic_tags"])]
-            else:
-                related = [r["req_id"] for r in reqs if "INCIDENT" in r["topic_tags"]]
-            rec = {
+    tags = sorted({t for ts in WORKFLOW_TAGS.values() for t in ts} | set(DEFAULT_TAGS))
+    q_tag = indicator([[WORKFLOW_TAGS.get(q["workflow"], DEFAULT_TAGS)] for q in aq], tags)
+    r_tag = indicator([[r["topic_tags"]] for r in reqs], tags).T.tocsc()
+
+    ev_types = sorted({t for q in aq for t in q["required_evidence_types"]})
+    q_ev = indicator([[q["required_evidence_types"]] for q in aq], ev_types)
+    q_ev = sparse.diags(1 / np.maximum(np.asarray(q_ev.sum(axis=1)).ravel(), 1)) @ q_ev
+    r_ev = indicator([[r["primary_evidence_types"], r["supporting_evidence_types"]] for r in reqs], ev_types,
+                     weights=(1.0, SUPPORTING_WEIGHT)).T.tocsc()
+
+    for lo in range(0, len(aq), CHUNK):
+        hi = min(lo + CHUNK, len(aq))
+        s = sum((q_m[lo:hi] @ r_t).toarray() for q_m, r_t in text) * (W_TEXT / len(text))
+        s += W_TAG * np.minimum((q_tag[lo:hi] @ r_tag).toarray(), 1)
+        s += W_EVIDENCE * (q_ev[lo:hi] @ r_ev).toarray()
+        yield lo, s
+
+def load_index(req_sha: str):
+    """
+    The search index 04 built from the library file with this sha256, or None (missing / stale).
+    """
+    try:
+        index = search_index.SearchIndex(search_index.INDEX)
+    except (FileNotFoundError, ValueError):
+        return None
+    if index.header.get("source_sha256") != req_sha:
+        return None
+    return index
+
+def scored_requirements(reqs, duplicates):
+    """
+    (requirements to score, their library positions or None for all): the near-duplicates
+    from `duplicates` (canonical req_id -> duplicate req_ids, see dedup.py) are left out.
+    """
+    if not duplicates:
+        return reqs, None
+    skip = {d for ds in duplicates.values() for d in ds}
+    rows = [i for i, r in enumerate(reqs) if r["req_id"] not in skip]
+    return [reqs[i] for i in rows], rows
+
+def map_questions(aq, reqs, top_k=TOP_K, index=None, duplicates=None):
+    """
+    Top-k requirements per question by combined score (ties: library order), with scores.
+    With `duplicates` only the canonical and unclustered requirements are scored; the
+    duplicates of a hit are listed under related_duplicates.
+    """
+    duplicates = duplicates or {}
+    reqs, rows = scored_requirements(reqs, duplicates)
+    out = []
+    blocks = score_blocks(aq, reqs, index, rows) if reqs else ((0, np.zeros((len(aq), 0), dtype=np.float32)),)
+    for lo, s in blocks:
+        k = min(top_k, s.shape[1])
+        top = np.argpartition(-s, k - 1, axis=1)[:, :k] if 0 < k < s.shape[1] else np.tile(np.arange(k), (len(s), 1))
+        for i, cand in enumerate(top):
+            q = aq[lo + i]
+            row = s[i]
+            order = cand[np.lexsort((cand, -row[cand]))]
+            order = order[row[order] > 0]
+            out.append({
                 "question_id": q["id"],
-                "workflow": wf,
+                "workflow": q["workflow"],
                 "text_de": q["text_de"],
                 "text_en": q["text_en"],
                 "required_evidence_types": q["required_evidence_types"],
-                "related_req_ids": related[:80]  # cap for v0; refine later
-            }
-            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                "related_req_ids": [reqs[j]["req_id"] for j in order],
+                "related_scores": [round(float(row[j]), 4) for j in order],
+                "related_duplicates": {reqs[j]["req_id"]: duplicates[reqs[j]["req_id"]]
+                                       for j in order if reqs[j]["req_id"] in duplicates},
+            })
+    return out
+
+QUESTION_FIELDS = ("workflow", "text_de", "text_en", "required_evidence_types")
+
+def cluster_moves(old, new):
+    """
+    req_ids whose near-duplicate cluster (or role in it) differs between two `duplicates` mappings.
+    """
+    def cluster_of(duplicates):
+        out = {c: c for c in duplicates}
+        out.update((d, c) for c, ds in duplicates.items() for d in ds)
+        return out
+    old, new = cluster_of(old or {}), cluster_of(new or {})
+    return {rid for rid in old.keys() | new.keys() if old.get(rid) != new.get(rid)}
+
+def update_questions(aq, reqs, previous, changes, top_k=TOP_K, index=None, duplicates=None, previous_duplicates=None):
+    """
+    Redoes only the questions a library diff (library_diff.py) can affect; the other rows of
+    `previous`, the map built from the diff's old library with the same top_k and the clusters
+    `previous_duplicates`, are kept with their scores. A question is redone when it is new or
+    edited in the config, when one of its links was removed, changed, reclassified or became a
+    near-duplicate, or when an added / changed / reclassified requirement, or one that left or
+    switched its cluster, now scores above its last link.
+    Returns (rows in config order, ids of the redone questions).
+    """
+    duplicates = duplicates or {}
+    scored, rows = scored_requirements(reqs, duplicates)
+    pos = {r["req_id"]: j for j, r in enumerate(scored)}
+    touched = set(changes["added"]) | set(changes["changed"]) | set(changes["reclassified"])
+    touched |= cluster_moves(previous_duplicates, duplicates)
+    prev = {q["question_id"]: q for q in previous}
+
+    redo = set()
+    for q in aq:
+        p = prev.get(q["id"])
+        if p is None or "related_scores" not in p or any(p[k] != q[k] for k in QUESTION_FIELDS):
+            redo.add(q["id"])
+        elif any(rid in touched or rid not in pos for rid in p["related_req_ids"]):
+            redo.add(q["id"])
+
+    # the others only change if a touched requirement enters their top k
+    cols = sorted(pos[rid] for rid in touched if rid in pos)
+    rest = [q for q in aq if q["id"] not in redo]
+    if cols and rest:
+        for lo, s in score_blocks(rest, scored, index, rows, cols):
+            for q, best in zip(rest[lo:lo + len(s)], s.max(axis=1)):
+                scores = prev[q["id"]]["related_scores"]
+                floor = scores[-1] if len(scores) >= top_k else 0
+                # scores are stored rounded to 4 places, and a tie with the last link can win on library order
+                if best > 0 and best >= floor - 0.5e-4:
+                    redo.add(q["id"])
+
+    fresh = map_questions([q for q in aq if q["id"] in redo], reqs, top_k, index, duplicates) if redo else []
+    fresh = {r["question_id"]: r for r in fresh}
+    out = []
+    for q in aq:
+        if q["id"] in fresh:
+            out.append(fresh[q["id"]])
+            continue
+        row = dict(prev[q["id"]])
+        row["related_duplicates"] = {rid: duplicates[rid] for rid in row["related_req_ids"] if rid in duplicates}
+        out.append(row)
+    return out, [q["id"] for q in aq if q["id"] in redo]
+
+def main():
+    ap = argparse.ArgumentParser(description="Map audit questions to their top-k related requirements.")
+    ap.add_argument("--top-k", type=int, default=TOP_K, help="requirements kept per question")
+    ap.add_argument("--no-index", action="store_true",
+                    help="tokenize the library here instead of reading term counts from the search index")
+    ap.add_argument("--no-dedup", action="store_true",
+                    help="score every requirement, ignoring the near-duplicate clusters from 05")
+    ap.add_argument("--changes", type=Path,
+                    help="library diff from library_diff.py (old version = the one the current map was built "
+                         "from): redo only the questions it affects")
+    args = ap.parse_args()
+
+    aq = yaml.safe_load(Path("requirements/config/audit_questions_de_en.yml").read_text(encoding="utf-8"))["audit_questions"]
+    req_jsonl = Path("requirements/library/requirements__v0_1.jsonl")
+    with metrics.span("read") as sp:
+        sha = hashlib.sha256()
+        reqs = pipeline_io.load_jsonl(req_jsonl, pipeline_io.Requirement, sha=sha)
+        req_sha = sha.hexdigest()
+        index = None if args.no_index else load_index(req_sha)
+        duplicates = None if args.no_dedup else dedup.load_clusters(req_sha)
+        sp["records"] = len(reqs)
+        sp["index"] = index is not None
+        sp["duplicates"] = sum(map(len, (duplicates or {}).values()))
+
+    out = Path("requirements/library/audit_question_map__v0_1.jsonl")
+    out.parent.mkdir(parents=True, exist_ok=True)
+
+    # what the map is built from, kept in its shard index for the next --changes run
+    built_from = {"requirements_sha256": req_sha, "top_k": args.top_k, "duplicates": duplicates or {}}
+
+    redone = None
+    with metrics.span("map", records=len(aq) * len(reqs)) as sp:
+        previous = None
+        if args.changes:
+            try:
+                changes = library_diff.load_changes(args.changes, req_sha)
+            except ValueError as e:
+                raise SystemExit(str(e))
+            previous = jsonl_store.index_meta(out) or {}
+            if previous.get("requirements_sha256") != changes["old_sha256"] or previous.get("top_k") != args.top_k:
+                print(f"{out} was not built from the old library of {args.changes} with top {args.top_k}; "
+                      f"mapping every question")
+                previous = None
+        if previous is not None:
+            mapped, redone = update_questions(aq, reqs, pipeline_io.load_jsonl(out), changes, args.top_k, index,
+                                              duplicates, previous["duplicates"])
+            sp["redone"] = len(redone)
+        else:
+            mapped = map_questions(aq, reqs, args.top_k, index, duplicates)
+
+    with metrics.span("write", path=str(out), records=len(mapped)), \
+            jsonl_store.ShardedWriter(out, key="question_id", shard_by="workflow", meta=built_from) as f:
+        for rec in mapped:
+            f.write(rec)
+
+    # 04 creates the database; rebuild its requirement tables if it is missing or from another library
+    with metrics.span("write_sqlite", path=str(library_db.DB), records=len(mapped)):
+        if library_db.db_meta(library_db.DB).get("requirements_sha256") != req_sha:
+            library_db.write_requirements(reqs, library_db.DB, source_sha256=req_sha)
+        library_db.write_questions(mapped, library_db.DB)
 
-    print(f"Wrote {out}")
+    print(f"Wrote {out} and {library_db.DB} ({len(mapped)} questions, top {args.top_k}, "
+          f"{'term counts from ' + str(search_index.INDEX) if index else 'library tokenized'})")
+    if redone is not None:
+        print(f"--changes {args.changes}: recomputed {len(redone)} of {len(aq)} questions "
+              f"{' '.join(redone)}".rstrip())
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("06"):
+        main()
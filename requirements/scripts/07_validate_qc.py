@@ -1,5 +1,10 @@
-import json, yaml
+import csv, json, os, re, yaml, hashlib, argparse
 from pathlib import Path
+from itertools import islice
+from multiprocessing import Pool
+import metrics
+import library_diff
+import pipeline_io
 
 VERSION = "v0_1"  # bump when you regenerate outputs
 
@@ -8,63 +13,343 @@ VERSION = "v0_1"  # bump when you regenerate outputs
 # - "en_canonical": requires EN; DE optional (use with LEFT JOIN)
 QC_MODE = "en_canonical"
 
-def load_jsonl(p: Path):
+LIBRARY = Path(f"requirements/library/requirements__{VERSION}.jsonl")
+QUESTION_MAP = Path(f"requirements/library/audit_question_map__{VERSION}.jsonl")
+MANIFEST = Path(f"requirements/library/sources_manifest__{VERSION}.csv")
+EVIDENCE_TYPES = Path("requirements/config/evidence_types.yml")
+REPORT = Path(f"requirements/library/qc_report__{VERSION}.json")
+# every finding, one JSON object per line; the report keeps counts and the first PREVIEW
+FINDINGS = Path(f"requirements/library/qc_findings__{VERSION}.jsonl")
+PREVIEW = 50
+
+# The library is streamed in chunks of CHUNK_LINES lines; from PARALLEL_MIN_BYTES on, the
+# chunks are parsed and checked by a process pool (ordered, so findings keep library order).
+# Cross-record checks (duplicate ids, links from the question map) run in the parent on
+# req_id sets.
+CHUNK_LINES = 4096
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+
+STR, BOOL, STR_LIST, NUM_LIST = "string", "boolean", "list of strings", "list of numbers"
+REQUIREMENT_SCHEMA = {
+    "req_id": STR, "instrument_code": STR, "legal_ref": STR, "text_en": STR, "text_de": STR, "has_de": BOOL,
+    "topic_tags": STR_LIST, "primary_evidence_types": STR_LIST, "supporting_evidence_types": STR_LIST,
+    "keywords_en": STR_LIST, "keywords_de": STR_LIST, "source_sha256_en": STR, "source_sha256_de": STR,
+}
+QUESTION_SCHEMA = {
+    "question_id": STR, "workflow": STR, "text_de": STR, "text_en": STR,
+    "required_evidence_types": STR_LIST, "related_req_ids": STR_LIST, "related_scores": NUM_LIST,
+}
+REQ_ID_PAT = re.compile(r"^([^|]+)\|(\d+)\|(\d+)\|([a-z]|-)\|\d{3}$")
+LEGAL_REF_PAT = re.compile(r"^Art\.?\s*(\d+)\((\d+)\)(?:\(([a-z])\))?$")
+
+def type_ok(value, kind):
+    if kind == STR:
+        return isinstance(value, str)
+    if kind == BOOL:
+        return isinstance(value, bool)
+    if not isinstance(value, list):
+        return False
+    if kind == STR_LIST:
+        return all(isinstance(v, str) for v in value)
+    return all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value)
+
+# field values for the rule checks; a wrong type is reported once, by the schema check
+def as_str(rec, field):
+    v = rec.get(field)
+    return v if isinstance(v, str) else ""
+
+def as_list(rec, field):
+    v = rec.get(field)
+    return v if isinstance(v, list) else []
+
+def finding(severity, check, file, line, id_, message):
+    return {"severity": severity, "check": check, "file": file, "line": line, "id": id_, "message": message}
+
+def schema_findings(rec, schema, file, line, id_):
     out = []
-    for line in p.read_text(encoding="utf-8").splitlines():
-        if line.strip():
-            out.append(json.loads(line))
+    for field, kind in schema.items():
+        if field not in rec:
+            out.append(finding("error", "schema", file, line, id_, f"Missing field {field}: {id_}"))
+        elif not type_ok(rec[field], kind):
+            out.append(finding("error", "schema", file, line, id_, f"Field {field} is not a {kind}: {id_}"))
     return out
 
-def main():
-    ev = yaml.safe_load(Path("requirements/config/evidence_types.yml").read_text(encoding="utf-8"))
-    allowed = {e["code"] for e in ev["evidence_types"]}
+def check_requirement(r, line, allowed, sources):
+    """
+    Findings of one library record, apart from the duplicate req_id check.
+    `sources`: (instrument_code, lang, sha256) of every file in the sources manifest.
+    """
+    file = LIBRARY.name
+    rid = r.get("req_id", "")
+    out = schema_findings(r, REQUIREMENT_SCHEMA, file, line, rid)
+
+    def error(check, message):
+        out.append(finding("error", check, file, line, rid, message))
+
+    m, ref = REQ_ID_PAT.match(str(rid)), LEGAL_REF_PAT.match(str(r.get("legal_ref", "")).strip())
+    if not m:
+        error("req_id", f"Malformed req_id: {rid}")
+    elif ref and (m.group(1), m.group(2), m.group(3), m.group(4)) != \
+            (r.get("instrument_code"), ref.group(1), ref.group(2), ref.group(3) or "-"):
+        error("req_id", f"req_id does not match instrument_code / legal_ref {r.get('legal_ref')}: {rid}")
+
+    for t in as_list(r, "primary_evidence_types") + as_list(r, "supporting_evidence_types"):
+        if t not in allowed:
+            error("evidence_type", f"Unknown evidence type {t} in {rid}")
+
+    # EN is always required
+    if not as_str(r, "text_en").strip():
+        error("text", f"Missing text_en: {rid}")
+
+    # DE depends on QC_MODE
+    has_text_de = bool(as_str(r, "text_de").strip())
+    if not has_text_de:
+        if QC_MODE == "bilingual_strict":
+            error("text", f"Missing text_de: {rid}")
+        else:
+            out.append(finding("warning", "text", file, line, rid, f"Missing text_de: {rid}"))
+    if isinstance(r.get("has_de"), bool) and r["has_de"] != has_text_de:
+        error("has_de", f"has_de is {r.get('has_de')} but text_de is {'set' if has_text_de else 'empty'}: {rid}")
+
+    # provenance: the source hashes must be files of this instrument in the manifest
+    for lang, present in (("en", True), ("de", has_text_de)):
+        sha = as_str(r, f"source_sha256_{lang}")
+        if sha and (r.get("instrument_code"), lang, sha) not in sources:
+            error("source_sha256", f"source_sha256_{lang} {sha[:12]} not in {MANIFEST.name} "
+                                   f"for {r.get('instrument_code')}/{lang}: {rid}")
+        elif not sha and present:
+            error("source_sha256", f"Missing source_sha256_{lang}: {rid}")
+    return out
+
+# per-process state of the pool workers (set once by the initializer, not pickled per chunk)
+_ctx = {}
+
+def init_worker(allowed, sources, reuse, stale):
+    _ctx.update(allowed=allowed, sources=sources, reuse=reuse, stale=stale)
+
+def check_chunk(chunk):
+    """
+    [(line, offset, req_id, findings, reused)] for a chunk of numbered_lines().
+    With reuse enabled, requirements outside the stale set get their previous findings back.
+    """
+    out = []
+    reuse, stale = _ctx["reuse"], _ctx["stale"]
+    for line, offset, raw in chunk:
+        try:
+            r = pipeline_io.loads(raw)
+        except ValueError as e:
+            out.append((line, offset, None,
+                        [finding("error", "json", LIBRARY.name, line, None, f"Invalid JSON: {e}")], False))
+            continue
+        if not isinstance(r, dict):
+            out.append((line, offset, None,
+                        [finding("error", "json", LIBRARY.name, line, None, "Not a JSON object")], False))
+            continue
+        rid = r.get("req_id") if isinstance(r.get("req_id"), str) else None
+        if reuse is not None and rid is not None and rid not in stale:
+            out.append((line, offset, rid, [dict(f, line=line) for f in reuse.get(rid, ())], True))
+        else:
+            out.append((line, offset, rid, check_requirement(r, line, _ctx["allowed"], _ctx["sources"]), False))
+    return out
+
+def numbered_lines(path: Path, sha):
+    """
+    (line number, byte offset, raw line) of the non-blank lines; every line is fed to `sha`.
+    """
+    offset = 0
+    with path.open("rb", buffering=pipeline_io.BUFFER) as f:
+        for n, raw in enumerate(f, 1):
+            sha.update(raw)
+            if raw.strip():
+                yield n, offset, raw
+            offset += len(raw)
+
+def chunks(path: Path, sha):
+    lines = numbered_lines(path, sha)
+    while True:
+        chunk = list(islice(lines, CHUNK_LINES))
+        if not chunk:
+            return
+        yield chunk
 
-    reqs = load_jsonl(Path(f"requirements/library/requirements__{VERSION}.jsonl"))
-    aqm  = load_jsonl(Path(f"requirements/library/audit_question_map__{VERSION}.jsonl"))
+def read_record(path: Path, offset: int):
+    with path.open("rb") as f:
+        f.seek(offset)
+        return pipeline_io.loads(f.readline())
 
-    errors = []
-    warnings = []
-    ids = set()
+def iter_requirement_results(path: Path, jobs, allowed, sources, reuse, stale, sha):
+    args = (allowed, sources, reuse, stale)
+    if jobs > 1 and path.stat().st_size >= PARALLEL_MIN_BYTES:
+        with Pool(jobs, initializer=init_worker, initargs=args) as pool:
+            for results in pool.imap(check_chunk, chunks(path, sha)):
+                yield from results
+    else:
+        init_worker(*args)
+        for chunk in chunks(path, sha):
+            yield from check_chunk(chunk)
+
+def check_questions(path: Path, req_ids, allowed):
+    """
+    Findings of the question map: schema, duplicate ids, unmapped questions and links to
+    requirements that are not in the library. Returns (findings, question count).
+    """
+    file = path.name
+    out, seen = [], set()
+    n = 0
+    with path.open("rb", buffering=pipeline_io.BUFFER) as f:
+        for line, raw in enumerate(f, 1):
+            if not raw.strip():
+                continue
+            n += 1
+            try:
+                q = pipeline_io.loads(raw)
+            except ValueError as e:
+                out.append(finding("error", "json", file, line, None, f"Invalid JSON: {e}"))
+                continue
+            if not isinstance(q, dict):
+                out.append(finding("error", "json", file, line, None, "Not a JSON object"))
+                continue
+            qid = q.get("question_id", "<missing>")
+            out += schema_findings(q, QUESTION_SCHEMA, file, line, qid)
+            if qid in seen:
+                out.append(finding("error", "duplicate_id", file, line, qid, f"Duplicate question_id: {qid}"))
+            seen.add(qid)
+            links = as_list(q, "related_req_ids")
+            if not links:
+                out.append(finding("error", "unmapped", file, line, qid, f"Audit question unmapped: {qid}"))
+            for rid in links:
+                if rid not in req_ids:
+                    out.append(finding("error", "dangling_link", file, line, qid,
+                                       f"Audit question {qid} links unknown req_id {rid}"))
+            dup_map = q.get("related_duplicates")
+            for canon, dups in (dup_map.items() if isinstance(dup_map, dict) else ()):
+                for rid in [canon] + (dups if isinstance(dups, list) else []):
+                    if rid not in req_ids:
+                        out.append(finding("error", "dangling_link", file, line, qid,
+                                           f"Audit question {qid} lists unknown duplicate req_id {rid}"))
+            scores = q.get("related_scores")
+            if not type_ok(scores, NUM_LIST):
+                pass
+            elif len(scores) != len(links):
+                out.append(finding("error", "schema", file, line, qid,
+                                   f"related_scores has {len(scores)} entries for {len(links)} links: {qid}"))
+            elif any(a < b for a, b in zip(scores, scores[1:])):
+                out.append(finding("warning", "ranking", file, line, qid, f"related_scores not descending: {qid}"))
+            for t in as_list(q, "required_evidence_types"):
+                if t not in allowed:
+                    out.append(finding("error", "evidence_type", file, line, qid,
+                                       f"Unknown evidence type {t} in {qid}"))
+    return out, n
+
+def load_sources(path: Path):
+    with path.open(newline="", encoding="utf-8") as f:
+        return {(row["instrument_code"], row["lang"], row["sha256"]) for row in csv.DictReader(f)}
+
+def load_previous(changes, inputs):
+    """
+    req_id -> findings of the previous run, if it checked the diff's old library with the same
+    manifest, evidence types and QC mode; else None.
+    """
+    try:
+        report = json.loads(REPORT.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+    if report.get("qc_mode") != QC_MODE or report.get("inputs") != dict(inputs, requirements=changes["old_sha256"]):
+        return None
+    prev = {}
+    try:
+        for rec in pipeline_io.iter_jsonl(FINDINGS):
+            if rec["file"] == LIBRARY.name and rec["id"] is not None and rec["check"] != "duplicate_id":
+                prev.setdefault(rec["id"], []).append(rec)
+    except FileNotFoundError:
+        return None
+    return prev
+
+def main():
+    ap = argparse.ArgumentParser(description="Validate the requirements library, the audit question map and "
+                                             "their links to each other and to the sources manifest.")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                    help=f"worker processes for libraries of {PARALLEL_MIN_BYTES >> 20} MB and more")
+    ap.add_argument("--changes", type=Path,
+                    help="library diff from library_diff.py: re-check only the requirements it touches, "
+                         "reusing the findings of the previous run for the others")
+    args = ap.parse_args()
+
+    ev = yaml.safe_load(EVIDENCE_TYPES.read_text(encoding="utf-8"))
+    allowed = {e["code"] for e in ev["evidence_types"]}
+    sources = load_sources(MANIFEST)
+    inputs = {"manifest": pipeline_io.file_sha256(MANIFEST), "evidence_types": pipeline_io.file_sha256(EVIDENCE_TYPES)}
 
-    for r in reqs:
-        rid = r.get("req_id", "")
-        if rid in ids:
-            errors.append(f"Duplicate req_id: {rid}")
-        ids.add(rid)
+    reuse, stale = None, frozenset()
+    if args.changes:
+        try:
+            changes = library_diff.load_changes(args.changes, pipeline_io.file_sha256(LIBRARY))
+        except ValueError as e:
+            raise SystemExit(str(e))
+        reuse = load_previous(changes, inputs)
+        if reuse is None:
+            print(f"No QC findings of the old library of {args.changes}; checking everything")
+        stale = frozenset(changes["added"] + changes["changed"] + changes["reclassified"])
 
-        for t in (r.get("primary_evidence_types", []) + r.get("supporting_evidence_types", [])):
-            if t not in allowed:
-                errors.append(f"Unknown evidence type {t} in {rid}")
+    counts = {"error": 0, "warning": 0}
+    preview = {"error": [], "warning": []}
+    by_check = {}
 
-        # EN is always required
-        if not (r.get("text_en") or "").strip():
-            errors.append(f"Missing text_en: {rid}")
+    def emit(f, out):
+        out.write(f)
+        counts[f["severity"]] += 1
+        by_check[f["check"]] = by_check.get(f["check"], 0) + 1
+        if len(preview[f["severity"]]) < PREVIEW:
+            preview[f["severity"]].append(f["message"])
 
-        # DE depends on QC_MODE
-        if not (r.get("text_de") or "").strip():
-            if QC_MODE == "bilingual_strict":
-                errors.append(f"Missing text_de: {rid}")
-            else:
-                warnings.append(f"Missing text_de: {rid}")
+    req_sha = hashlib.sha256()
+    req_ids = set()
+    n_reqs = rechecked = 0
+    with pipeline_io.JsonlWriter(FINDINGS) as out:
+        with metrics.span("requirements", path=str(LIBRARY)) as sp:
+            for line, offset, rid, found, reused in iter_requirement_results(LIBRARY, args.jobs, allowed, sources,
+                                                                     reuse, stale, req_sha):
+                n_reqs += 1
+                if rid in req_ids:
+                    emit(finding("error", "duplicate_id", LIBRARY.name, line, rid, f"Duplicate req_id: {rid}"), out)
+                    if reused:
+                        # cached findings are per req_id; a second record with that id needs its own
+                        found = check_requirement(read_record(LIBRARY, offset), line, allowed, sources)
+                        reused = False
+                if rid is not None:
+                    req_ids.add(rid)
+                rechecked += not reused
+                for f in found:
+                    emit(f, out)
+            sp["records"] = n_reqs
+            sp["rechecked"] = rechecked
 
-    for q in aqm:
-        if not q.get("related_req_ids"):
-            errors.append(f"Audit question unmapped: {q.get('question_id','<missing>')}")
+        with metrics.span("questions", path=str(QUESTION_MAP)) as sp:
+            found, n_questions = check_questions(QUESTION_MAP, req_ids, allowed)
+            for f in found:
+                emit(f, out)
+            sp["records"] = n_questions
 
     report = {
         "version": VERSION,
         "qc_mode": QC_MODE,
-        "requirements_count": len(reqs),
-        "audit_questions_count": len(aqm),
-        "errors_count": len(errors),
-        "warnings_count": len(warnings),
-        "errors_preview": errors[:50],
-        "warnings_preview": warnings[:50],
+        "requirements_count": n_reqs,
+        "audit_questions_count": n_questions,
+        "errors_count": counts["error"],
+        "warnings_count": counts["warning"],
+        "errors_preview": preview["error"],
+        "warnings_preview": preview["warning"],
+        "findings_by_check": dict(sorted(by_check.items())),
+        "findings_path": str(FINDINGS),
+        "inputs": dict(inputs, requirements=req_sha.hexdigest()),
     }
 
-    out = Path(f"requirements/library/qc_report__{VERSION}.json")
-    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(json.dumps(report, ensure_ascii=False, indent=2))
+    with metrics.span("write", path=str(REPORT)):
+        pipeline_io.write_text(REPORT, json.dumps(report, ensure_ascii=False, indent=2))
+    print(json.dumps({k: v for k, v in report.items() if k != "inputs"}, ensure_ascii=False, indent=2))
+    if args.changes:
+        print(f"--changes {args.changes}: re-checked {rechecked} of {n_reqs} requirements")
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("07"):
+        main()
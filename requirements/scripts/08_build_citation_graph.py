@@ -0,0 +1,52 @@
+import json, hashlib, argparse
+from pathlib import Path
+import metrics
+import citations
+import pipeline_io
+
+VERSION = "v0_1"
+
+def main():
+    ap = argparse.ArgumentParser(description="Extract article citations and build the citation graph indexes.")
+    ap.add_argument("--inp", type=Path, default=Path(f"requirements/library/requirements__{VERSION}.jsonl"))
+    ap.add_argument("--out", type=Path, default=citations.GRAPH)
+    args = ap.parse_args()
+    index = args.out.with_suffix(".npz")
+
+    with metrics.span("read", path=str(args.inp)) as sp:
+        sha = hashlib.sha256()
+        reqs = pipeline_io.load_jsonl(args.inp, pipeline_io.Requirement, sha=sha)
+        sp["records"] = len(reqs)
+
+    numbers = citations.instrument_numbers()
+    nodes, edges, counts = citations.build_graph(reqs, numbers)
+    graph = {
+        "version": VERSION,
+        "source_sha256": sha.hexdigest(),
+        "params": {"instruments": sorted(set(numbers.values())), "closure_max_nodes": citations.CLOSURE_MAX_NODES},
+        "requirements_count": len(reqs),
+        "nodes_count": len(nodes),
+        "edges_count": len(edges),
+        "citations_count": counts["citations"],
+        "unknown_instrument_count": counts["unknown_instrument"],
+        "self_citations_count": counts["self"],
+        "nodes": nodes,
+        "edges": edges,
+    }
+    text = json.dumps(graph, ensure_ascii=False, indent=2)
+    with metrics.span("write", path=str(args.out), records=len(edges)):
+        if not args.out.exists() or args.out.read_text(encoding="utf-8") != text:
+            args.out.parent.mkdir(parents=True, exist_ok=True)
+            pipeline_io.write_text(args.out, text)
+
+    # the npz is not committed; rebuilt when missing or built from another graph (library,
+    # instruments.yml or extraction code changed)
+    with metrics.span("write_index", path=str(index), records=len(nodes)):
+        if citations.index_digest(index) != citations.graph_digest(nodes, edges):
+            citations.write_index(nodes, edges, index)
+    print(f"Wrote {args.out} and {index}: {len(nodes)} nodes ({len(nodes) - len(reqs)} outside the library), "
+          f"{len(edges)} edges from {counts['citations']} citations")
+
+if __name__ == "__main__":
+    with metrics.stage("08"):
+        main()
@@ -0,0 +1,50 @@
+import csv, json, argparse
+from pathlib import Path
+import metrics
+import evidence_coverage
+import pipeline_io
+
+VERSION = "v0_1"
+
+def main():
+    ap = argparse.ArgumentParser(description="Evidence coverage, gaps and orphan requirements of the audit question map.")
+    ap.add_argument("--out", type=Path, default=evidence_coverage.REPORT)
+    args = ap.parse_args()
+    matrix = args.out.with_suffix(".csv")
+
+    shas = {}
+    with metrics.span("read") as sp:
+        cov = evidence_coverage.load(shas=shas)
+        sp["records"] = len(cov.reqs) + len(cov.questions)
+
+    with metrics.span("analyse", records=len(cov.indices)):
+        by_instrument, by_tag = cov.orphan_counts()
+        report = {
+            "version": VERSION,
+            "inputs": {"requirements": shas["library"], "question_map": shas["question_map"],
+                       "evidence_types": pipeline_io.file_sha256(evidence_coverage.EVIDENCE_TYPES)},
+            "counts": cov.summary(),
+            "evidence_types": cov.evidence_rows(),
+            "workflows": cov.workflow_rows(),
+            "questions": cov.question_rows(),
+            "orphan_requirements_by_instrument": by_instrument,
+            "orphan_requirements_by_topic_tag": by_tag,
+            "orphan_requirements": cov.orphans(),
+        }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    with metrics.span("write", path=str(args.out)):
+        if not args.out.exists() or args.out.read_text(encoding="utf-8") != text:
+            pipeline_io.write_text(args.out, text)
+        with pipeline_io.temp_path(matrix).open("w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["question_id", "workflow"] + cov.ev)
+            w.writerows(cov.matrix_rows())
+        pipeline_io.temp_path(matrix).replace(matrix)
+
+    c = report["counts"]
+    print(f"Wrote {args.out} and {matrix}: {c['questions_fully_covered']} of {c['questions']} questions fully covered, "
+          f"{c['gaps']} gaps, {c['orphan_requirements']} of {c['requirements']} requirements reached by no question")
+
+if __name__ == "__main__":
+    with metrics.stage("09"):
+        main()
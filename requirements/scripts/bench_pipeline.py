@@ -0,0 +1,390 @@
+import json, os, platform, random, shutil, subprocess, sys, tempfile, time, timeit, argparse, datetime
+import importlib.util
+from pathlib import Path
+
+from run_pipeline import STAGES
+
+# Benchmarks for the extraction-to-QC pipeline. Run from the repo root:
+#   python requirements/scripts/bench_pipeline.py --scale 1 10
+#   python requirements/scripts/bench_pipeline.py --compare requirements/.cache/bench/<old>.json
+#
+# Every stage runs as its own process inside a throw-away workspace (a copy of the repo layout),
+# so committed artifacts are never touched. Caches are bypassed (cold run) unless --warm is given.
+#
+# Corpora:
+#   bundled      the sources listed in requirements/config/instruments.yml
+#   synthetic_xN 6*N EUR-Lex-shaped instruments (XHTML, every third one with a PDF primary),
+#                plus pre-rendered segments__EN/DE.jsonl so --stages 03 04 05 06 07 skips extraction
+
+SCRIPTS = Path("requirements/scripts")
+RESULTS_DIR = Path("requirements/.cache/bench")
+
+COLD_ARGS = {"01": ["--no-stat-cache"], "02": ["--no-cache"]}
+
+WORDS = {
+    "en": ("financial entities shall ensure that the ICT third-party service provider contract register of information "
+           "incident classification reporting major threshold competent authority monitoring subcontractor exit "
+           "strategy risk assessment critical or important function data location audit rights notification").split(),
+    "de": ("Finanzunternehmen stellen sicher dass der IKT-Drittdienstleister Vertrag Informationsregister Vorfall "
+           "Klassifizierung Meldung schwerwiegender Schwellenwert zuständige Behörde Überwachung Unterauftragnehmer "
+           "Ausstiegsstrategie Risikobewertung kritische oder wichtige Funktion Datenstandort Prüfrechte Zwischenfall").split(),
+}
+HEADING = {"en": "Article", "de": "Artikel"}
+
+
+def load_script(name: str):
+    """
+    Import a numbered stage script as a module (its main() is not run).
+    """
+    path = SCRIPTS / name
+    spec = importlib.util.spec_from_file_location(path.stem.lstrip("0123456789_") or path.stem, path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# --- synthetic corpus -------------------------------------------------------------------------
+
+def sentence(rng, lang, n):
+    words = rng.choices(WORDS[lang], k=n)
+    words[0] = words[0][:1].upper() + words[0][1:]
+    return " ".join(words) + "."
+
+
+def build_model(n_instruments: int, n_articles: int, seed: int = 7):
+    """
+    code -> lang -> [(art, pno, marker_text, [point texts])]; both languages share the structure.
+    """
+    rng = random.Random(seed)
+    model = {}
+    for i in range(n_instruments):
+        code = f"SYN_{i:04d}"
+        arts = n_articles if i % 3 != 2 else max(4, n_articles // 5)   # PDF primaries are kept small
+        shape = [(a, rng.randint(1, 6), [rng.randint(0, 4) for _ in range(6)]) for a in range(1, arts + 1)]
+        model[code] = {}
+        for lang in ("en", "de"):
+            paras = []
+            for art, n_paras, n_points in shape:
+                for p in range(1, n_paras + 1):
+                    marker = f"{p}." if lang == "en" else f"({p})"
+                    body = " ".join(sentence(rng, lang, rng.randint(12, 40)) for _ in range(rng.randint(1, 3)))
+                    points = [sentence(rng, lang, rng.randint(6, 20)) for _ in range(n_points[p - 1])]
+                    paras.append((art, p, f"{marker}\u00a0\u00a0\u00a0{body}", points))
+            model[code][lang] = paras
+    return model
+
+
+def point_label(k: int, lang: str):
+    letter = "abcdefghijklmnopqrstuvwxyz"[k]
+    return f"({letter})" if lang == "en" else f"{letter})"
+
+
+def segment_text(marker_text, points, lang):
+    parts = [marker_text]
+    for k, pt in enumerate(points):
+        parts += [point_label(k, lang), pt]
+    return "\n".join(parts)
+
+
+def esc(s: str) -> str:
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def render_xhtml(code, lang, paras, rng):
+    out = ['<?xml version="1.0" encoding="UTF-8"?><html xmlns="http://www.w3.org/1999/xhtml">',
+           f"<head><title>{code}</title></head><body><div id=\"docHtml\">\n"]
+    for r in range(1, 2 + len(paras) // 4):
+        out.append(f'<div class="eli-subdivision" id="rct_{r}"><p class="oj-normal">({r})\u00a0\u00a0\u00a0'
+                   f"{esc(sentence(rng, lang, 40))}</p></div>\n")
+    current = None
+    for art, p, marker_text, points in paras:
+        if art != current:
+            if current is not None:
+                out.append("</div>\n")
+            current = art
+            out.append(f'<div class="eli-subdivision" id="art_{art}">\n<p class="oj-ti-art">{HEADING[lang]}\u00a0{art}</p>\n'
+                       f'<div class="eli-title" id="art_{art}.tit_1"><p class="oj-sti-art">{esc(sentence(rng, lang, 5))}</p></div>\n')
+        out.append(f'<div id="{art:03d}.{p:03d}">\n<p class="oj-normal">{esc(marker_text)}</p>\n')
+        for k, pt in enumerate(points):
+            out.append('<table width="100%" border="0"><tbody><tr><td valign="top">\n'
+                       f'<p class="oj-normal">{point_label(k, lang)}</p>\n</td><td valign="top">\n'
+                       f'<p class="oj-normal">{esc(pt)}</p>\n</td></tr></tbody></table>\n')
+        out.append("</div>\n")
+    out.append("</div>\n</div></body></html>\n")
+    return "".join(out)
+
+
+def write_pdf(path: Path, lines, lines_per_page: int = 60):
+    """
+    Minimal text-only PDF (Helvetica, WinAnsi); enough for pdfium and pdfplumber.
+    """
+    def pdf_str(s):
+        s = s.encode("cp1252", "replace").decode("latin-1")
+        return "(" + s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for page_lines in pages:
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"{pdf_str(l)} '" for l in page_lines) + " ET"
+        data = stream.encode("latin-1")
+        objs.append(b"<< /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+        content_no = len(objs)
+        objs.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                    b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_no)
+        kids.append(len(objs))
+    objs[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{k} 0 R" for k in kids).encode(), len(kids))
+
+    buf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for no, body in enumerate(objs, start=1):
+        offsets.append(len(buf))
+        buf += b"%d 0 obj\n" % no + body + b"\nendobj\n"
+    xref = len(buf)
+    buf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    buf += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    buf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    path.write_bytes(bytes(buf))
+
+
+def pdf_lines(lang, paras, width=95):
+    lines, current = [], None
+    for art, p, marker_text, points in paras:
+        if art != current:
+            current = art
+            lines += [f"{HEADING[lang]} {art}", f"Title of {art}"]
+        text = segment_text(marker_text.replace("\u00a0", " "), points, lang)
+        for block in text.split("\n"):
+            while len(block) > width:
+                cut = block.rfind(" ", 0, width)
+                cut = cut if cut > 0 else width
+                lines.append(block[:cut])
+                block = block[cut:].lstrip()
+            lines.append(block)
+    return lines
+
+
+def write_synthetic_corpus(ws: Path, scale: int, n_articles: int = 60):
+    model = build_model(6 * scale, n_articles)
+    rng = random.Random(11)
+    src = ws / "requirements/sources"
+    src.mkdir(parents=True, exist_ok=True)
+    instruments = []
+    seg_lines = {"en": [], "de": []}
+    for i, (code, langs) in enumerate(model.items()):
+        versions = []
+        for lang, paras in langs.items():
+            html = src / f"{code}__{lang.upper()}.html"
+            pdf = src / f"{code}__{lang.upper()}.pdf"
+            html.write_text(render_xhtml(code, lang, paras, rng), encoding="utf-8")
+            write_pdf(pdf, pdf_lines(lang, paras))
+            primary, artifact = (pdf, html) if i % 3 == 2 else (html, pdf)
+            versions.append({"lang": lang, "path": str(primary.relative_to(ws)), "retrieved_at_utc": "2026-01-01T00:00:00Z",
+                             "artifacts": [{"format": artifact.suffix.lstrip("."), "path": str(artifact.relative_to(ws))}]})
+            for art, p, marker_text, points in paras:
+                seg_lines[lang].append(json.dumps({
+                    "instrument_code": code, "lang": lang, "legal_ref": f"Art. {art}({p})",
+                    "text": segment_text(marker_text, points, lang), "source_sha256": "synthetic",
+                }, ensure_ascii=False))
+        instruments.append({"code": code, "title": f"Synthetic instrument {code}", "versions": versions})
+
+    import yaml
+    cfg = ws / "requirements/config"
+    cfg.mkdir(parents=True, exist_ok=True)
+    for name in ("audit_questions_de_en.yml", "evidence_types.yml", "classification_rules.yml"):
+        shutil.copy(Path("requirements/config") / name, cfg / name)
+    (cfg / "instruments.yml").write_text(yaml.safe_dump({"instruments": instruments}, allow_unicode=True), encoding="utf-8")
+
+    ext = ws / "requirements/extracted"
+    ext.mkdir(parents=True, exist_ok=True)
+    for lang in ("en", "de"):
+        (ext / f"segments__{lang.upper()}.jsonl").write_text("\n".join(seg_lines[lang]) + "\n", encoding="utf-8")
+    (ws / "requirements/library").mkdir(parents=True, exist_ok=True)
+    return sum(len(v) for v in seg_lines.values())
+
+
+def write_bundled_corpus(ws: Path):
+    for sub in ("config", "sources", "library", "extracted"):
+        shutil.copytree(Path("requirements") / sub, ws / "requirements" / sub)
+
+
+# --- stage runs -------------------------------------------------------------------------------
+
+def count_records(path: Path):
+    if not path.exists():
+        return 0
+    if path.suffix == ".jsonl":
+        with path.open("rb") as f:
+            return sum(1 for line in f if line.strip())
+    if path.suffix == ".csv":
+        import csv
+        with path.open(newline="", encoding="utf-8") as f:
+            return sum(1 for _ in csv.DictReader(f))
+    if path.suffix == ".json":
+        rep = json.loads(path.read_text(encoding="utf-8"))
+        return rep.get("requirements_count") or rep.get("output_rows") or 0
+    return 0
+
+
+def run_stage(ws: Path, stage: str, warm: bool):
+    st = STAGES[stage]
+    cmd = [sys.executable, str(Path.cwd() / SCRIPTS / st["script"])] + ([] if warm else COLD_ARGS.get(stage, []))
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ws, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, ru = os.wait4(proc.pid, 0)   # rusage of exactly this stage (and the workers it waited for)
+    wall = time.perf_counter() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    err = proc.stderr.read().decode("utf-8", "replace")
+    proc.stderr.close()
+    if proc.returncode != 0:
+        raise RuntimeError(f"stage {stage} failed in {ws}:\n{err}")
+    records = sum(count_records(ws / o) for o in st["outputs"][:2] if not o.endswith(".json")) \
+        or count_records(ws / st["outputs"][0])
+    return {
+        "stage": stage,
+        "wall_s": round(wall, 4),
+        "cpu_s": round(ru.ru_utime + ru.ru_stime, 4),
+        "peak_rss_mb": round(ru.ru_maxrss / 1024, 1),   # Linux reports KiB
+        "records": records,
+        "records_per_s": round(records / wall, 1) if wall > 0 else None,
+    }
+
+
+def bench_corpus(name: str, setup, stages, warm: bool, keep: bool):
+    ws = Path(tempfile.mkdtemp(prefix=f"bench_{name}_"))
+    try:
+        setup(ws)
+        input_bytes = sum(p.stat().st_size for p in (ws / "requirements/sources").glob("*"))
+        out = []
+        for stage in stages:
+            if warm:
+                run_stage(ws, stage, warm)
+            res = run_stage(ws, stage, warm)
+            res.update({"corpus": name, "source_bytes": input_bytes})
+            print(f"  {name:16s} {stage}  wall {res['wall_s']:8.3f}s  cpu {res['cpu_s']:8.3f}s  "
+                  f"rss {res['peak_rss_mb']:7.1f} MB  {res['records']:7d} rec  {res['records_per_s'] or 0:10.1f} rec/s")
+            out.append(res)
+        return out
+    finally:
+        if keep:
+            print(f"  workspace kept: {ws}")
+        else:
+            shutil.rmtree(ws, ignore_errors=True)
+
+
+# --- micro-benchmarks -------------------------------------------------------------------------
+
+def micro(name, fn, n_items, min_time=0.2):
+    timer = timeit.Timer(fn)
+    loops, _ = timer.autorange()
+    best = min(timer.repeat(repeat=3, number=loops)) / loops
+    while best * loops * 3 < min_time and loops < 1_000_000:
+        loops *= 2
+        best = min(best, min(timer.repeat(repeat=1, number=loops)) / loops)
+    res = {"name": name, "items": n_items, "s_per_call": best, "items_per_s": round(n_items / best, 1) if best else None}
+    print(f"  {name:32s} {n_items:8d} items  {best * 1e3:10.3f} ms/call  {res['items_per_s'] or 0:14.1f} items/s")
+    return res
+
+
+def micro_benchmarks(scale: int):
+    m02 = load_script("02_extract_segments.py")
+    m03 = load_script("03_align_bilingual.py")
+    m04 = load_script("04_build_requirements_library.py")
+    m06 = load_script("06_build_audit_question_map.py")
+    import yaml
+
+    segs = [json.loads(l) for l in Path("requirements/extracted/segments__EN.jsonl").read_text(encoding="utf-8").splitlines() if l.strip()]
+    segs_de = [json.loads(l) for l in Path("requirements/extracted/segments__DE.jsonl").read_text(encoding="utf-8").splitlines() if l.strip()]
+    reqs = [json.loads(l) for l in Path("requirements/library/requirements__v0_1.jsonl").read_text(encoding="utf-8").splitlines() if l.strip()]
+    aq = yaml.safe_load(Path("requirements/config/audit_questions_de_en.yml").read_text(encoding="utf-8"))["audit_questions"]
+
+    raw = ("\n\n".join(s["text"].replace(" ", " \u00ad", 3) for s in segs) + "\n") * scale
+    blocks = {}
+    for s in segs:
+        art = s["legal_ref"].split("(")[0].replace("Art. ", "")
+        blocks.setdefault((s["instrument_code"], art), [f"Article {art}", "Some article title"]).append(s["text"])
+    art_text = "\n".join(["\n".join(v) for v in blocks.values()] * scale)
+    many_segs = [dict(s, instrument_code=f"{s['instrument_code']}_{i}") for i in range(scale) for s in segs + segs]
+    many_reqs = [dict(r, req_id=f"{r['req_id']}#{i}") for i in range(scale) for r in reqs]
+    texts = [(r["text_en"], "en") for r in many_reqs] + [(r["text_de"], "de") for r in many_reqs]
+
+    out = [
+        micro("normalize_text", lambda: m02.normalize_text(raw), len(raw)),
+        micro("tokenize", lambda: m02.tree_segments(m02.tokenize(art_text, "en"), "point"), len(blocks) * scale),
+        micro("index_segments", lambda: m03.index_segments(many_segs), len(many_segs)),
+    ]
+    idx = m03.index_segments(many_segs + [dict(s, instrument_code=f"{s['instrument_code']}_0") for s in segs_de])
+    out += [
+        micro("pick_best", lambda: [m03.pick_best(rs) for rs in idx.values()], len(idx)),
+        micro("simple_keywords", lambda: [m04.simple_keywords(t, l) for t, l in texts], len(texts)),
+        micro("audit_mapping(06)", lambda: m06.map_questions(aq, many_reqs), len(aq) * len(many_reqs)),
+    ]
+    return out
+
+
+# --- reporting --------------------------------------------------------------------------------
+
+def compare(old_path: Path, new, threshold: float):
+    old = json.loads(old_path.read_text(encoding="utf-8"))
+    key = lambda r: (r.get("corpus"), r.get("stage") or r.get("name"))
+    old_rows = {key(r): r for r in old.get("stages", []) + old.get("micro", [])}
+    regressions = 0
+    print(f"\nCompared with {old_path} (threshold {threshold:.0%}):")
+    for r in new.get("stages", []) + new.get("micro", []):
+        o = old_rows.get(key(r))
+        if not o:
+            continue
+        metric = "wall_s" if "wall_s" in r else "s_per_call"
+        if not o[metric]:
+            continue
+        ratio = r[metric] / o[metric]
+        flag = "REGRESSION" if ratio > 1 + threshold else ("faster" if ratio < 1 - threshold else "")
+        regressions += flag == "REGRESSION"
+        print(f"  {'/'.join(str(k) for k in key(r) if k):28s} {metric:10s} {o[metric]:.4g} -> {r[metric]:.4g}  x{ratio:.2f} {flag}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark stages 01-07 on the bundled and synthetic corpora.")
+    ap.add_argument("--scale", type=int, nargs="*", default=[1], help="synthetic corpus sizes (N x 6 instruments)")
+    ap.add_argument("--stages", nargs="*", default=list(STAGES), help="stages to run, in order")
+    ap.add_argument("--no-bundled", action="store_true", help="skip the bundled corpus")
+    ap.add_argument("--no-micro", action="store_true", help="skip micro-benchmarks")
+    ap.add_argument("--micro-scale", type=int, default=10, help="replicate bundled records N times for micro-benchmarks")
+    ap.add_argument("--warm", action="store_true", help="run each stage twice and keep caches (measures the warm path)")
+    ap.add_argument("--keep", action="store_true", help="keep the temporary workspaces")
+    ap.add_argument("--out", type=Path, help=f"results file (default: {RESULTS_DIR}/bench_<utc>.json)")
+    ap.add_argument("--compare", type=Path, help="previous results file to compare against")
+    ap.add_argument("--threshold", type=float, default=0.2, help="relative slowdown reported as regression")
+    args = ap.parse_args()
+
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    results = {
+        "meta": {"utc": stamp, "git_rev": rev, "python": platform.python_version(), "platform": platform.platform(),
+                 "cpu_count": os.cpu_count(), "warm": args.warm, "stages": args.stages},
+        "stages": [],
+        "micro": [],
+    }
+
+    print("Stages:")
+    if not args.no_bundled:
+        results["stages"] += bench_corpus("bundled", write_bundled_corpus, args.stages, args.warm, args.keep)
+    for n in args.scale:
+        results["stages"] += bench_corpus(f"synthetic_x{n}", lambda ws, n=n: write_synthetic_corpus(ws, n),
+                                          args.stages, args.warm, args.keep)
+    if not args.no_micro:
+        print("Micro-benchmarks:")
+        results["micro"] = micro_benchmarks(args.micro_scale)
+
+    out = args.out or RESULTS_DIR / f"bench_{stamp}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"Wrote {out}")
+
+    if args.compare and compare(args.compare, results, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
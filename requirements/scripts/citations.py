@@ -0,0 +1,364 @@
+import bisect, hashlib, json, re, yaml, argparse
+from pathlib import Path
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+import metrics
+
+# Cross-references between requirements ("referred to in Article 28(4)", "gemäß Artikel 19
+# Absatz 4 der Verordnung (EU) 2022/2554"). 08 extracts and resolves them, writes the edge
+# list next to the library and the traversal indexes beside it:
+#
+#   requirements/library/citation_graph__v0_1.json   nodes + edges with the citing text (committed)
+#   requirements/library/citation_graph__v0_1.npz    CSR forward / reverse adjacency + reachability
+#
+#   graph = citations.CitationGraph.load()
+#   graph.cited_by(graph.select("DORA_2022_2554|28"), transitive=True)   # everything depending on Art. 28
+#
+#   python requirements/scripts/citations.py --cited-by "DORA_2022_2554|19" --other-instruments
+#   python requirements/scripts/citations.py --cites "EU_2025_302|1|1|-|001" --transitive
+#
+# Nodes are the requirements (req_id) followed by the cited provisions that are not in the
+# library, keyed like a req_id prefix ("DORA_2022_2554|5", "DORA_2022_2554|5|2"), so a
+# query key selects every node at or below it. All patterns (EN and DE article references,
+# bare "paragraph 4" / "Absatz 4" within the citing article, instrument suffixes) are one
+# regex, so each text is scanned once. A citation without instrument suffix points into the
+# citing instrument; one naming an instrument that is not in instruments.yml, or one
+# whose instrument reference does not parse, is dropped.
+#
+# Reachability: the strongly connected components are condensed and, in reverse topological
+# order, each component's reachable set is the union of its successors' sets, kept as one
+# packed bit row per component for each direction. Above CLOSURE_MAX_NODES the rows would
+# not fit (n^2 / 8 bytes); transitive queries then walk the CSR arrays instead.
+
+VERSION = "v0_1"
+GRAPH = Path(f"requirements/library/citation_graph__{VERSION}.json")
+INDEX = GRAPH.with_suffix(".npz")
+INSTRUMENTS = Path("requirements/config/instruments.yml")
+
+CLOSURE_MAX_NODES = 1 << 14
+
+CITATION_PAT = re.compile(r"""
+    \b(?:
+        (?P<art_kw>Articles?|Artikeln?)\s+(?P<art>\d+)
+      | (?P<par_kw>paragraphs?|Absatz|Absätzen?)\s+(?P<par>\d+)
+    )
+    (?P<rest>(?:
+        \s*\(\d+\)                                          # EN paragraph (4)
+      | \s*\([a-z]\)                                        # EN point (b)
+      | ,?\s+(?:points?|Nummer|Buchstabe)\s+(?:\(\w+\)|\w+)(?!\w)   # point (a), Buchstabe f, Nummer 16
+      | \s+(?:Absatz|Absätze|Absätzen)\s+\d+                # DE paragraph
+      | \s+Buchstaben\s+[a-z](?:\s*(?:,|und|oder|bis)\s+[a-z])*(?!\w)   # Buchstaben a, b und d
+      | \s+(?:und|and)\s+Absatz\s+\d+                       # Buchstabe b und Absatz 5
+      | \s*(?:,|and|or|to|und|oder|bis)\s+(?:\d+|\(\w+\))(?!/)
+    )*)
+    (?:,?\s+(?:of|der|des)\s+(?:[^\W\d]+\s+){0,3}?
+        (?:Regulations?|Verordnung(?:en)?|Directive|Richtlinie)\s+(?:\(E[UG]\)\s+)?(?:No\.?\s+|Nr\.\s+)?
+        (?P<num>\d+/\d+))?
+""", re.X)
+# an instrument reference right after a match that the suffix of CITATION_PAT did not parse
+FOREIGN_SUFFIX = re.compile(r"""
+    ,?\s+(?:of|der|des)\s+(?!(?:this|these|dieser|diese|dieses)\b)(?:[^\W\d]+\s+){0,3}?
+    (?:Regulations?|Verordnung(?:en)?|Directive|Richtlinie)\b
+""", re.X)
+
+REST_TOKEN = re.compile(r"(?:points?|Nummer)\s+\(?(\d+)\)?|Buchstabe\s+([a-z])\b|points?\s+\(([a-z])\)"
+                        r"|\((\d+)\)|\(([a-z])\)|(Absatz|Absätze|Absätzen)|(\d+)|\b(to|bis)\b|\b([a-z])\b")
+WS_RE = re.compile(r"\s+")
+
+def instrument_numbers(path: Path = INSTRUMENTS):
+    """
+    "2022/2554" (and "2554/2022" for old-style numbering) -> instrument code, from the CELEX ids.
+    """
+    cfg = yaml.safe_load(path.read_text(encoding="utf-8"))
+    out = {}
+    for inst in cfg["instruments"]:
+        m = re.fullmatch(r"3(\d{4})[RL](\d{4})", str(inst.get("celex", "")))
+        if m:
+            year, no = m.group(1), str(int(m.group(2)))
+            out[f"{year}/{no}"] = out[f"{no}/{year}"] = inst["code"]
+    return out
+
+def parse_req_id(rid: str):
+    code, art, para, point, _ = rid.split("|")
+    return code, art, para, (None if point == "-" else point)
+
+def citation_targets(m, src_art: str):
+    """
+    [(article, paragraph or None, point or None)] of one CITATION_PAT match.
+    "Article 7(4)(b) and (5)" -> 7(4)(b), 7(5); "Artikel 9 Absätze 1 bis 6" -> 9(1) .. 9(6);
+    "Artikel 2 Absatz 1 Buchstaben a, b und d" -> 2(1)(a), 2(1)(b), 2(1)(d).
+    """
+    refs = [[m.group("art"), None, None]] if m.group("art") else [[src_art, m.group("par"), None]]
+    bare = "article" if m.group("art") else "paragraph"   # level of a bare number in the tail
+    span = False
+    for num_point, letter_de, letter_en, para, letter, absatz, num, to, bare_letter in REST_TOKEN.findall(m.group("rest")):
+        if num_point:
+            continue   # numbered definition ("point (16)", "Nummer 16"), not a provision
+        if absatz:
+            bare = "paragraph"
+            continue
+        if to:
+            span = True
+            continue
+        last = refs[-1]
+        if letter or letter_de or letter_en or bare_letter:
+            x = letter or letter_de or letter_en or bare_letter
+            if span and last[2] is not None and last[2] < x:
+                refs += [[last[0], last[1], chr(k)] for k in range(ord(last[2]) + 1, ord(x) + 1)]
+            elif last[2] is None:
+                last[2] = x
+            else:
+                refs.append([last[0], last[1], x])
+        elif para or (num and bare == "paragraph"):
+            n = para or num
+            if span and last[1] is not None and last[1].isdigit() and int(last[1]) < int(n):
+                refs += [[last[0], str(k), None] for k in range(int(last[1]) + 1, int(n) + 1)]
+            elif last[1] is None and last[2] is None:
+                last[1] = n
+            else:
+                refs.append([last[0], n, None])
+        elif num:
+            if span and int(last[0]) < int(num):
+                refs += [[str(k), None, None] for k in range(int(last[0]) + 1, int(num) + 1)]
+            else:
+                refs.append([num, None, None])
+        span = False
+    return [tuple(r) for r in refs]
+
+def build_graph(reqs, numbers):
+    """
+    (nodes, edges): node keys (req_ids first, then cited provisions outside the library) and
+    sorted unique [source, target, citing text] edges. Also returns extraction counts.
+    """
+    ids = [r["req_id"] for r in reqs]
+    by_point, by_para, by_art = {}, {}, {}
+    for i, rid in enumerate(ids):
+        code, art, para, point = parse_req_id(rid)
+        by_art.setdefault((code, art), []).append(i)
+        by_para.setdefault((code, art, para), []).append(i)
+        if point:
+            by_point.setdefault((code, art, para, point), []).append(i)
+    external = {}
+    edges = {}
+    counts = {"citations": 0, "unknown_instrument": 0, "self": 0}
+
+    def resolve(code, art, para, point):
+        if point and (code, art, para, point) in by_point:
+            return by_point[(code, art, para, point)]
+        if para and (code, art, para) in by_para:
+            return by_para[(code, art, para)]
+        if not para and (code, art) in by_art:
+            return by_art[(code, art)]
+        key = "|".join(p for p in (code, art, para, point) if p)
+        if key not in external:
+            external[key] = len(ids) + len(external)
+        return [external[key]]
+
+    with metrics.span("extract", records=len(reqs)) as sp:
+        for i, r in enumerate(reqs):
+            src_code, src_art, _, _ = parse_req_id(ids[i])
+            for lang in ("en", "de"):
+                text = r.get(f"text_{lang}") or ""
+                for m in CITATION_PAT.finditer(text):
+                    counts["citations"] += 1
+                    code = src_code
+                    if m.group("num"):
+                        code = numbers.get(m.group("num"))
+                    elif FOREIGN_SUFFIX.match(text, m.end()):
+                        code = None   # names some instrument, just not in a form we can resolve
+                    if code is None:
+                        counts["unknown_instrument"] += 1
+                        continue
+                    label = WS_RE.sub(" ", m.group(0)).strip()
+                    for art, para, point in citation_targets(m, src_art):
+                        for j in resolve(code, art, para, point):
+                            if j == i:
+                                counts["self"] += 1
+                            elif (i, j) not in edges:
+                                edges[(i, j)] = label
+        sp["edges"] = len(edges)
+
+    nodes = ids + sorted(external, key=external.get)
+    return nodes, [[i, j, edges[(i, j)]] for i, j in sorted(edges)], counts
+
+# -------------------------
+# CSR + reachability
+# -------------------------
+
+def csr(n: int, src, dst):
+    """
+    (indptr, indices) of the adjacency lists src -> dst, targets sorted per source.
+    """
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order].astype(np.int32)
+
+def closure_rows(n: int, indptr, indices):
+    """
+    (component per node, packed bit row per component): bit v of row comp[u] is set when v
+    is reachable from u over one or more edges.
+    """
+    graph = sparse.csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr), shape=(n, n))
+    n_comp, comp = connected_components(graph, directed=True, connection="strong")
+    nb = (n + 7) // 8
+    members = np.zeros((n_comp, nb), dtype=np.uint8)
+    nodes = np.arange(n)
+    np.bitwise_or.at(members, (comp, nodes >> 3), (0x80 >> (nodes & 7)).astype(np.uint8))
+    sizes = np.bincount(comp, minlength=n_comp)
+
+    src = np.repeat(nodes, np.diff(indptr))
+    csrc, cdst = comp[src], comp[indices]
+    cyclic = sizes > 1
+    cyclic[csrc[csrc == cdst]] = True          # self-loops (not produced by build_graph, but cheap to honor)
+    keep = csrc != cdst
+    cptr, cidx = csr(n_comp, csrc[keep], cdst[keep])
+
+    # Kahn's algorithm on the condensation, then successors before predecessors
+    indeg = np.bincount(cidx, minlength=n_comp)
+    order, queue = [], [c for c in range(n_comp) if indeg[c] == 0]
+    while queue:
+        c = queue.pop()
+        order.append(c)
+        for d in cidx[cptr[c]:cptr[c + 1]].tolist():
+            indeg[d] -= 1
+            if indeg[d] == 0:
+                queue.append(d)
+    reach = np.zeros((n_comp, nb), dtype=np.uint8)
+    for c in reversed(order):
+        succ = np.unique(cidx[cptr[c]:cptr[c + 1]])
+        if len(succ):
+            reach[c] = np.bitwise_or.reduce(members[succ] | reach[succ], axis=0)
+        if cyclic[c]:
+            reach[c] |= members[c]
+    return comp.astype(np.int32), reach
+
+def graph_digest(nodes, edges) -> str:
+    """
+    sha256 of the node keys and edges; ties the .npz to the graph JSON it was built from.
+    """
+    return hashlib.sha256(json.dumps([nodes, edges], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def index_digest(path: Path = INDEX):
+    """
+    graph_digest stored in the .npz, or None when it is missing or unreadable.
+    """
+    try:
+        with np.load(path, allow_pickle=False) as z:
+            return str(z["graph_sha256"])
+    except (FileNotFoundError, ValueError, KeyError, OSError):
+        return None
+
+def write_index(nodes, edges, path: Path = INDEX):
+    n = len(nodes)
+    src = np.array([e[0] for e in edges], dtype=np.int64)
+    dst = np.array([e[1] for e in edges], dtype=np.int64)
+    fwd_ptr, fwd_idx = csr(n, src, dst)
+    rev_ptr, rev_idx = csr(n, dst, src)
+    arrays = {"fwd_indptr": fwd_ptr, "fwd_indices": fwd_idx, "rev_indptr": rev_ptr, "rev_indices": rev_idx,
+              "graph_sha256": np.array(graph_digest(nodes, edges))}
+    if n <= CLOSURE_MAX_NODES:
+        with metrics.span("closure", records=n):
+            arrays["fwd_comp"], arrays["fwd_reach"] = closure_rows(n, fwd_ptr, fwd_idx)
+            arrays["rev_comp"], arrays["rev_reach"] = closure_rows(n, rev_ptr, rev_idx)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(tmp, **arrays)
+    tmp.replace(path)
+
+class CitationGraph:
+    """
+    Query side: node selection by key prefix, direct and transitive neighbours in either direction.
+    """
+    def __init__(self, nodes, labels, arrays):
+        self.nodes = nodes
+        self.labels = labels
+        self.a = arrays
+        self.order = sorted(range(len(nodes)), key=nodes.__getitem__)
+        self.sorted_keys = [nodes[i] for i in self.order]
+
+    @classmethod
+    def load(cls, graph: Path = GRAPH, index: Path = INDEX, library_sha: str = None):
+        """
+        None when the files are missing, the .npz was built from another graph JSON, or (with
+        library_sha) the graph was built from another library.
+        """
+        try:
+            data = json.loads(graph.read_text(encoding="utf-8"))
+            with np.load(index, allow_pickle=False) as z:
+                arrays = {k: z[k] for k in z.files}
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        if "graph_sha256" not in arrays or str(arrays["graph_sha256"]) != graph_digest(data["nodes"], data["edges"]):
+            return None
+        if len(arrays["fwd_indptr"]) - 1 != len(data["nodes"]):
+            return None
+        if library_sha is not None and data["source_sha256"] != library_sha:
+            return None
+        labels = {(s, t): text for s, t, text in data["edges"]}
+        return cls(data["nodes"], labels, arrays)
+
+    def select(self, key: str):
+        """
+        Nodes whose key is `key` or starts with `key` + "|" (an instrument, article or paragraph).
+        """
+        lo = bisect.bisect_left(self.sorted_keys, key)
+        hi = bisect.bisect_left(self.sorted_keys, key + "|\U0010ffff")
+        return sorted(self.order[k] for k in range(lo, hi)
+                      if self.sorted_keys[k] == key or self.sorted_keys[k].startswith(key + "|"))
+
+    def _neighbours(self, side, nodes, transitive):
+        nodes = np.asarray(nodes, dtype=np.int64)
+        ptr, idx = self.a[f"{side}_indptr"], self.a[f"{side}_indices"]
+        if not len(nodes):
+            return []
+        if not transitive:
+            hits = np.concatenate([idx[ptr[u]:ptr[u + 1]] for u in nodes.tolist()] or [np.zeros(0, np.int32)])
+            return np.unique(hits).tolist()
+        if f"{side}_reach" in self.a:
+            row = np.bitwise_or.reduce(self.a[f"{side}_reach"][self.a[f"{side}_comp"][nodes]], axis=0)
+            return np.flatnonzero(np.unpackbits(row)[:len(self.nodes)]).tolist()
+        seen = np.zeros(len(self.nodes), dtype=bool)
+        frontier = nodes
+        while len(frontier):
+            nxt = np.concatenate([idx[ptr[u]:ptr[u + 1]] for u in frontier.tolist()] or [np.zeros(0, np.int32)])
+            nxt = np.unique(nxt[~seen[nxt]])
+            seen[nxt] = True
+            frontier = nxt
+        return np.flatnonzero(seen).tolist()
+
+    def cites(self, nodes, transitive=False):
+        return self._neighbours("fwd", nodes, transitive)
+
+    def cited_by(self, nodes, transitive=False):
+        return self._neighbours("rev", nodes, transitive)
+
+def main():
+    ap = argparse.ArgumentParser(description="Query the citation graph written by 08_build_citation_graph.py.")
+    ap.add_argument("--cites", metavar="KEY", help="what these requirements cite (req_id or prefix)")
+    ap.add_argument("--cited-by", metavar="KEY", help="what cites these provisions, e.g. DORA_2022_2554|28")
+    ap.add_argument("--transitive", action="store_true", help="follow citations of citations")
+    ap.add_argument("--other-instruments", action="store_true",
+                    help="only results from another instrument than KEY's (e.g. RTS implementing a DORA article)")
+    args = ap.parse_args()
+    if not (args.cites or args.cited_by):
+        ap.error("one of --cites / --cited-by is required")
+
+    graph = CitationGraph.load()
+    if graph is None:
+        raise SystemExit(f"{GRAPH} / {INDEX} missing or out of sync; run 08_build_citation_graph.py")
+    key = args.cites or args.cited_by
+    start = graph.select(key)
+    hits = graph.cites(start, args.transitive) if args.cites else graph.cited_by(start, args.transitive)
+    code = key.split("|")[0]
+    for j in hits:
+        node = graph.nodes[j]
+        if args.other_instruments and node.split("|")[0] == code:
+            continue
+        # direct edge label, if one of the start nodes is its other end
+        edge = (lambda s: (j, s) if args.cited_by else (s, j))
+        label = next((graph.labels[edge(s)] for s in start if edge(s) in graph.labels), "")
+        print(f"{node}\t{label}" if label else node)
+
+if __name__ == "__main__":
+    main()
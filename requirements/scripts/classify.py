@@ -0,0 +1,128 @@
+import re, yaml
+from pathlib import Path
+
+# Keyword / topic tag / evidence classification for 04, driven by config/classification_rules.yml.
+#
+# Keywords: all match terms of a language are compiled into one trie-shaped regex inside a
+# lookahead, so a single left-to-right pass reports the longest term starting at every
+# position (overlaps included); a prefix table then adds the shorter terms that start there
+# too. The pass costs O(len(text) x trie depth), independent of the number of terms.
+#
+# Tags / evidence: rules are indexed by (instrument_code, article), with None as wildcard,
+# so a lookup is at most four dict probes instead of a walk over if-chains. A rule with neither
+# instruments nor articles is a catch-all and matches everything.
+
+RULES = Path("requirements/config/classification_rules.yml")
+EVIDENCE_TYPES = Path("requirements/config/evidence_types.yml")
+
+def trie_regex(terms):
+    """
+    Alternation of `terms` factored by common prefix, e.g. (?:informationsregister|reg(?:ister)?|v(?:ertrag|orfall)).
+    Matches the longest term starting at the current position.
+    """
+    trie = {}
+    for t in terms:
+        node = trie
+        for ch in t:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            # the term may stop here; greedy ? still prefers the longer terms
+            body = (f"(?:{body})" if len(branches) == 1 else body) + "?"
+        return body
+
+    return build(trie)
+
+class KeywordMatcher:
+    def __init__(self, rules):
+        # term -> indexes of the rules it triggers
+        self.rules_of = {}
+        self.emit = []
+        for k, rule in enumerate(rules):
+            self.emit.append(list(rule["emit"]))
+            for term in rule["match"]:
+                self.rules_of.setdefault(term.lower(), set()).add(k)
+        terms = sorted(self.rules_of)
+        self.pattern = re.compile(f"(?=({trie_regex(terms)}))") if terms else None
+        # longest match -> every vocabulary term that is a prefix of it (itself included)
+        known = set(terms)
+        self.prefixes = {t: [t[:i] for i in range(1, len(t) + 1) if t[:i] in known] for t in terms}
+
+    def terms_in(self, text: str):
+        found = set()
+        if self.pattern is None:
+            return found
+        for m in self.pattern.finditer(text.lower()):
+            found.update(self.prefixes[m.group(1)])
+        return found
+
+    def keywords(self, text: str):
+        rules = set()
+        for term in self.terms_in(text or ""):
+            rules |= self.rules_of[term]
+        return sorted({kw for k in rules for kw in self.emit[k]})
+
+class RuleIndex:
+    """
+    (instrument_code, article) -> payloads of matching rules, in rule order.
+    A rule with only instruments is stored under (instrument, None), only articles under (None, article),
+    neither under (None, None).
+    """
+    def __init__(self, rules):
+        self.index = {}
+        for order, rule in enumerate(rules):
+            instruments = rule.get("instruments") or [None]
+            articles = rule.get("articles") or [None]
+            for inst in instruments:
+                for art in articles:
+                    self.index.setdefault((inst, art), []).append((order, rule))
+
+    def match(self, instrument_code, article):
+        hits = []
+        keys = ((instrument_code, article), (instrument_code, None), (None, article), (None, None))
+        for key in dict.fromkeys(keys):
+            hits += self.index.get(key, ())
+        return [rule for _, rule in sorted(hits, key=lambda h: h[0])]
+
+class Classifier:
+    def __init__(self, cfg, allowed_evidence=None):
+        self.keyword_matchers = {lang: KeywordMatcher(rules) for lang, rules in cfg["keywords"].items()}
+        self.always_tags = list(cfg["topic_tags"].get("always", []))
+        self.tag_rules = RuleIndex(cfg["topic_tags"]["rules"])
+        self.evidence_rules = RuleIndex(cfg["evidence"]["rules"])
+        self.evidence_default = cfg["evidence"]["default"]
+        if allowed_evidence is not None:
+            for rule in cfg["evidence"]["rules"] + [self.evidence_default]:
+                for t in rule["primary"] + rule["supporting"]:
+                    if t not in allowed_evidence:
+                        raise ValueError(f"{RULES}: unknown evidence type {t}")
+
+    def keywords(self, text: str, lang: str):
+        matcher = self.keyword_matchers.get(lang)
+        return matcher.keywords(text) if matcher else []
+
+    def topic_tags(self, instrument_code: str, article):
+        tags = list(self.always_tags)
+        for rule in self.tag_rules.match(instrument_code, article):
+            tags += rule["tags"]
+        return sorted(set(tags))
+
+    def evidence(self, instrument_code: str, article):
+        rules = self.evidence_rules.match(instrument_code, article)
+        rule = rules[0] if rules else self.evidence_default
+        return list(rule["primary"]), list(rule["supporting"])
+
+def load_classifier(rules: Path = RULES, evidence_types: Path = EVIDENCE_TYPES):
+    cfg = yaml.safe_load(rules.read_text(encoding="utf-8"))
+    allowed = None
+    if evidence_types.exists():
+        ev = yaml.safe_load(evidence_types.read_text(encoding="utf-8"))
+        allowed = {e["code"] for e in ev["evidence_types"]}
+    return Classifier(cfg, allowed)
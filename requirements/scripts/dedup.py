@@ -0,0 +1,241 @@
+import json, re
+from pathlib import Path
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+import metrics
+
+# Near-duplicate clusters in the requirements library (RTS/ITS boilerplate, consolidated
+# versions that differ by a few words). 05 writes them next to the library, 06 reads them:
+#
+#   requirements/library/dedup_clusters__v0_1.json
+#
+#   clusters = dedup.cluster(reqs)              # [{"canonical_req_id", "members": [...]}]
+#   dups = dedup.load_clusters(library_sha256)  # canonical req_id -> duplicate req_ids
+#
+# Every requirement's EN text (leading paragraph / point number stripped) becomes a set of
+# word SHINGLE-grams, summarized by a NUM_PERM MinHash signature. LSH banding (BANDS bands of
+# ROWS rows) proposes candidate pairs: requirements sharing a band bucket are linked to the
+# bucket's first member, so a bucket of n costs n - 1 pairs, not n^2 / 2. Candidates whose
+# estimated Jaccard similarity (share of equal signature rows) reaches THRESHOLD are kept,
+# and the connected components of those pairs are the clusters. Each cluster names one
+# canonical requirement (has DE, then longest EN, then library order); 06 maps questions to
+# the canonical ones only and lists the duplicates next to them.
+
+VERSION = "v0_1"
+CLUSTERS = Path(f"requirements/library/dedup_clusters__{VERSION}.json")
+
+SHINGLE = 3
+NUM_PERM = 128
+BANDS, ROWS = 20, 6          # candidate probability 1 - (1 - J^ROWS)^BANDS: 0.998 at J = 0.8
+THRESHOLD = 0.8
+SEED = 2554
+BLOCK = 1 << 12              # shingles per minhash block (NUM_PERM x BLOCK uint32 stays in cache)
+
+LEAD_NO_PAT = re.compile(r"^\s*(?:\(\s*\w{1,4}\s*\)|\d+\.)\s+")
+CHUNK_BYTES = 1 << 22        # UTF-8 text tokenized per numpy pass
+
+# word bytes: ASCII letters, digits, "_" and UTF-8 multi-byte characters, except the ones
+# shingles() masks out (U+0080..U+00BF and the U+2000..U+206F punctuation block)
+WORD_BYTE = np.zeros(256, dtype=bool)
+for lo, hi in ((b"0", b"9"), (b"A", b"Z"), (b"a", b"z"), (b"_", b"_"), (b"\x80", b"\xff")):
+    WORD_BYTE[lo[0]:hi[0] + 1] = True
+POLY = 0x100000001B3         # odd, so invertible mod 2^64
+POLY_INV = pow(POLY, -1, 1 << 64)
+SHINGLE_MUL = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+
+def mix64(x):
+    """
+    splitmix64 finalizer on a uint64 array (wrapping arithmetic).
+    """
+    with np.errstate(over="ignore"):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+_powers = {}
+
+def powers(base, n):
+    """
+    base^0 .. base^(n-1) mod 2^64, from a cached table grown as needed.
+    """
+    p = _powers.get(base)
+    if p is None or len(p) < n:
+        p = np.full(max(n, CHUNK_BYTES), base, dtype=np.uint64)
+        p[0] = 1
+        p = _powers[base] = np.cumprod(p)
+    return p[:n]
+
+def token_hashes(buf: bytes):
+    """
+    (hashes, byte starts) of the words in `buf`. A word's hash is its polynomial hash over
+    bytes, read off one prefix-sum array: (C[end] - C[start]) * POLY^-start.
+    """
+    b = np.frombuffer(buf, dtype=np.uint8)
+    word = WORD_BYTE[b]
+    c2 = np.flatnonzero(b[:-1] == 0xC2)
+    word[c2] = word[c2 + 1] = False
+    e2 = np.flatnonzero((b[:-2] == 0xE2) & ((b[1:-1] & 0xFE) == 0x80))
+    word[e2] = word[e2 + 1] = word[e2 + 2] = False
+    edge = np.diff(np.concatenate(([False], word, [False])).astype(np.int8))
+    start, end = np.flatnonzero(edge == 1), np.flatnonzero(edge == -1)
+
+    c = np.zeros(len(b) + 1, dtype=np.uint64)
+    np.cumsum(b * powers(POLY, len(b)), out=c[1:])
+    h = (c[end] - c[start]) * powers(POLY_INV, len(b))[start]
+    return mix64(h + (end - start).astype(np.uint64)), start
+
+def shingles(texts):
+    """
+    (hashes, offsets): uint64 hashes of every text's word SHINGLE-grams, text i owning
+    hashes[offsets[i]:offsets[i + 1]]. A text of n words has n shingles (the last SHINGLE - 1
+    run past its end and are shorter); an empty text has none.
+    """
+    enc = [LEAD_NO_PAT.sub("", t or "", count=1).lower().replace("\xa0", " ").encode("utf-8") for t in texts]
+    size = np.fromiter(map(len, enc), dtype=np.int64, count=len(enc)) + 1
+    text_start = np.cumsum(size) - size
+    buf = memoryview(b"\n".join(enc))
+
+    # chunks of whole texts, about CHUNK_BYTES each
+    cuts = np.searchsorted(text_start, np.arange(0, len(buf), CHUNK_BYTES))
+    bounds = sorted(set(cuts.tolist()) | {len(enc)})
+    hashes, starts = [np.zeros(0, dtype=np.uint64)], [np.zeros(0, dtype=np.int64)]
+    for lo, hi in zip(bounds, bounds[1:]):
+        first = text_start[lo]
+        h, start = token_hashes(buf[first:text_start[hi] - 1 if hi < len(enc) else len(buf)])
+        hashes.append(h)
+        starts.append(start + first)
+    tok = np.concatenate(hashes)
+    owner = np.searchsorted(text_start, np.concatenate(starts), side="right") - 1
+
+    # shingle = mix(sum of SHINGLE consecutive word hashes times distinct odd constants)
+    h = tok * np.uint64(SHINGLE_MUL[0])
+    idx = np.arange(len(tok))
+    for k in range(1, SHINGLE):
+        j = np.minimum(idx + k, max(len(tok) - 1, 0))
+        same = (idx + k < len(tok)) & (owner[j] == owner)
+        h += np.where(same, tok[j], np.uint64(k)) * np.uint64(SHINGLE_MUL[k])
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(owner, minlength=len(texts)))))
+    return mix64(h), offsets
+
+def minhash(hashes, offsets, num_perm=NUM_PERM, seed=SEED):
+    """
+    len(offsets) - 1 x num_perm uint32 signatures. Permutation p maps the top 32 bits x of a
+    shingle hash to a_p * x + b_p mod 2^32 (a_p odd, so a bijection). Texts without shingles
+    get all-max rows.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint32) | np.uint32(1)
+    b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint32)
+    x32 = (hashes >> np.uint64(32)).astype(np.uint32)
+    n = len(offsets) - 1
+    sig = np.full((n, num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+    has = np.flatnonzero(np.diff(offsets) > 0)
+    if not len(has):
+        return sig
+
+    # blocks of whole texts, about BLOCK shingles each
+    cuts = np.searchsorted(offsets[has], np.arange(0, offsets[-1], BLOCK), side="left")
+    bounds = sorted(set(cuts.tolist()) | {len(has)})
+    for lo, hi in zip(bounds, bounds[1:]):
+        docs = has[lo:hi]
+        first, last = offsets[docs[0]], offsets[docs[-1] + 1]
+        perm = a[:, None] * x32[None, first:last]
+        perm += b[:, None]
+        sig[docs] = np.minimum.reduceat(perm, offsets[docs] - first, axis=1).T
+    return sig
+
+def candidate_pairs(sig, bands=BANDS, rows=ROWS):
+    """
+    Unique (i, j) pairs, i < j, of rows sharing a bucket in at least one band; every bucket
+    member is paired with the bucket's first row only.
+    """
+    n = len(sig)
+    pairs = []
+    for band in range(bands):
+        block = sig[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        key = np.full(n, np.uint64(band))
+        for c in range(rows):
+            key = mix64(key ^ block[:, c])
+        order = np.argsort(key, kind="stable")
+        k = key[order]
+        new = np.concatenate(([True], k[1:] != k[:-1]))
+        head = order[np.maximum.accumulate(np.where(new, np.arange(n), 0))]
+        member = ~new
+        pairs.append(np.stack([head[member], order[member]], axis=1))
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.sort(np.concatenate(pairs), axis=1)
+    code = np.unique(pairs[:, 0] * n + pairs[:, 1])
+    return np.stack([code // n, code % n], axis=1)
+
+def similarity(sig, pairs, chunk=BLOCK // 16):
+    """
+    Estimated Jaccard similarity (share of equal signature rows) of each pair.
+    """
+    out = np.empty(len(pairs), dtype=np.float32)
+    for lo in range(0, len(pairs), chunk):
+        p = pairs[lo:lo + chunk]
+        out[lo:lo + chunk] = (sig[p[:, 0]] == sig[p[:, 1]]).mean(axis=1)
+    return out
+
+def cluster(reqs, threshold=THRESHOLD):
+    """
+    Near-duplicate clusters of `reqs` (two members or more), each
+    {"canonical_req_id", "members": [{"req_id", "similarity"}]} with the canonical excluded
+    from members. Clusters follow library order of their canonical requirement.
+    """
+    if not reqs:
+        return []
+    texts = [r.get("text_en") or "" for r in reqs]
+    with metrics.span("shingle", records=len(reqs)) as sp:
+        hashes, offsets = shingles(texts)
+        sp["shingles"] = len(hashes)
+    with metrics.span("minhash", records=len(reqs)):
+        sig = minhash(hashes, offsets)
+    with metrics.span("lsh", records=len(reqs)) as sp:
+        empty = np.diff(offsets) == 0
+        pairs = candidate_pairs(sig)
+        pairs = pairs[~(empty[pairs[:, 0]] | empty[pairs[:, 1]])]
+        sim = similarity(sig, pairs)
+        pairs = pairs[sim >= threshold]
+        sp["candidates"] = len(sim)
+        sp["pairs"] = len(pairs)
+
+    n = len(reqs)
+    graph = sparse.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+    _, label = connected_components(graph, directed=False)
+    sizes = np.bincount(label, minlength=n)
+
+    # canonical = first member by (has DE, longest EN, library order)
+    idx = np.flatnonzero(sizes[label] > 1)
+    if not len(idx):
+        return []
+    has_de = np.array([bool(reqs[i].get("has_de")) for i in idx])
+    length = np.array([len(texts[i]) for i in idx])
+    idx = idx[np.lexsort((idx, -length, ~has_de, label[idx]))]
+    lab = label[idx]
+    head = np.concatenate(([True], lab[1:] != lab[:-1]))
+    canon = idx[np.maximum.accumulate(np.where(head, np.arange(len(idx)), 0))]
+    sims = similarity(sig, np.stack([canon, idx], axis=1))
+
+    clusters = {}
+    for c, i, sim in zip(canon.tolist(), idx.tolist(), sims.tolist()):
+        members = clusters.setdefault(c, [])
+        if i != c:
+            members.append((i, {"req_id": reqs[i]["req_id"], "similarity": round(sim, 3)}))
+    return [{"canonical_req_id": reqs[c]["req_id"], "members": [m for _, m in sorted(clusters[c])]}
+            for c in sorted(clusters)]
+
+def load_clusters(req_sha: str, path: Path = CLUSTERS):
+    """
+    canonical req_id -> duplicate req_ids, from the clusters 05 wrote for the library with
+    this sha256; None when missing or stale.
+    """
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+    if data.get("source_sha256") != req_sha:
+        return None
+    return {c["canonical_req_id"]: [m["req_id"] for m in c["members"]] for c in data["clusters"]}
@@ -0,0 +1,246 @@
+import hashlib, json, yaml, argparse
+from pathlib import Path
+import numpy as np
+import pipeline_io
+
+# Evidence coverage of the audit question map: which evidence types a question requires
+# that none of its linked requirements call for, and which requirements no question reaches.
+# 09 writes the report; the CLI answers the same questions for any library / map version:
+#
+#   python requirements/scripts/evidence_coverage.py                        # summary
+#   python requirements/scripts/evidence_coverage.py --question Q01
+#   python requirements/scripts/evidence_coverage.py --gaps --workflow TPRM
+#   python requirements/scripts/evidence_coverage.py --orphans --instrument EU_2024_2956
+#   python requirements/scripts/evidence_coverage.py --library /tmp/old.jsonl --map /tmp/old_map.jsonl
+#
+# Evidence types and topic tags are bitsets (one row of uint64 words per question /
+# requirement, bit k = k-th code), the question -> requirement links a CSR pair (indptr,
+# indices). A question's evidence is one bitwise_or.reduceat over its linked rows; gaps,
+# rollups and orphan lists are masks and column sums over those arrays, no per-item loops.
+#
+# Per question and required evidence type:
+#   primary      a linked requirement lists it in primary_evidence_types
+#   supporting   only in supporting_evidence_types
+#   gap          no linked requirement lists it
+# Links are related_req_ids plus their related_duplicates (near-duplicates 06 did not score).
+
+VERSION = "v0_1"
+LIBRARY = Path(f"requirements/library/requirements__{VERSION}.jsonl")
+QUESTION_MAP = Path(f"requirements/library/audit_question_map__{VERSION}.jsonl")
+EVIDENCE_TYPES = Path("requirements/config/evidence_types.yml")
+REPORT = Path(f"requirements/library/evidence_coverage__{VERSION}.json")
+MATRIX = REPORT.with_suffix(".csv")
+
+# -------------------------
+# Bitsets
+# -------------------------
+
+def bitsets(item_lists, codes):
+    """
+    len(item_lists) x ceil(len(codes) / 64) uint64, bit k set where the row lists codes[k].
+    Items that are not in `codes` are ignored.
+    """
+    col = {c: k for k, c in enumerate(codes)}
+    pairs = [(i, col[x]) for i, items in enumerate(item_lists) for x in items if x in col]
+    out = np.zeros((len(item_lists), max(1, (len(codes) + 63) // 64)), dtype=np.uint64)
+    if pairs:
+        rows, cols = np.array(pairs, dtype=np.int64).T
+        np.bitwise_or.at(out, (rows, cols >> 6), np.left_shift(np.uint64(1), (cols & 63).astype(np.uint64)))
+    return out
+
+def unpack(bits, n: int):
+    """
+    rows x n bool matrix of the first n bits.
+    """
+    return np.unpackbits(bits.astype("<u8").view(np.uint8), axis=1, bitorder="little")[:, :n].astype(bool)
+
+def codes_of(row, codes):
+    return [codes[k] for k in np.flatnonzero(unpack(row[None, :], len(codes))[0])]
+
+def or_reduce(bits, indptr, indices):
+    """
+    Per CSR row: OR of bits[indices[indptr[i]:indptr[i + 1]]] (zero for rows without links).
+    """
+    out = np.zeros((len(indptr) - 1, bits.shape[1]), dtype=np.uint64)
+    nonempty = np.diff(indptr) > 0
+    if nonempty.any():
+        out[nonempty] = np.bitwise_or.reduceat(bits[indices], indptr[:-1][nonempty], axis=0)
+    return out
+
+# -------------------------
+# Coverage
+# -------------------------
+
+def links(questions, req_pos):
+    """
+    CSR (indptr, indices) of each question's linked requirement positions, and the number of
+    linked req_ids missing from the library (07 reports them as dangling links).
+    """
+    indptr, indices, dangling = [0], [], 0
+    for q in questions:
+        ids = list(q["related_req_ids"])
+        for rid in q["related_req_ids"]:
+            ids += q.get("related_duplicates", {}).get(rid, [])
+        row = {req_pos[rid] for rid in ids if rid in req_pos}
+        dangling += len(set(ids)) - len(row)
+        indices += sorted(row)
+        indptr.append(len(indices))
+    return np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int64), dangling
+
+class Coverage:
+    """
+    Bitsets and derived masks of one (library, question map) pair.
+    """
+    def __init__(self, questions, reqs, evidence_codes):
+        self.questions = questions
+        self.reqs = reqs
+        self.ev = list(evidence_codes)
+        self.tags = sorted({t for r in reqs for t in r["topic_tags"]})
+        self.question_ids = np.array([q["question_id"] for q in questions], dtype=object)
+        self.workflows = np.array([q["workflow"] for q in questions], dtype=object)
+        self.req_ids = np.array([r["req_id"] for r in reqs], dtype=object)
+        self.instruments = np.array([r["instrument_code"] for r in reqs], dtype=object)
+
+        self.required = bitsets([q["required_evidence_types"] for q in questions], self.ev)
+        self.req_primary = bitsets([r["primary_evidence_types"] for r in reqs], self.ev)
+        self.req_supporting = bitsets([r["supporting_evidence_types"] for r in reqs], self.ev)
+        self.req_tags = bitsets([r["topic_tags"] for r in reqs], self.tags)
+        self.indptr, self.indices, self.dangling = links(questions, {rid: j for j, rid in enumerate(self.req_ids)})
+
+        primary = or_reduce(self.req_primary, self.indptr, self.indices)
+        supporting = or_reduce(self.req_supporting, self.indptr, self.indices)
+        self.covered = self.required & primary
+        self.supported_only = self.required & supporting & ~primary
+        self.gaps = self.required & ~(primary | supporting)
+        self.linked_tags = or_reduce(self.req_tags, self.indptr, self.indices)
+        self.reached = np.zeros(len(reqs), dtype=bool)
+        self.reached[self.indices] = True
+
+    def question_rows(self, mask=None):
+        mask = np.ones(len(self.questions), dtype=bool) if mask is None else mask
+        out = []
+        for i in np.flatnonzero(mask):
+            out.append({
+                "question_id": self.question_ids[i],
+                "workflow": self.workflows[i],
+                "linked_requirements": int(self.indptr[i + 1] - self.indptr[i]),
+                "required": codes_of(self.required[i], self.ev),
+                "primary": codes_of(self.covered[i], self.ev),
+                "supporting_only": codes_of(self.supported_only[i], self.ev),
+                "gaps": codes_of(self.gaps[i], self.ev),
+                "linked_topic_tags": codes_of(self.linked_tags[i], self.tags),
+            })
+        return out
+
+    def has_gaps(self):
+        return (self.gaps != 0).any(axis=1)
+
+    def evidence_rows(self):
+        n = len(self.ev)
+        cols = {
+            "required_by_questions": unpack(self.required, n).sum(axis=0),
+            "primary_in_questions": unpack(self.covered, n).sum(axis=0),
+            "supporting_only_in_questions": unpack(self.supported_only, n).sum(axis=0),
+            "gap_in_questions": unpack(self.gaps, n).sum(axis=0),
+            "primary_in_requirements": unpack(self.req_primary, n).sum(axis=0),
+            "supporting_in_requirements": unpack(self.req_supporting, n).sum(axis=0),
+            "primary_in_orphan_requirements": unpack(self.req_primary[~self.reached], n).sum(axis=0),
+        }
+        return [dict({"code": c}, **{name: int(v[k]) for name, v in cols.items()}) for k, c in enumerate(self.ev)]
+
+    def workflow_rows(self):
+        out = {}
+        for wf in sorted(set(self.workflows)):
+            mask = self.workflows == wf
+            rows = np.flatnonzero(mask)
+            linked = np.unique(np.concatenate([self.indices[self.indptr[i]:self.indptr[i + 1]] for i in rows]))
+            gaps = unpack(self.gaps[mask], len(self.ev)).sum(axis=0)
+            tags = unpack(self.req_tags[linked], len(self.tags)).sum(axis=0) if len(linked) else np.zeros(len(self.tags))
+            out[wf] = {
+                "questions": int(mask.sum()),
+                "fully_covered": int((~self.has_gaps()[mask]).sum()),
+                "linked_requirements": int(len(linked)),
+                "gaps_by_evidence_type": {c: int(n) for c, n in zip(self.ev, gaps) if n},
+                "linked_requirements_by_topic_tag": {t: int(n) for t, n in zip(self.tags, tags) if n},
+            }
+        return out
+
+    def orphans(self, instrument=None):
+        mask = ~self.reached
+        if instrument:
+            mask &= self.instruments == instrument
+        return self.req_ids[mask].tolist()
+
+    def orphan_counts(self):
+        names, counts = np.unique(self.instruments[~self.reached], return_counts=True)
+        by_tag = unpack(self.req_tags[~self.reached], len(self.tags)).sum(axis=0)
+        return ({n: int(c) for n, c in zip(names, counts)},
+                {t: int(n) for t, n in zip(self.tags, by_tag) if n})
+
+    def summary(self):
+        return {
+            "questions": len(self.questions),
+            "requirements": len(self.reqs),
+            "evidence_types": len(self.ev),
+            "links": int(len(self.indices)),
+            "dangling_links": self.dangling,
+            "questions_fully_covered": int((~self.has_gaps()).sum()),
+            "questions_with_gaps": int(self.has_gaps().sum()),
+            "gaps": int(unpack(self.gaps, len(self.ev)).sum()),
+            "orphan_requirements": int((~self.reached).sum()),
+        }
+
+    def matrix_rows(self):
+        """
+        Question x evidence type cells: "primary", "supporting", "gap" or "" (not required).
+        """
+        n = len(self.ev)
+        cells = np.full((len(self.questions), n), "", dtype=object)
+        cells[unpack(self.covered, n)] = "primary"
+        cells[unpack(self.supported_only, n)] = "supporting"
+        cells[unpack(self.gaps, n)] = "gap"
+        return [[qid, wf] + row for qid, wf, row in zip(self.question_ids, self.workflows, cells.tolist())]
+
+def evidence_codes(path: Path = EVIDENCE_TYPES):
+    return [e["code"] for e in yaml.safe_load(path.read_text(encoding="utf-8"))["evidence_types"]]
+
+def load(library: Path = LIBRARY, question_map: Path = QUESTION_MAP, evidence_types: Path = EVIDENCE_TYPES, shas=None):
+    """
+    Coverage of a library / question map pair; fills `shas` (a dict) with the sha256 of both files.
+    """
+    lib_sha, map_sha = hashlib.sha256(), hashlib.sha256()
+    reqs = pipeline_io.load_jsonl(library, pipeline_io.Requirement, sha=lib_sha)
+    questions = pipeline_io.load_jsonl(question_map, sha=map_sha)
+    if shas is not None:
+        shas.update(library=lib_sha.hexdigest(), question_map=map_sha.hexdigest())
+    return Coverage(questions, reqs, evidence_codes(evidence_types))
+
+def main():
+    ap = argparse.ArgumentParser(description="Evidence coverage and gaps of the audit question map.")
+    ap.add_argument("--library", type=Path, default=LIBRARY)
+    ap.add_argument("--map", type=Path, default=QUESTION_MAP, help="audit question map built from --library")
+    ap.add_argument("--question", action="append", default=[], help="coverage of this question (repeatable)")
+    ap.add_argument("--workflow", help="restrict --gaps to one workflow; alone: its rollup")
+    ap.add_argument("--gaps", action="store_true", help="questions with at least one uncovered evidence type")
+    ap.add_argument("--orphans", action="store_true", help="requirements no question links to")
+    ap.add_argument("--instrument", help="restrict --orphans to one instrument")
+    args = ap.parse_args()
+
+    cov = load(args.library, args.map)
+    if args.question:
+        for row in cov.question_rows(np.isin(cov.question_ids, args.question)):
+            print(json.dumps(row, ensure_ascii=False))
+    elif args.gaps:
+        mask = cov.has_gaps() & ((cov.workflows == args.workflow) if args.workflow else True)
+        for row in cov.question_rows(mask):
+            print(f"{row['question_id']}\t{row['workflow']}\t{' '.join(row['gaps'])}")
+    elif args.orphans:
+        for rid in cov.orphans(args.instrument):
+            print(rid)
+    elif args.workflow:
+        print(json.dumps(cov.workflow_rows().get(args.workflow), ensure_ascii=False, indent=2))
+    else:
+        print(json.dumps(cov.summary(), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import bisect, hashlib, json, mmap, re, shutil, argparse
+from pathlib import Path
+import pipeline_io
+
+# Random access to the JSONL artifacts. Next to each combined file (still the input of the
+# next stage), its writer keeps one shard per instrument_code plus a sidecar index:
+#
+#   requirements/library/requirements__v0_1.jsonl                      combined, sequential readers
+#   requirements/library/shards/requirements__v0_1/DORA_2022_2554.jsonl   one file per shard
+#   requirements/library/shards/requirements__v0_1.index.json          key -> (shard, offset, length)
+#
+# Index keys are sorted, so a lookup is a bisect and a key range is a slice; the record is
+# read from the mmapped shard at its offset, without parsing anything else.
+#
+#   store = JsonlStore.open(Path("requirements/library/requirements__v0_1.jsonl"))
+#   store.get("DORA_2022_2554|30|2|-|001")
+#   list(store.prefix("DORA_2022_2554|30|"))
+#
+#   python requirements/scripts/jsonl_store.py requirements/library/requirements__v0_1.jsonl --get "DORA_2022_2554|30|2|-|001"
+#   python requirements/scripts/jsonl_store.py requirements/extracted/segments__EN.jsonl --prefix "EU_2024_2956|Art. 3"
+
+SAFE_NAME = re.compile(r"[^\w.-]")
+
+def shard_dir(path: Path) -> Path:
+    return path.parent / "shards" / path.stem
+
+def index_path(path: Path) -> Path:
+    return path.parent / "shards" / f"{path.stem}.index.json"
+
+def shard_file(name: str) -> str:
+    """
+    File name of a shard. Names that need escaping get a hash suffix, so "EU/2024" and
+    "EU_2024" do not share a file.
+    """
+    safe = SAFE_NAME.sub("_", name)
+    if safe != name:
+        safe += "-" + hashlib.blake2b(name.encode("utf-8"), digest_size=4).hexdigest()
+    return f"{safe}.jsonl"
+
+def field_key(*fields):
+    """
+    Key function joining record fields with "|", e.g. field_key("instrument_code", "legal_ref").
+    """
+    return lambda r: "|".join(str(r[f]) for f in fields)
+
+class ShardedWriter:
+    """
+    Writes `path` and, in the same pass, its shards and index. `key` and `shard_by` are field
+    names or functions of the record (`key_name` documents a key function in the index).
+    Every file is opened once; records go to the shard of their `shard_by` value in arrival order.
+    Shards are written to a temporary directory; on a clean exit it replaces the shard directory,
+    then the index and the combined file replace theirs (pipeline_io.temp_path). `meta` (a JSON
+    object, e.g. the inputs the file was built from) is kept in the index, see index_meta().
+    """
+    def __init__(self, path: Path, key, shard_by="instrument_code", key_name=None, meta=None):
+        self.path = path
+        self.meta = meta
+        self.key = key if callable(key) else (lambda r, f=key: r[f])
+        self.shard_by = shard_by if callable(shard_by) else (lambda r, f=shard_by: r[f])
+        self.key_name = key_name or (key if isinstance(key, str) else "key")
+        self.shard_no, self.shards, self.handles, self.sizes, self.entries = {}, [], [], [], []
+        self.files = set()
+        self.count = 0
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir = pipeline_io.temp_path(shard_dir(self.path))
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        self.tmp_dir.mkdir(parents=True)
+        self.out = pipeline_io.temp_path(self.path).open("wb", buffering=pipeline_io.BUFFER)
+        return self
+
+    def write(self, rec):
+        line = pipeline_io.dumps(rec)
+        self.out.write(line)
+        name = str(self.shard_by(rec))
+        no = self.shard_no.get(name)
+        if no is None:
+            file = shard_file(name)
+            if file in self.files:
+                raise ValueError(f"shard {name!r} maps to {file}, which another shard of {self.path} already uses")
+            self.files.add(file)
+            no = self.shard_no[name] = len(self.shards)
+            self.shards.append(name)
+            self.sizes.append(0)
+            self.handles.append((self.tmp_dir / file).open("wb", buffering=pipeline_io.BUFFER))
+        self.handles[no].write(line)
+        self.entries.append((str(self.key(rec)), no, self.sizes[no], len(line)))
+        self.sizes[no] += len(line)
+        self.count += 1
+
+    def __exit__(self, *exc):
+        self.out.close()
+        for f in self.handles:
+            f.close()
+        if exc[0] is not None:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            pipeline_io.temp_path(self.path).unlink(missing_ok=True)
+        else:
+            self.entries.sort(key=lambda e: e[0])
+            index = {
+                "key": self.key_name,
+                "records": self.count,
+                "shards": [{"name": s, "path": f"{self.path.stem}/{shard_file(s)}", "bytes": n}
+                           for s, n in zip(self.shards, self.sizes)],
+                "keys": [e[0] for e in self.entries],
+                "locations": [list(e[1:]) for e in self.entries],
+            }
+            if self.meta is not None:
+                index["meta"] = self.meta
+            old = shard_dir(self.path).with_name(shard_dir(self.path).name + ".old")
+            shutil.rmtree(old, ignore_errors=True)
+            if shard_dir(self.path).exists():
+                shard_dir(self.path).rename(old)
+            self.tmp_dir.rename(shard_dir(self.path))
+            shutil.rmtree(old, ignore_errors=True)
+            pipeline_io.write_text(index_path(self.path), json.dumps(index, ensure_ascii=False, separators=(",", ":")))
+            pipeline_io.temp_path(self.path).replace(self.path)
+        return False
+
+def index_meta(path: Path):
+    """
+    The `meta` the writer of the combined JSONL `path` recorded, or None when the index is
+    missing, has none, or does not describe the current file (its shards add up to another size).
+    """
+    try:
+        index = pipeline_io.loads(index_path(path).read_bytes())
+        size = path.stat().st_size
+    except (FileNotFoundError, ValueError):
+        return None
+    if sum(s["bytes"] for s in index["shards"]) != size:
+        return None
+    return index.get("meta")
+
+class JsonlStore:
+    """
+    Reader over the shards and index written by ShardedWriter; shards are mmapped on first use.
+    """
+    def __init__(self, index: Path):
+        self.index_file = index
+        meta = pipeline_io.loads(index.read_bytes())
+        self.key = meta["key"]
+        self.shards = meta["shards"]
+        self.keys = meta["keys"]
+        self.locations = meta["locations"]
+        self.stamp = None
+        self._maps = {}
+
+    _opened = {}
+
+    @classmethod
+    def open(cls, path: Path):
+        """
+        Store of the combined JSONL `path` (its index must exist). The parsed index is shared by
+        every open() of the same, unchanged index file, so per-request opens do not re-read it;
+        the store of a replaced index is closed.
+        """
+        index = index_path(path)
+        st = index.stat()
+        stamp = (str(index.resolve()), st.st_size, st.st_mtime_ns)
+        store = cls._opened.get(stamp[0])
+        if store is None or store.stamp != stamp:
+            if store is not None:
+                store.close()
+            store = cls._opened[stamp[0]] = cls(index)
+            store.stamp = stamp
+        return store
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _map(self, no):
+        mm = self._maps.get(no)
+        if mm is None:
+            with (self.index_file.parent / self.shards[no]["path"]).open("rb") as f:
+                mm = self._maps[no] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mm
+
+    def _read(self, i):
+        no, offset, length = self.locations[i]
+        return pipeline_io.loads(self._map(no)[offset:offset + length])
+
+    def get(self, key):
+        """
+        The first record with this key (write order), or None.
+        """
+        i = bisect.bisect_left(self.keys, key)
+        return self._read(i) if i < len(self.keys) and self.keys[i] == key else None
+
+    def get_all(self, key):
+        lo, hi = bisect.bisect_left(self.keys, key), bisect.bisect_right(self.keys, key)
+        return [self._read(i) for i in range(lo, hi)]
+
+    def range(self, lo=None, hi=None):
+        """
+        Records with lo <= key < hi in key order (None: unbounded).
+        """
+        a = 0 if lo is None else bisect.bisect_left(self.keys, lo)
+        b = len(self.keys) if hi is None else bisect.bisect_left(self.keys, hi)
+        for i in range(a, b):
+            yield self._read(i)
+
+    def prefix(self, p: str):
+        return self.range(p, p + "\U0010ffff")
+
+    def shard(self, name):
+        """
+        All records of one shard in write order (sequential read of that file only).
+        """
+        for s in self.shards:
+            if s["name"] == name:
+                yield from pipeline_io.iter_jsonl(self.index_file.parent / s["path"])
+                return
+        raise KeyError(name)
+
+    def close(self):
+        for mm in self._maps.values():
+            mm.close()
+        self._maps.clear()
+
+def main():
+    ap = argparse.ArgumentParser(description="Fetch records of a sharded JSONL artifact by key.")
+    ap.add_argument("path", type=Path, help="the combined JSONL file, e.g. requirements/library/requirements__v0_1.jsonl")
+    ap.add_argument("--get", action="append", default=[], help="exact key (repeatable)")
+    ap.add_argument("--prefix", help="all keys starting with this")
+    ap.add_argument("--range", nargs=2, metavar=("LO", "HI"), help="keys in [LO, HI)")
+    ap.add_argument("--shard", help="every record of this shard (instrument_code)")
+    args = ap.parse_args()
+
+    store = JsonlStore.open(args.path)
+    missing = []
+    if args.shard:
+        names = [s["name"] for s in store.shards]
+        if args.shard not in names:
+            raise SystemExit(f"No shard {args.shard!r} in {args.path} (shards: {', '.join(names)})")
+        recs = store.shard(args.shard)
+    elif args.prefix is not None:
+        recs = store.prefix(args.prefix)
+    elif args.range:
+        recs = store.range(*args.range)
+    else:
+        missing = [k for k in args.get if store.get(k) is None]
+        recs = (store.get(k) for k in args.get if k not in missing)
+    for rec in recs:
+        print(json.dumps(rec, ensure_ascii=False))
+    if missing:
+        raise SystemExit(f"Not found in {args.path}: {', '.join(missing)}")
+
+if __name__ == "__main__":
+    main()
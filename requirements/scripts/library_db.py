@@ -0,0 +1,266 @@
+import json, os, re, sqlite3, time, argparse
+from pathlib import Path
+
+# SQLite copy of the library for point lookups and full-text search:
+#
+#   requirements/library/library__v0_1.sqlite
+#
+# 04 (re)creates the file with the requirement tables; 06 adds the audit questions and their
+# ranked requirement links. Each writer builds in one transaction with executemany and creates
+# the indexes after the bulk insert. Readers open it read-only with a shared mmap, so several
+# worker processes serve lookups from the same page cache.
+#
+#   python requirements/scripts/library_db.py --req-id "DORA_2022_2554|30|2|-|001"
+#   python requirements/scripts/library_db.py --search "Unterauftrag*" --tag TPRM
+#   python requirements/scripts/library_db.py --question Q10
+
+VERSION = "v0_1"
+DB = Path(f"requirements/library/library__{VERSION}.sqlite")
+MMAP_BYTES = 256 * 1024 * 1024
+
+REQUIREMENTS_SQL = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE requirements (
+    id INTEGER PRIMARY KEY,
+    req_id TEXT NOT NULL,
+    instrument_code TEXT NOT NULL,
+    legal_ref TEXT NOT NULL,
+    article INTEGER,
+    paragraph INTEGER,
+    point TEXT,
+    text_en TEXT NOT NULL,
+    text_de TEXT NOT NULL,
+    has_de INTEGER NOT NULL,
+    source_sha256_en TEXT,
+    source_sha256_de TEXT
+);
+CREATE TABLE requirement_tags (req INTEGER NOT NULL REFERENCES requirements(id), tag TEXT NOT NULL);
+CREATE TABLE requirement_evidence (
+    req INTEGER NOT NULL REFERENCES requirements(id),
+    evidence_type TEXT NOT NULL,
+    role TEXT NOT NULL CHECK (role IN ('primary', 'supporting'))
+);
+CREATE TABLE requirement_keywords (req INTEGER NOT NULL REFERENCES requirements(id), lang TEXT NOT NULL, keyword TEXT NOT NULL);
+CREATE VIRTUAL TABLE requirements_fts USING fts5(
+    text_en, text_de, content='requirements', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+REQUIREMENTS_INDEXES = """
+CREATE UNIQUE INDEX requirements_req_id ON requirements(req_id);
+CREATE INDEX requirements_ref ON requirements(instrument_code, article, paragraph);
+CREATE INDEX requirements_legal_ref ON requirements(legal_ref);
+CREATE INDEX requirement_tags_tag ON requirement_tags(tag, req);
+CREATE INDEX requirement_tags_req ON requirement_tags(req);
+CREATE INDEX requirement_evidence_type ON requirement_evidence(evidence_type, req);
+CREATE INDEX requirement_evidence_req ON requirement_evidence(req);
+CREATE INDEX requirement_keywords_kw ON requirement_keywords(keyword, req);
+"""
+
+QUESTIONS_SQL = """
+DROP TABLE IF EXISTS question_requirements;
+DROP TABLE IF EXISTS question_evidence;
+DROP TABLE IF EXISTS audit_questions;
+CREATE TABLE audit_questions (
+    id INTEGER PRIMARY KEY,
+    question_id TEXT NOT NULL,
+    workflow TEXT NOT NULL,
+    text_de TEXT NOT NULL,
+    text_en TEXT NOT NULL
+);
+CREATE TABLE question_evidence (question INTEGER NOT NULL REFERENCES audit_questions(id), evidence_type TEXT NOT NULL);
+CREATE TABLE question_requirements (
+    question INTEGER NOT NULL REFERENCES audit_questions(id),
+    req INTEGER NOT NULL REFERENCES requirements(id),
+    rank INTEGER NOT NULL,
+    score REAL
+);
+"""
+
+QUESTIONS_INDEXES = """
+CREATE UNIQUE INDEX audit_questions_qid ON audit_questions(question_id);
+CREATE INDEX question_evidence_type ON question_evidence(evidence_type, question);
+CREATE INDEX question_requirements_q ON question_requirements(question, rank);
+CREATE INDEX question_requirements_req ON question_requirements(req);
+"""
+
+def parse_ref(legal_ref: str):
+    # same pattern as 04's parse_ref; kept here so readers need not import a numbered script
+    m = re.match(r"Art\.?\s*(\d+)\((\d+)\)(?:\(([a-z])\))?$", (legal_ref or "").strip())
+    return (int(m.group(1)), int(m.group(2)), m.group(3)) if m else (None, None, None)
+
+def _execute_script(con, sql):
+    # executescript() would COMMIT first; run statement by statement inside our transaction
+    for stmt in sql.split(";"):
+        if stmt.strip():
+            con.execute(stmt)
+
+def _bulk_connect(path: Path):
+    con = sqlite3.connect(path, isolation_level=None)
+    # bulk build: no journal / fsync, the file is swapped in (04) or rebuilt (06) on failure
+    con.execute("PRAGMA synchronous = OFF")
+    con.execute("PRAGMA foreign_keys = OFF")
+    return con
+
+def write_requirements(reqs, path: Path = DB, source_sha256: str = ""):
+    """
+    Creates the database from scratch next to `path` and atomically replaces it.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".sqlite.tmp")
+    tmp.unlink(missing_ok=True)
+    con = _bulk_connect(tmp)
+    try:
+        con.execute("PRAGMA journal_mode = OFF")
+        con.execute("BEGIN")
+        _execute_script(con, REQUIREMENTS_SQL)
+        con.executemany("INSERT INTO meta VALUES (?, ?)",
+                        [("version", VERSION), ("requirements_sha256", source_sha256),
+                         ("built_utc", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))])
+        con.executemany(
+            "INSERT INTO requirements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((i, r["req_id"], r["instrument_code"], r["legal_ref"], *parse_ref(r["legal_ref"]),
+              r["text_en"], r["text_de"], int(bool(r["has_de"])), r["source_sha256_en"], r["source_sha256_de"])
+             for i, r in enumerate(reqs, 1)))
+        con.executemany("INSERT INTO requirement_tags VALUES (?, ?)",
+                        ((i, t) for i, r in enumerate(reqs, 1) for t in r["topic_tags"]))
+        con.executemany("INSERT INTO requirement_evidence VALUES (?, ?, ?)",
+                        ((i, t, role) for i, r in enumerate(reqs, 1)
+                         for role in ("primary", "supporting") for t in r[f"{role}_evidence_types"]))
+        con.executemany("INSERT INTO requirement_keywords VALUES (?, ?, ?)",
+                        ((i, lang, k) for i, r in enumerate(reqs, 1)
+                         for lang in ("en", "de") for k in r[f"keywords_{lang}"]))
+        con.execute("INSERT INTO requirements_fts(requirements_fts) VALUES ('rebuild')")
+        _execute_script(con, REQUIREMENTS_INDEXES)
+        con.execute("COMMIT")
+        con.execute("ANALYZE")
+        con.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        con.close()
+    os.replace(tmp, path)
+
+def write_questions(mapped, path: Path = DB):
+    """
+    Replaces the audit question tables with 06's mapping, in one transaction.
+    Links whose req_id is not in the requirements table raise (IntegrityError).
+    """
+    con = _bulk_connect(path)
+    try:
+        con.execute("BEGIN")
+        _execute_script(con, QUESTIONS_SQL)
+        rowid = dict(con.execute("SELECT req_id, id FROM requirements"))
+        con.executemany("INSERT INTO audit_questions VALUES (?, ?, ?, ?, ?)",
+                        ((i, q["question_id"], q["workflow"], q["text_de"], q["text_en"])
+                         for i, q in enumerate(mapped, 1)))
+        con.executemany("INSERT INTO question_evidence VALUES (?, ?)",
+                        ((i, t) for i, q in enumerate(mapped, 1) for t in q["required_evidence_types"]))
+        links = []
+        for i, q in enumerate(mapped, 1):
+            scores = q.get("related_scores") or [None] * len(q["related_req_ids"])
+            for rank, (rid, score) in enumerate(zip(q["related_req_ids"], scores), 1):
+                if rid not in rowid:
+                    raise sqlite3.IntegrityError(f"{q['question_id']} links unknown req_id {rid}")
+                links.append((i, rowid[rid], rank, score))
+        con.executemany("INSERT INTO question_requirements VALUES (?, ?, ?, ?)", links)
+        _execute_script(con, QUESTIONS_INDEXES)
+        con.execute("COMMIT")
+        con.execute("ANALYZE")
+    except BaseException:
+        if con.in_transaction:
+            con.execute("ROLLBACK")
+        raise
+    finally:
+        con.close()
+
+def db_meta(path: Path = DB):
+    if not path.exists():
+        return {}
+    con = connect(path)
+    try:
+        return dict(con.execute("SELECT key, value FROM meta"))
+    except sqlite3.DatabaseError:
+        return {}
+    finally:
+        con.close()
+
+def connect(path: Path = DB):
+    """
+    Read-only connection for lookups; pages are mmap'ed and shared between processes.
+    """
+    con = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    con.execute(f"PRAGMA mmap_size = {MMAP_BYTES}")
+    con.execute("PRAGMA query_only = ON")
+    con.row_factory = sqlite3.Row
+    return con
+
+REQ_COLUMNS = "r.id, r.req_id, r.instrument_code, r.legal_ref, r.text_en, r.text_de"
+
+def lookup(con, req_id=None, legal_ref=None, instrument=None, tag=None, evidence=None, search=None, limit=20):
+    """
+    Requirements matching every given criterion; full-text matches are ranked by bm25.
+    Raises ValueError for a `search` that is not valid FTS5 query syntax.
+    """
+    where, params = [], []
+    if req_id:
+        where.append("r.req_id = ?"); params.append(req_id)
+    if legal_ref:
+        where.append("r.legal_ref = ?"); params.append(legal_ref)
+    if instrument:
+        where.append("r.instrument_code = ?"); params.append(instrument)
+    if tag:
+        where.append("r.id IN (SELECT req FROM requirement_tags WHERE tag = ?)"); params.append(tag)
+    if evidence:
+        where.append("r.id IN (SELECT req FROM requirement_evidence WHERE evidence_type = ?)"); params.append(evidence)
+    if search:
+        sql = (f"SELECT {REQ_COLUMNS}, bm25(requirements_fts) AS score FROM requirements_fts "
+               f"JOIN requirements r ON r.id = requirements_fts.rowid WHERE requirements_fts MATCH ?")
+        params.insert(0, search)
+        sql += "".join(f" AND {w}" for w in where) + " ORDER BY score"
+    else:
+        sql = f"SELECT {REQ_COLUMNS} FROM requirements r" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY r.id"
+    try:
+        return con.execute(sql + " LIMIT ?", params + [limit]).fetchall()
+    except sqlite3.OperationalError as e:
+        if not search:
+            raise
+        raise ValueError(f"invalid full-text query {search!r}: {e}") from None
+
+def question_links(con, question_id):
+    return con.execute(
+        "SELECT q.question_id, l.rank, l.score, r.req_id, r.legal_ref FROM audit_questions q "
+        "JOIN question_requirements l ON l.question = q.id JOIN requirements r ON r.id = l.req "
+        "WHERE q.question_id = ? ORDER BY l.rank", (question_id,)).fetchall()
+
+def main():
+    ap = argparse.ArgumentParser(description="Look up requirements / audit questions in the SQLite library.")
+    ap.add_argument("--req-id")
+    ap.add_argument("--legal-ref")
+    ap.add_argument("--instrument")
+    ap.add_argument("--tag")
+    ap.add_argument("--evidence")
+    ap.add_argument("--search", help="FTS5 query over text_en/text_de, e.g. 'subcontract*'")
+    ap.add_argument("--question", help="print the ranked requirements linked to this question_id")
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--db", type=Path, default=DB)
+    args = ap.parse_args()
+
+    con = connect(args.db)
+    t0 = time.perf_counter()
+    if args.question:
+        rows = question_links(con, args.question)
+        dt = time.perf_counter() - t0
+        for row in rows:
+            print(f"{row['rank']:3d}  {row['score'] or 0:7.4f}  {row['req_id']:32s} {row['legal_ref']}")
+    else:
+        try:
+            rows = lookup(con, args.req_id, args.legal_ref, args.instrument, args.tag, args.evidence,
+                          args.search, args.limit)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        dt = time.perf_counter() - t0
+        for row in rows:
+            print(json.dumps({k: row[k] for k in row.keys() if k != "id"}, ensure_ascii=False))
+    print(f"{len(rows)} row(s) in {1e6 * dt:.0f} us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import hashlib, json, re, unicodedata, argparse
+from pathlib import Path
+import pipeline_io
+
+# Diff of two requirements library versions, keyed by req_id:
+#
+#   python requirements/scripts/library_diff.py OLD.jsonl NEW.jsonl --out requirements/.cache/library_diff.json
+#   git show HEAD:requirements/library/requirements__v0_1.jsonl > /tmp/old.jsonl   # last committed version
+#
+# Each version is streamed once. The old one is reduced to req_id -> (text hash, meta hash),
+# so memory is two digests per requirement, not the library. A requirement is
+#   changed       when the hash of its normalized text_en / text_de differs
+#   reclassified  when only the fields 06 scores on (tags, evidence types, legal_ref) differ
+# Source hashes and keywords are ignored: a re-downloaded EUR-Lex file changes every
+# source_sha256, but only the paragraphs whose wording changed are reported.
+#
+# 06 and 07 take the result with --changes and redo only the affected questions / checks.
+
+WS_RE = re.compile(r"\s+")
+META_FIELDS = ("instrument_code", "legal_ref", "topic_tags", "primary_evidence_types", "supporting_evidence_types")
+
+def normalize(text: str) -> str:
+    return WS_RE.sub(" ", unicodedata.normalize("NFC", text or "")).strip()
+
+def content_hash(req) -> str:
+    """
+    Digest of the normalized EN and DE text.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(normalize(req.get("text_en")).encode("utf-8"))
+    h.update(b"\0")
+    h.update(normalize(req.get("text_de")).encode("utf-8"))
+    return h.hexdigest()
+
+def meta_hash(req) -> str:
+    meta = [req.get(k) for k in META_FIELDS]
+    return hashlib.blake2b(json.dumps(meta, ensure_ascii=False).encode("utf-8"), digest_size=16).hexdigest()
+
+def iter_library(path: Path, sha=None):
+    """
+    Yields the requirements of a library JSONL line by line; feeds the raw bytes to `sha` if given.
+    """
+    return pipeline_io.iter_jsonl(path, sha=sha)
+
+def diff_libraries(old: Path, new: Path):
+    """
+    {"added", "removed", "changed", "reclassified"} req_id lists (added / changed / reclassified
+    in new library order, removed in old order), plus counts and the sha256 of both files.
+    """
+    old_sha, new_sha = hashlib.sha256(), hashlib.sha256()
+    before = {r["req_id"]: (content_hash(r), meta_hash(r)) for r in iter_library(old, old_sha)}
+    added, changed, reclassified = [], [], []
+    seen = set()
+    for r in iter_library(new, new_sha):
+        rid = r["req_id"]
+        seen.add(rid)
+        prev = before.get(rid)
+        if prev is None:
+            added.append(rid)
+        elif prev[0] != content_hash(r):
+            changed.append(rid)
+        elif prev[1] != meta_hash(r):
+            reclassified.append(rid)
+    removed = [rid for rid in before if rid not in seen]
+    touched = len(added) + len(changed) + len(reclassified)
+    return {
+        "old": str(old),
+        "new": str(new),
+        "old_sha256": old_sha.hexdigest(),
+        "new_sha256": new_sha.hexdigest(),
+        "counts": {"old": len(before), "new": len(seen), "added": len(added), "removed": len(removed),
+                   "changed": len(changed), "reclassified": len(reclassified),
+                   "unchanged": len(seen) - touched},
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+        "reclassified": reclassified,
+    }
+
+def load_changes(path: Path, library_sha: str):
+    """
+    A diff written by this module, checked to end at the library with sha256 `library_sha`.
+    """
+    diff = json.loads(path.read_text(encoding="utf-8"))
+    if diff.get("new_sha256") != library_sha:
+        raise ValueError(f"{path} diffs against another library version (new_sha256 {diff.get('new_sha256')}, "
+                         f"library {library_sha}); recompute it with library_diff.py")
+    return diff
+
+def main():
+    ap = argparse.ArgumentParser(description="Diff two requirements library versions by req_id and content hash.")
+    ap.add_argument("old", type=Path)
+    ap.add_argument("new", type=Path)
+    ap.add_argument("--out", type=Path, help="write the diff as JSON (for 06 / 07 --changes)")
+    args = ap.parse_args()
+
+    diff = diff_libraries(args.old, args.new)
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(diff, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(json.dumps(diff["counts"]))
+    for kind in ("added", "removed", "changed", "reclassified"):
+        for rid in diff[kind][:20]:
+            print(f"{kind:13s} {rid}")
+        if len(diff[kind]) > 20:
+            print(f"{kind:13s} ... {len(diff[kind]) - 20} more")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import json, time, argparse
+from pathlib import Path
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Columnar copy of the requirements library, written by 04 next to the JSONL:
+#
+#   requirements/library/requirements__v0_1.parquet
+#
+# List fields are real list columns, instrument_code and the tag / evidence values are
+# dictionary-encoded, and every row group carries min/max statistics. Rows keep library
+# order, which is grouped by instrument, so instrument filters skip whole row groups.
+#
+#   from library_table import load_library
+#   t = load_library(columns=["req_id", "text_de"], tag=["INCIDENT"])
+#
+#   python requirements/scripts/library_table.py --tag INCIDENT --columns req_id,text_de
+
+VERSION = "v0_1"
+PARQUET = Path(f"requirements/library/requirements__{VERSION}.parquet")
+ROW_GROUP_SIZE = 4096
+
+LABEL = pa.dictionary(pa.int32(), pa.string())
+SCHEMA = pa.schema([
+    ("req_id", pa.string()),
+    ("instrument_code", LABEL),
+    ("legal_ref", pa.string()),
+    ("text_en", pa.string()),
+    ("text_de", pa.string()),
+    ("has_de", pa.bool_()),
+    ("topic_tags", pa.list_(LABEL)),
+    ("primary_evidence_types", pa.list_(LABEL)),
+    ("supporting_evidence_types", pa.list_(LABEL)),
+    ("keywords_en", pa.list_(pa.string())),
+    ("keywords_de", pa.list_(pa.string())),
+    ("source_sha256_en", pa.string()),
+    ("source_sha256_de", pa.string()),
+])
+
+# list-column predicates: value must be in any of these columns
+LIST_FILTERS = {
+    "tag": ("topic_tags",),
+    "evidence": ("primary_evidence_types", "supporting_evidence_types"),
+}
+
+def write_library(reqs, out: Path = PARQUET, source_sha256: str = ""):
+    """
+    Writes the library as Parquet (zstd, dictionary pages, row-group statistics).
+    `source_sha256` of the JSONL goes into the schema metadata, so readers can detect a stale copy.
+    """
+    cols = {f.name: [r[f.name] for r in reqs] for f in SCHEMA}
+    table = pa.table({f.name: pa.array(cols[f.name], type=f.type) for f in SCHEMA}, schema=SCHEMA)
+    table = table.replace_schema_metadata({"version": VERSION, "source_sha256": source_sha256})
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(".parquet.tmp")
+    pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE, compression="zstd",
+                   use_dictionary=True, write_statistics=True)
+    tmp.replace(out)
+    return table
+
+def contains_any(list_col, values):
+    """
+    Boolean mask: row's list contains one of `values` (pyarrow has no list_contains here).
+    """
+    flat = pc.list_flatten(list_col)
+    if pa.types.is_dictionary(flat.type):
+        flat = flat.cast(pa.string())
+    hits = pc.list_parent_indices(list_col).filter(pc.is_in(flat, value_set=pa.array(values, pa.string())))
+    mask = np.zeros(len(list_col), dtype=bool)
+    mask[hits.to_numpy()] = True
+    return pa.array(mask)
+
+def load_library(path: Path = PARQUET, columns=None, instrument=None, tag=None, evidence=None):
+    """
+    Memory-mapped read returning a pyarrow.Table with only `columns` (default: all).
+    instrument is pushed down to the Parquet reader (row groups whose statistics exclude
+    it are not read); tag / evidence are list predicates, applied after reading just the
+    projected columns plus the list columns they need.
+    """
+    wanted = list(columns) if columns else SCHEMA.names
+    preds = {k: v for k, v in (("tag", tag), ("evidence", evidence)) if v}
+    read_cols = list(dict.fromkeys(wanted + [c for k in preds for c in LIST_FILTERS[k]]))
+    filters = [("instrument_code", "in", list(instrument))] if instrument else None
+
+    table = pq.read_table(path, columns=read_cols, filters=filters, memory_map=True)
+    if preds:
+        mask = None
+        for k, values in preds.items():
+            m = None
+            for col in LIST_FILTERS[k]:
+                cm = contains_any(table.column(col).combine_chunks(), values)
+                m = cm if m is None else pc.or_(m, cm)
+            mask = m if mask is None else pc.and_(mask, m)
+        table = table.filter(mask)
+    return table.select(wanted)
+
+def library_metadata(path: Path = PARQUET):
+    meta = pq.read_schema(path, memory_map=True).metadata or {}
+    return {k.decode(): v.decode() for k, v in meta.items()}
+
+def main():
+    ap = argparse.ArgumentParser(description="Load (a projection of) the Parquet requirements library.")
+    ap.add_argument("--columns", help="comma-separated columns (default: all)")
+    ap.add_argument("--instrument", action="append", help="instrument_code (repeat for OR)")
+    ap.add_argument("--tag", action="append", help="topic tag (repeat for OR)")
+    ap.add_argument("--evidence", action="append", help="primary or supporting evidence type (repeat for OR)")
+    ap.add_argument("--head", type=int, default=5, help="rows to print as JSON")
+    ap.add_argument("--path", type=Path, default=PARQUET)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    table = load_library(args.path, args.columns.split(",") if args.columns else None,
+                         instrument=args.instrument, tag=args.tag, evidence=args.evidence)
+    dt = time.perf_counter() - t0
+    for rec in table.slice(0, args.head).to_pylist():
+        print(json.dumps(rec, ensure_ascii=False))
+    print(f"{table.num_rows} rows x {table.num_columns} columns in {1000 * dt:.1f} ms "
+          f"({table.nbytes / 1e6:.2f} MB in memory)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import cProfile, json, os, sys, threading, time, tracemalloc, uuid, argparse, datetime
+from collections import defaultdict
+from pathlib import Path
+
+# Opt-in run metrics for the pipeline stages. Disabled unless PIPELINE_METRICS is set:
+#
+#   PIPELINE_METRICS=requirements/.cache/metrics.jsonl   append one JSON line per span
+#   PIPELINE_TRACEMALLOC=1                               add allocation peaks (slower)
+#   PIPELINE_PROFILE=requirements/.cache/profiles        dump a cProfile file per stage process
+#
+#   with metrics.span("parse", doc="DORA_2022_2554/en", bytes=n) as sp:
+#       ...
+#       sp["records"] = len(segments)
+#
+# When disabled, span() returns a shared no-op object, so instrumented code pays one global check.
+# Summaries: python requirements/scripts/metrics.py requirements/.cache/metrics.jsonl
+
+METRICS_PATH = os.environ.get("PIPELINE_METRICS", "")
+ENABLED = bool(METRICS_PATH)
+TRACE_ALLOC = ENABLED and os.environ.get("PIPELINE_TRACEMALLOC", "") not in ("", "0")
+PROFILE_DIR = os.environ.get("PIPELINE_PROFILE", "")
+
+_local = threading.local()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setitem__(self, key, value):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def _stack():
+    st = getattr(_local, "stack", None)
+    if st is None:
+        st = _local.stack = []
+    return st
+
+
+def _write(rec):
+    line = json.dumps(rec, ensure_ascii=False) + "\n"
+    # one O_APPEND write per record: safe across worker processes and threads
+    fd = os.open(METRICS_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+class Span(dict):
+    def __init__(self, name, fields):
+        super().__init__(fields)
+        self.name = name
+
+    def __enter__(self):
+        stack = _stack()
+        if TRACE_ALLOC and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].alloc_peak = max(stack[-1].alloc_peak, peak)
+            tracemalloc.reset_peak()
+            self.alloc_start, self.alloc_peak = current, current
+        self.depth = len(stack)
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.t0 = time.perf_counter()
+        self.c0 = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.t0
+        cpu = time.thread_time() - self.c0
+        stack = _stack()
+        stack.pop()
+        rec = {
+            "run": os.environ.get("PIPELINE_RUN_ID", ""),
+            "stage": os.environ.get("PIPELINE_STAGE", ""),
+            "pid": os.getpid(),
+            "span": self.name,
+            "parent": self.parent,
+            "depth": self.depth,
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+        }
+        if TRACE_ALLOC and tracemalloc.is_tracing():
+            peak = max(self.alloc_peak, tracemalloc.get_traced_memory()[1])
+            rec["alloc_peak_kb"] = round((peak - self.alloc_start) / 1024, 1)
+            if stack:
+                stack[-1].alloc_peak = max(stack[-1].alloc_peak, peak)
+        if exc_type is not None:
+            rec["error"] = exc_type.__name__
+        rec.update(self)
+        _write(rec)
+        return False
+
+
+def span(name, **fields):
+    if not ENABLED:
+        return NULL_SPAN
+    return Span(name, fields)
+
+
+class stage:
+    """
+    Wraps a stage's main(): a top-level span plus optional tracemalloc / cProfile.
+    Exports PIPELINE_STAGE / PIPELINE_RUN_ID so worker processes tag their spans too.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if not (ENABLED or PROFILE_DIR):
+            return NULL_SPAN
+        os.environ["PIPELINE_STAGE"] = self.name
+        os.environ.setdefault("PIPELINE_RUN_ID", uuid.uuid4().hex[:12])
+        if TRACE_ALLOC:
+            tracemalloc.start()
+        self.profiler = None
+        if PROFILE_DIR:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.span = span("stage", argv=sys.argv[1:],
+                         started_utc=datetime.datetime.utcnow().isoformat(timespec="seconds"))
+        return self.span.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        if not (ENABLED or PROFILE_DIR):
+            return False
+        if self.profiler is not None:
+            self.profiler.disable()
+            Path(PROFILE_DIR).mkdir(parents=True, exist_ok=True)
+            out = Path(PROFILE_DIR) / f"{self.name}_{os.environ['PIPELINE_RUN_ID']}_{os.getpid()}.prof"
+            self.profiler.dump_stats(str(out))
+            self.span["profile"] = str(out)
+        if ENABLED:
+            import resource
+            own = resource.getrusage(resource.RUSAGE_SELF)
+            kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+            self.span["process_cpu_s"] = round(own.ru_utime + own.ru_stime + kids.ru_utime + kids.ru_stime, 6)
+            self.span["peak_rss_mb"] = round(max(own.ru_maxrss, kids.ru_maxrss) / 1024, 1)
+        self.span.__exit__(exc_type, exc, tb)
+        if TRACE_ALLOC:
+            tracemalloc.stop()
+        return False
+
+
+def summarize(path: Path, top: int):
+    rows = [json.loads(l) for l in path.read_text(encoding="utf-8").splitlines() if l.strip()]
+    runs = list(dict.fromkeys(r["run"] for r in rows))
+    print(f"{len(rows)} spans, {len(runs)} run(s); latest run {runs[-1] if runs else '-'}")
+    rows = [r for r in rows if runs and r["run"] == runs[-1]]
+
+    agg = defaultdict(lambda: [0, 0.0, 0.0, 0, 0.0])
+    for r in rows:
+        a = agg[(r["stage"], r["span"])]
+        a[0] += 1
+        a[1] += r["wall_s"]
+        a[2] += r["cpu_s"]
+        a[3] += r.get("bytes", 0) or 0
+        a[4] = max(a[4], r.get("alloc_peak_kb", 0) or 0)
+    print(f"\n{'stage':6s} {'span':24s} {'n':>5s} {'wall_s':>9s} {'cpu_s':>9s} {'MB':>8s} {'alloc_pk_kb':>12s}")
+    for (st, name), (n, wall, cpu, nbytes, alloc) in sorted(agg.items()):
+        print(f"{st:6s} {name:24s} {n:5d} {wall:9.4f} {cpu:9.4f} {nbytes / 1e6:8.2f} {alloc:12.1f}")
+
+    docs = [r for r in rows if r.get("doc")]
+    if docs:
+        print(f"\nSlowest document spans (top {top}):")
+        for r in sorted(docs, key=lambda r: -r["wall_s"])[:top]:
+            print(f"  {r['stage']:4s} {r['doc']:24s} {r['span']:20s} {r['wall_s']:9.4f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Summarize a PIPELINE_METRICS file.")
+    ap.add_argument("path", type=Path)
+    ap.add_argument("--top", type=int, default=10)
+    args = ap.parse_args()
+    summarize(args.path, args.top)
+
+if __name__ == "__main__":
+    main()
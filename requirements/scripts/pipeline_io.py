@@ -0,0 +1,258 @@
+import hashlib, importlib.util, json, sys, types
+from collections.abc import Mapping
+from dataclasses import dataclass, fields
+from pathlib import Path
+
+try:
+    import orjson   # optional, faster decoding; without it the stdlib json module is used
+except ImportError:
+    orjson = None
+
+# Shared I/O of the pipeline stages: JSONL codecs, streaming readers / batched writers,
+# compact record types and lazy imports of the heavy parsers.
+#
+#   for seg in pipeline_io.iter_jsonl(path, pipeline_io.Segment): ...
+#   reqs = pipeline_io.load_jsonl(LIBRARY, pipeline_io.Requirement, sha=hashlib.sha256())
+#   with pipeline_io.JsonlWriter(out) as w:
+#       w.write(rec)
+#   pdfplumber = pipeline_io.lazy_import("pdfplumber")   # loaded on first attribute access
+#
+# Writers publish atomically: lines go to "<name>.tmp" next to the target, which replaces the
+# target only when the writer exits without error, so a reader (serve_library.py, a stage
+# started by watch.py) sees either the old or the new file, never a partial one.
+#
+# Encoding: artifact lines are always byte-identical to json.dumps(rec, ensure_ascii=False)
+# (committed files and sha256 chains must not change with the installed backend); a shared
+# encoder object saves the per-call encoder that json.dumps builds for non-default options.
+# Decoding, and encoding of scratch files (compact=True), use orjson when it is installed.
+
+BUFFER = 1 << 20      # bytes of file buffering for readers and writers
+BATCH = 1024          # lines per write call of JsonlWriter
+
+# -------------------------
+# Records
+# -------------------------
+
+class Record(Mapping):
+    """
+    Base of the record types: fields live in __slots__ (no per-instance dict), yet a record
+    reads like the JSON object it came from (r["text"], r.get(...), dict(r)), so helpers
+    written against dicts take either. Fields listed in OPTIONAL are omitted while None.
+    """
+    __slots__ = ()
+    FIELDS = ()
+    _KEYS = frozenset()
+    OPTIONAL = frozenset()
+
+    def __getitem__(self, key):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None and key in self.OPTIONAL:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        for f in self.FIELDS:
+            if f not in self.OPTIONAL or getattr(self, f) is not None:
+                yield f
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        d = {f: getattr(self, f) for f in self.FIELDS}
+        for f in self.OPTIONAL:
+            if d[f] is None:
+                del d[f]
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**d)
+
+def record(cls):
+    """
+    Class decorator: slotted dataclass with FIELDS in declaration (= JSON key) order.
+    """
+    cls = dataclass(slots=True)(cls)
+    cls.FIELDS = tuple(f.name for f in fields(cls))
+    cls._KEYS = frozenset(cls.FIELDS)
+    return cls
+
+@record
+class Segment(Record):
+    """
+    One line of requirements/extracted/segments__{EN,DE}.jsonl (02).
+    """
+    instrument_code: str
+    lang: str
+    legal_ref: str
+    text: str
+    source_sha256: str = ""
+
+@record
+class BilingualRow(Record):
+    """
+    One line of requirements/extracted/bilingual_segments.jsonl (03). The legal_ref_de /
+    align_* fields are only present on rows paired by the content-based fallback.
+    """
+    OPTIONAL = frozenset({"legal_ref_de", "align_method", "align_confidence"})
+    instrument_code: str
+    legal_ref: str
+    text_en: str
+    text_de: str
+    source_sha256_en: str
+    source_sha256_de: str
+    has_de: bool
+    legal_ref_de: str = None
+    align_method: str = None
+    align_confidence: float = None
+
+@record
+class Requirement(Record):
+    """
+    One line of requirements/library/requirements__v0_1.jsonl (04).
+    """
+    req_id: str
+    instrument_code: str
+    legal_ref: str
+    text_en: str
+    text_de: str
+    has_de: bool
+    topic_tags: list
+    primary_evidence_types: list
+    supporting_evidence_types: list
+    keywords_en: list
+    keywords_de: list
+    source_sha256_en: str
+    source_sha256_de: str
+
+# -------------------------
+# JSONL codecs
+# -------------------------
+
+def _default(obj):
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, default=_default)
+_COMPACT = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+def dumps(rec) -> bytes:
+    """
+    One JSONL line (newline included), as json.dumps(rec, ensure_ascii=False) would write it.
+    """
+    return (_ENCODER.encode(rec) + "\n").encode("utf-8")
+
+if orjson is not None:
+    loads = orjson.loads
+
+    def dumps_compact(rec) -> bytes:
+        return orjson.dumps(rec, default=_default,
+                            option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_PASSTHROUGH_DATACLASS)
+else:
+    loads = json.loads
+
+    def dumps_compact(rec) -> bytes:
+        return (_COMPACT.encode(rec) + "\n").encode("utf-8")
+
+dumps_compact.__doc__ = "One JSONL line without whitespace, for scratch files that are read back by this module."
+
+def iter_jsonl(path: Path, record=None, sha=None):
+    """
+    Streams the records of a JSONL file (as `record` instances if given, else dicts),
+    skipping blank lines; every raw line, blank or not, is fed to `sha` if given.
+    """
+    with path.open("rb", buffering=BUFFER) as f:
+        for line in f:
+            if sha is not None:
+                sha.update(line)
+            if line.isspace():
+                continue
+            rec = loads(line)
+            yield rec if record is None else record.from_dict(rec)
+
+def load_jsonl(path: Path, record=None, sha=None):
+    return list(iter_jsonl(path, record, sha))
+
+def temp_path(path: Path) -> Path:
+    return path.with_name(path.name + ".tmp")
+
+def write_text(path: Path, text: str):
+    """
+    Atomic path.write_text(text, encoding="utf-8").
+    """
+    tmp = temp_path(path)
+    tmp.write_text(text, encoding="utf-8")
+    tmp.replace(path)
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb", buffering=0) as f:
+        for block in iter(lambda: f.read(BUFFER), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class JsonlWriter:
+    """
+    Writes records as JSONL, BATCH encoded lines per write call. compact=True for scratch files.
+    The file replaces `path` on a clean exit (see temp_path).
+    """
+    def __init__(self, path: Path, compact: bool = False, batch: int = BATCH):
+        self.path = path
+        self.encode = dumps_compact if compact else dumps
+        self.batch = batch
+        self.pending = []
+        self.count = 0
+
+    def __enter__(self):
+        self.f = temp_path(self.path).open("wb", buffering=BUFFER)
+        return self
+
+    def write(self, rec):
+        self.pending.append(self.encode(rec))
+        self.count += 1
+        if len(self.pending) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        self.f.write(b"".join(self.pending))
+        self.pending.clear()
+
+    def __exit__(self, *exc):
+        try:
+            self.flush()
+        finally:
+            self.f.close()
+        if exc[0] is None:
+            temp_path(self.path).replace(self.path)
+        else:
+            temp_path(self.path).unlink(missing_ok=True)
+        return False
+
+# -------------------------
+# Lazy imports
+# -------------------------
+
+class _Missing(types.ModuleType):
+    def __getattr__(self, attr):
+        raise ModuleNotFoundError(f"No module named {self.__name__!r} (needed for this input)", name=self.__name__)
+
+def lazy_import(name: str):
+    """
+    Module `name`, executed on first attribute access (importlib.util.LazyLoader), so a stage
+    only pays for e.g. pdfplumber when a PDF is actually parsed. A missing module fails on use.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return _Missing(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
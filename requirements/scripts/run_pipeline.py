@@ -0,0 +1,277 @@
+import hashlib, json, os, subprocess, sys, time, uuid, argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Incremental runner for the numbered stages. Run from the repo root:
+#   python requirements/scripts/run_pipeline.py            # only dirty stages
+#   python requirements/scripts/run_pipeline.py --force 02 # 02 and everything downstream
+#
+# A stage is dirty when the fingerprint of its code + input files differs from the last
+# successful run, or when one of its outputs is missing or was modified by hand.
+# Stages only rewrite outputs that changed (e.g. 01 keeps the manifest as is), so an
+# unchanged output stops the rebuild from propagating further down the DAG.
+# watch.py applies the same rules in a long-running process, on every source/config edit.
+
+SCRIPTS = Path("requirements/scripts")
+STATE = Path("requirements/.cache/pipeline_state.json")
+
+# modules imported by every stage; part of each stage's code fingerprint
+SHARED_CODE = ["metrics.py"]
+
+STAGES = {
+    "01": {
+        "script": "01_hash_sources.py",
+        "inputs": ["requirements/config/instruments.yml", "requirements/sources/*"],
+        "outputs": ["requirements/library/sources_manifest__v0_1.csv"],
+    },
+    "02": {
+        "script": "02_extract_segments.py",
+        "inputs": ["requirements/config/instruments.yml", "requirements/library/sources_manifest__v0_1.csv",
+                   "requirements/sources/*"],
+        "code": ["jsonl_store.py", "pipeline_io.py"],
+        "outputs": ["requirements/extracted/segments__EN.jsonl", "requirements/extracted/segments__DE.jsonl",
+                    "requirements/extracted/shards/segments__EN.index.json",
+                    "requirements/extracted/shards/segments__DE.index.json"],
+    },
+    "03": {
+        "script": "03_align_bilingual.py",
+        "inputs": ["requirements/extracted/segments__EN.jsonl", "requirements/extracted/segments__DE.jsonl"],
+        "code": ["jsonl_store.py", "pipeline_io.py"],
+        "outputs": ["requirements/extracted/bilingual_segments.jsonl",
+                    "requirements/extracted/bilingual_alignment_report.json",
+                    "requirements/extracted/shards/bilingual_segments.index.json"],
+    },
+    "04": {
+        "script": "04_build_requirements_library.py",
+        "inputs": ["requirements/extracted/bilingual_segments.jsonl", "requirements/config/classification_rules.yml",
+                   "requirements/config/evidence_types.yml"],
+        "code": ["search_index.py", "library_table.py", "library_db.py", "classify.py", "jsonl_store.py",
+                 "pipeline_io.py"],
+        "outputs": ["requirements/library/requirements__v0_1.jsonl", "requirements/library/requirements__v0_1.csv",
+                    "requirements/library/shards/requirements__v0_1.index.json",
+                    "requirements/library/requirements__v0_1.parquet",
+                    "requirements/library/search_index__v0_1.json", "requirements/library/search_index__v0_1.bin"],
+    },
+    "05": {
+        "script": "05_dedup_requirements.py",
+        "inputs": ["requirements/library/requirements__v0_1.jsonl"],
+        "code": ["dedup.py", "pipeline_io.py"],
+        "outputs": ["requirements/library/dedup_clusters__v0_1.json"],
+    },
+    "06": {
+        "script": "06_build_audit_question_map.py",
+        "inputs": ["requirements/config/audit_questions_de_en.yml", "requirements/library/requirements__v0_1.jsonl",
+                   "requirements/library/search_index__v0_1.json", "requirements/library/search_index__v0_1.bin",
+                   "requirements/library/dedup_clusters__v0_1.json"],
+        "code": ["search_index.py", "library_db.py", "dedup.py", "library_diff.py", "jsonl_store.py",
+                 "pipeline_io.py"],
+        # 04 creates the database and 06 completes it, so it is tracked as 06's output only
+        "outputs": ["requirements/library/audit_question_map__v0_1.jsonl", "requirements/library/library__v0_1.sqlite",
+                    "requirements/library/shards/audit_question_map__v0_1.index.json"],
+    },
+    "07": {
+        "script": "07_validate_qc.py",
+        "inputs": ["requirements/config/evidence_types.yml", "requirements/library/requirements__v0_1.jsonl",
+                   "requirements/library/audit_question_map__v0_1.jsonl",
+                   "requirements/library/sources_manifest__v0_1.csv"],
+        "code": ["library_diff.py", "pipeline_io.py"],
+        "outputs": ["requirements/library/qc_report__v0_1.json", "requirements/library/qc_findings__v0_1.jsonl"],
+    },
+    "08": {
+        "script": "08_build_citation_graph.py",
+        "inputs": ["requirements/library/requirements__v0_1.jsonl", "requirements/config/instruments.yml"],
+        "code": ["citations.py", "pipeline_io.py"],
+        "outputs": ["requirements/library/citation_graph__v0_1.json", "requirements/library/citation_graph__v0_1.npz"],
+    },
+    "09": {
+        "script": "09_evidence_coverage.py",
+        "inputs": ["requirements/library/requirements__v0_1.jsonl", "requirements/library/audit_question_map__v0_1.jsonl",
+                   "requirements/config/evidence_types.yml"],
+        "code": ["evidence_coverage.py", "pipeline_io.py"],
+        "outputs": ["requirements/library/evidence_coverage__v0_1.json", "requirements/library/evidence_coverage__v0_1.csv"],
+    },
+}
+
+
+def upstream(stages):
+    """
+    stage -> set of stages producing one of its inputs.
+    """
+    producer = {o: name for name, st in stages.items() for o in st["outputs"]}
+    return {name: {producer[i] for i in st["inputs"] if i in producer and producer[i] != name}
+            for name, st in stages.items()}
+
+
+def downstream_closure(names, deps):
+    out = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for name, ups in deps.items():
+            if name not in out and ups & out:
+                out.add(name)
+                changed = True
+    return out
+
+
+def expand(patterns):
+    paths = []
+    for pat in patterns:
+        if any(c in pat for c in "*?["):
+            paths += sorted(str(p) for p in Path(".").glob(pat) if p.is_file())
+        else:
+            paths.append(pat)
+    return paths
+
+
+class FileHasher:
+    """
+    Content sha256 with a (size, mtime_ns) memo persisted in the state file.
+    """
+    def __init__(self, memo):
+        self.memo = memo
+
+    def __call__(self, path: str):
+        p = Path(path)
+        if not p.exists():
+            return None
+        st = p.stat()
+        hit = self.memo.get(path)
+        if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+            return hit[2]
+        h = hashlib.sha256()
+        with p.open("rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        self.memo[path] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return self.memo[path][2]
+
+
+def fingerprint(stage, file_sha):
+    parts = [("code", file_sha(str(SCRIPTS / stage["script"])))]
+    parts += [(m, file_sha(str(SCRIPTS / m))) for m in SHARED_CODE + stage.get("code", [])]
+    parts += [(p, file_sha(p)) for p in expand(stage["inputs"])]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def outputs_intact(stage, recorded, file_sha):
+    return all(recorded.get(o) is not None and file_sha(o) == recorded.get(o) for o in stage["outputs"])
+
+
+def dirty_reason(name, state, file_sha, forced=()):
+    """
+    Why stage `name` has to run, or None when it is up to date.
+    """
+    rec = state["stages"].get(name)
+    if name in forced or rec is None:
+        return "forced" if name in forced else "never ran"
+    if rec["fingerprint"] != fingerprint(STAGES[name], file_sha):
+        return "inputs changed"
+    if not outputs_intact(STAGES[name], rec["outputs"], file_sha):
+        return "outputs missing or modified"
+    return None
+
+
+def record_run(state, name, fp, file_sha):
+    state["stages"][name] = {
+        "fingerprint": fp,
+        "outputs": {o: file_sha(o) for o in STAGES[name]["outputs"]},
+    }
+    save_state(state)
+
+
+def run_stage(name, stage, verbose):
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, str(SCRIPTS / stage["script"])],
+                          stdout=None if verbose else subprocess.PIPE,
+                          stderr=subprocess.STDOUT, text=True)
+    return proc.returncode, (proc.stdout or ""), time.perf_counter() - t0
+
+
+def load_state():
+    try:
+        return json.loads(STATE.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {"stages": {}, "files": {}}
+
+
+def save_state(state):
+    STATE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, STATE)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run the dirty pipeline stages, independent stages concurrently.")
+    ap.add_argument("--force", nargs="*", metavar="STAGE",
+                    help="rerun these stages (all if none given) and everything downstream")
+    ap.add_argument("--dry-run", action="store_true", help="only print which stages are dirty")
+    ap.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="max stages running at once")
+    ap.add_argument("-v", "--verbose", action="store_true", help="stream stage output")
+    ap.add_argument("--metrics", type=Path, help="append per-stage/per-document spans to this JSONL (see metrics.py)")
+    args = ap.parse_args()
+
+    if args.metrics:
+        # inherited by every stage process; one run id ties their spans together
+        os.environ["PIPELINE_METRICS"] = str(args.metrics.resolve())
+        os.environ["PIPELINE_RUN_ID"] = uuid.uuid4().hex[:12]
+        args.metrics.parent.mkdir(parents=True, exist_ok=True)
+
+    deps = upstream(STAGES)
+    forced = set()
+    if args.force is not None:
+        forced = downstream_closure(args.force or list(STAGES), deps)
+
+    state = load_state()
+    file_sha = FileHasher(state.setdefault("files", {}))
+    done, failed, dirty, running = set(), set(), set(), {}
+    ran = []
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as ex:
+        while len(done) + len(failed) < len(STAGES):
+            # schedule every stage whose upstream stages are finished
+            for name in STAGES:
+                if name in done or name in failed or name in running:
+                    continue
+                if deps[name] & failed:
+                    failed.add(name)
+                    print(f"[{name}] skipped (upstream failed)")
+                    continue
+                if not deps[name] <= done:
+                    continue
+                reason = "upstream dirty" if args.dry_run and deps[name] & dirty else dirty_reason(name, state, file_sha, forced)
+                if reason is None:
+                    done.add(name)
+                    print(f"[{name}] up to date")
+                elif args.dry_run:
+                    done.add(name)
+                    dirty.add(name)
+                    print(f"[{name}] dirty ({reason})")
+                else:
+                    print(f"[{name}] running {STAGES[name]['script']} ({reason})")
+                    fp = fingerprint(STAGES[name], file_sha)
+                    running[name] = (ex.submit(run_stage, name, STAGES[name], args.verbose), fp)
+            if not running:
+                continue
+            finished, _ = wait([f for f, _ in running.values()], return_when=FIRST_COMPLETED)
+            for name in [n for n, (f, _) in running.items() if f in finished]:
+                fut, fp = running.pop(name)
+                code, output, dt = fut.result()
+                if code != 0:
+                    failed.add(name)
+                    print(output, end="")
+                    print(f"[{name}] FAILED (exit {code}) after {dt:.2f}s")
+                    continue
+                record_run(state, name, fp, file_sha)
+                done.add(name)
+                ran.append(name)
+                print(f"[{name}] done in {dt:.2f}s")
+
+    save_state(state)
+    print(f"Ran {len(ran)} stage(s): {', '.join(ran) or '-'}")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+import array, json, math, mmap, os, re, sys, time, unicodedata, argparse
+from collections import Counter, defaultdict
+from functools import lru_cache
+from pathlib import Path
+
+# Bilingual full-text index over the requirements library, written by 04:
+#
+#   requirements/library/search_index__v0_1.json   header: vocabulary -> (df, offset), doc lengths, facets
+#   requirements/library/search_index__v0_1.bin    uint32 postings (doc ids, then tfs) + doc records
+#
+# The header is small (one entry per term); postings and doc records are read through mmap only
+# for the terms / hits a query touches, so query time does not grow with the library size.
+#
+#   python requirements/scripts/search_index.py Unterauftragsvergabe
+#   python requirements/scripts/search_index.py "subcontracting" --tag TPRM --evidence CONTRACT_CLAUSE -k 5
+#   python requirements/scripts/search_index.py --instrument EU_2024_2956 --facets
+
+VERSION = "v0_1"
+INDEX = Path(f"requirements/library/search_index__{VERSION}.json")
+FORMAT = 1
+
+FIELDS = {"en": "text_en", "de": "text_de"}
+FACETS = {
+    "tag": lambda r: r["topic_tags"],
+    "instrument": lambda r: [r["instrument_code"]],
+    "evidence": lambda r: r["primary_evidence_types"] + r["supporting_evidence_types"],
+}
+K1, B = 1.2, 0.75
+SNIPPET_CHARS = 160
+
+TOKEN_PAT = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = {
+    "en": set("""a an and are as at be by for from has have in into is it its of on or such that the their
+                 them these this those to was were which with shall""".split()),
+    "de": set("""der die das den dem des ein eine einer eines einem einen und oder als am an auf aus bei
+                 durch für im in ist mit nach oder sind so über um von vom vor zu zum zur sowie dass
+                 deren dessen diese dieser dieses es sie sich werden wird""".split()),
+}
+
+# -------------------------
+# Analysis
+# -------------------------
+
+UMLAUTS = str.maketrans({"ä": "a", "ö": "o", "ü": "u", "ß": "ss"})
+DIGRAPH_PAT = re.compile(r"(?<!q)([aou])e")
+
+def fold(token: str, lang: str) -> str:
+    """
+    Lowercase, strip accents; for German also fold umlauts and their ae/oe/ue spellings
+    (Aufträge, Auftraege -> auftrage).
+    """
+    t = token.casefold()
+    if lang == "de":
+        t = DIGRAPH_PAT.sub(r"\1", t.translate(UMLAUTS))
+    if not t.isascii():
+        t = "".join(c for c in unicodedata.normalize("NFKD", t) if not unicodedata.combining(c))
+    return t
+
+def stem_en(t: str) -> str:
+    # plural stripping only (EnglishMinimalStemmer)
+    if len(t) > 4 and t.endswith("ies") and not t.endswith(("eies", "aies")):
+        return t[:-3] + "y"
+    if len(t) > 3 and t.endswith("s") and not t.endswith(("us", "ss")):
+        return t[:-1]
+    return t
+
+def stem_de(t: str) -> str:
+    # light two-step suffix stripping (after GermanLightStemmer)
+    for suf in ("ern", "em", "en", "er", "es", "e"):
+        if t.endswith(suf) and len(t) - len(suf) >= 3:
+            t = t[:-len(suf)]
+            break
+    else:
+        if t.endswith("s") and len(t) > 4:
+            t = t[:-1]
+    for suf in ("en", "er", "st"):
+        if t.endswith(suf) and len(t) - len(suf) >= 4:
+            return t[:-len(suf)]
+    return t
+
+STEM = {"en": stem_en, "de": stem_de}
+
+COMPOUND_MIN = 10          # only try to split folded words at least this long
+PART_MIN = 4
+LINKING = ("", "s", "es", "n", "en")
+
+class CompoundSplitter:
+    """
+    Splits German compounds into parts whose stems occur in `vocab` (the German stems of the
+    corpus), allowing linking morphemes: unterauftragsvergabe -> unterauftrag + vergabe.
+    Fewest parts wins; ties go to the longer head.
+    """
+    def __init__(self, vocab):
+        self.vocab = vocab
+        self.split = lru_cache(maxsize=1 << 16)(self._split)
+
+    def _known(self, part):
+        return len(part) >= PART_MIN and stem_de(part) in self.vocab
+
+    def _split(self, word):
+        if len(word) < COMPOUND_MIN:
+            return ()
+        best = None
+        for i in range(len(word) - PART_MIN, PART_MIN - 1, -1):
+            tail = word[i:]
+            tail_parts = (tail,) if self._known(tail) else self.split(tail)
+            if not tail_parts:
+                continue
+            head = word[:i]
+            for link in LINKING:
+                if link and not head.endswith(link):
+                    continue
+                h = head[:len(head) - len(link)]
+                if self._known(h):
+                    cand = (h,) + tail_parts
+                    if best is None or len(cand) < len(best):
+                        best = cand
+                    break
+        return best or ()
+
+def keep(w: str, lang: str) -> bool:
+    if w.isdigit():
+        return len(w) <= 4           # article / paragraph numbers, years; not long identifiers
+    return w not in STOPWORDS[lang]
+
+def words(text: str, lang: str):
+    for m in TOKEN_PAT.finditer(text or ""):
+        w = fold(m.group(), lang)
+        if keep(w, lang):
+            yield w
+
+def german_vocab(texts):
+    """
+    Stems of all German words in `texts`: the vocabulary CompoundSplitter checks parts against.
+    """
+    surface = {tok for text in texts for tok in TOKEN_PAT.findall(text or "")}
+    return {stem_de(w) for w in words(" ".join(surface), "de")}
+
+class Analyzer:
+    """
+    Index terms for a text: stemmed words, plus the stemmed parts of German compounds.
+    Surface tokens repeat heavily, so each one is folded / stemmed / split once.
+    """
+    def __init__(self, lang, splitter=None):
+        self.lang = lang
+        self.splitter = splitter
+        self.memo = {}
+
+    def terms(self, token):
+        w = fold(token, self.lang)
+        if not keep(w, self.lang):
+            return ()
+        stem = STEM[self.lang]
+        out = (stem(w),)
+        if self.splitter is not None:
+            out += tuple(stem(p) for p in self.splitter.split(w) if p not in STOPWORDS[self.lang])
+        return out
+
+    def __call__(self, text):
+        memo, out = self.memo, []
+        for tok in TOKEN_PAT.findall(text or ""):
+            t = memo.get(tok)
+            if t is None:
+                t = memo[tok] = self.terms(tok)
+            out += t
+        return out
+
+# -------------------------
+# Build
+# -------------------------
+
+def _u32(values):
+    a = array.array("I", values)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a
+
+def build_index(reqs, out: Path = INDEX, source_sha256: str = ""):
+    """
+    Writes <out> (.json header) and <out>.bin. Both are replaced atomically, the .bin first,
+    so a reader never sees a header pointing into a different postings file.
+    """
+    n = len(reqs)
+    de_vocab = german_vocab(r[FIELDS["de"]] for r in reqs)
+    analyzers = {"en": Analyzer("en"), "de": Analyzer("de", CompoundSplitter(de_vocab))}
+
+    u32 = array.array("I")
+    header = {"format": FORMAT, "version": VERSION, "source_sha256": source_sha256,
+              "n_docs": n, "fields": {}, "facets": {}, "sections": {}}
+
+    for lang, col in FIELDS.items():
+        postings = defaultdict(list)
+        lengths = []
+        for doc, r in enumerate(reqs):
+            terms = analyzers[lang](r[col])
+            lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings[term].append((doc, tf))
+        vocab = {}
+        for term in sorted(postings):
+            plist = postings[term]
+            vocab[term] = [len(plist), len(u32)]
+            u32.extend(_u32(d for d, _ in plist))
+            u32.extend(_u32(tf for _, tf in plist))
+        header["sections"][f"doclen_{lang}"] = len(u32)
+        u32.extend(_u32(lengths))
+        header["fields"][lang] = {"avgdl": (sum(lengths) / n) if n else 0.0, "terms": vocab}
+
+    for facet, values_of in FACETS.items():
+        docs_by_value = defaultdict(list)
+        for doc, r in enumerate(reqs):
+            for v in dict.fromkeys(values_of(r)):
+                docs_by_value[v].append(doc)
+        header["facets"][facet] = {}
+        for v in sorted(docs_by_value):
+            header["facets"][facet][v] = [len(docs_by_value[v]), len(u32)]
+            u32.extend(_u32(docs_by_value[v]))
+
+    # doc records: one JSON line per doc, located through a uint32 byte-offset table
+    blob, offsets = bytearray(), [0]
+    for r in reqs:
+        blob += json.dumps({
+            "req_id": r["req_id"], "instrument_code": r["instrument_code"], "legal_ref": r["legal_ref"],
+            "en": r[FIELDS["en"]][:SNIPPET_CHARS], "de": r[FIELDS["de"]][:SNIPPET_CHARS],
+        }, ensure_ascii=False).encode("utf-8") + b"\n"
+        offsets.append(len(blob))
+    header["sections"]["doc_offsets"] = len(u32)
+    u32.extend(_u32(offsets))
+    header["sections"]["records_at"] = len(u32) * 4
+
+    bin_path = out.with_suffix(".bin")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = bin_path.with_suffix(".bin.tmp")
+    with tmp.open("wb") as f:
+        f.write(u32.tobytes())
+        f.write(blob)
+    header["bin_bytes"] = tmp.stat().st_size
+    os.replace(tmp, bin_path)
+    tmp = out.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(header, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, out)
+    return header
+
+# -------------------------
+# Query
+# -------------------------
+
+class SearchIndex:
+    def __init__(self, path: Path = INDEX):
+        self.header = json.loads(path.read_text(encoding="utf-8"))
+        if self.header.get("format") != FORMAT:
+            raise ValueError(f"{path}: unsupported index format {self.header.get('format')}, rebuild with 04")
+        bin_path = path.with_suffix(".bin")
+        with bin_path.open("rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) != self.header["bin_bytes"]:
+            raise ValueError(f"{bin_path} does not match {path}, rebuild with 04")
+        self.records_at = self.header["sections"]["records_at"]
+        if sys.byteorder == "little":
+            self.u32 = memoryview(self.mm)[:self.records_at].cast("I")
+        else:
+            a = array.array("I", self.mm[:self.records_at])
+            a.byteswap()
+            self.u32 = a
+        self.n = self.header["n_docs"]
+        de_terms = self.header["fields"]["de"]["terms"]
+        self.splitter = CompoundSplitter(de_terms.keys())
+
+    def _slice(self, off, n):
+        return self.u32[off:off + n]
+
+    def term_counts(self, lang):
+        """
+        (terms, docs x terms scipy CSC matrix of term frequencies) for one field, straight from the
+        postings: lets 06 reuse the analysis done at build time instead of re-tokenizing the library.
+        """
+        import numpy as np
+        from scipy import sparse
+        terms = list(self.header["fields"][lang]["terms"].items())
+        df = np.fromiter((v[0] for _, v in terms), dtype=np.int64, count=len(terms))
+        off = np.fromiter((v[1] for _, v in terms), dtype=np.int64, count=len(terms))
+        u32 = np.frombuffer(self.mm, dtype="<u4", count=self.records_at // 4)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+        # position of every posting: its term's doc-id block start + rank within the block
+        pos = np.repeat(off - indptr[:-1], df) + np.arange(indptr[-1])
+        docs = u32[pos].astype(np.int32)
+        tfs = u32[pos + np.repeat(df, df)].astype(np.float32)
+        m = sparse.csc_matrix((tfs, docs, indptr), shape=(self.n, len(terms)))
+        return [t for t, _ in terms], m
+
+    def doclen(self, lang, doc):
+        return self.u32[self.header["sections"][f"doclen_{lang}"] + doc]
+
+    def record(self, doc):
+        base = self.header["sections"]["doc_offsets"]
+        a, b = self.u32[base + doc], self.u32[base + doc + 1]
+        return json.loads(self.mm[self.records_at + a:self.records_at + b])
+
+    def facet_docs(self, facet, values):
+        """
+        Docs having any of `values` for this facet (None: no restriction).
+        """
+        if not values:
+            return None
+        table = self.header["facets"][facet]
+        docs = set()
+        for v in values:
+            if v in table:
+                df, off = table[v]
+                docs.update(self._slice(off, df))
+        return docs
+
+    def query_terms(self, text, lang):
+        """
+        Query terms for one field. German words missing from the vocabulary are split into
+        known compound parts, so "Unterauftragsvergabe" also finds "Vergabe von Unteraufträgen".
+        """
+        vocab = self.header["fields"][lang]["terms"]
+        stem = STEM[lang]
+        out = []
+        for w in words(text, lang):
+            t = stem(w)
+            out.append(t)
+            if lang == "de" and t not in vocab:
+                out += [stem(p) for p in self.splitter.split(w) if p not in STOPWORDS[lang]]
+        return list(dict.fromkeys(out))
+
+    def search(self, text, k=10, langs=("en", "de"), tag=None, instrument=None, evidence=None):
+        """
+        BM25 over the selected fields (scores summed), restricted to docs matching every given facet.
+        Returns (total matches, [(score, doc), ...] top k). An empty query lists the filtered docs.
+        """
+        allowed = None
+        for facet, values in (("tag", tag), ("instrument", instrument), ("evidence", evidence)):
+            docs = self.facet_docs(facet, values)
+            if docs is not None:
+                allowed = docs if allowed is None else allowed & docs
+
+        scores = defaultdict(float)
+        any_terms = False
+        for lang in langs:
+            field = self.header["fields"][lang]
+            avgdl = field["avgdl"] or 1.0
+            dl_base = self.header["sections"][f"doclen_{lang}"]
+            for term in self.query_terms(text, lang):
+                any_terms = True
+                hit = field["terms"].get(term)
+                if hit is None:
+                    continue
+                df, off = hit
+                idf = math.log(1 + (self.n - df + 0.5) / (df + 0.5))
+                for doc, tf in zip(self._slice(off, df), self._slice(off + df, df)):
+                    if allowed is not None and doc not in allowed:
+                        continue
+                    dl = self.u32[dl_base + doc]
+                    scores[doc] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * dl / avgdl))
+
+        if not any_terms:
+            docs = sorted(allowed) if allowed is not None else range(self.n)
+            return len(docs), [(0.0, d) for d in list(docs)[:k]]
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return len(ranked), [(s, d) for d, s in ranked[:k]]
+
+    def facet_counts(self, docs):
+        docs = set(docs)
+        out = {}
+        for facet, table in self.header["facets"].items():
+            counts = {v: sum(1 for d in self._slice(off, df) if d in docs) for v, (df, off) in table.items()}
+            out[facet] = {v: c for v, c in sorted(counts.items(), key=lambda x: (-x[1], x[0])) if c}
+        return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Query the requirements search index (built by 04).")
+    ap.add_argument("query", nargs="*", help="free text, English and/or German")
+    ap.add_argument("-k", type=int, default=10, help="number of hits to show")
+    ap.add_argument("--lang", choices=["en", "de"], help="search only this language field")
+    ap.add_argument("--tag", action="append", help="topic tag filter (repeat for OR)")
+    ap.add_argument("--instrument", action="append", help="instrument_code filter (repeat for OR)")
+    ap.add_argument("--evidence", action="append", help="primary or supporting evidence type filter (repeat for OR)")
+    ap.add_argument("--facets", action="store_true", help="print facet counts over all matches")
+    ap.add_argument("--json", action="store_true", help="one JSON line per hit")
+    ap.add_argument("--index", type=Path, default=INDEX)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    idx = SearchIndex(args.index)
+    t1 = time.perf_counter()
+    langs = (args.lang,) if args.lang else ("en", "de")
+    k = idx.n if args.facets else args.k
+    total, hits = idx.search(" ".join(args.query), k=k, langs=langs,
+                             tag=args.tag, instrument=args.instrument, evidence=args.evidence)
+    t2 = time.perf_counter()
+
+    for score, doc in hits[:args.k]:
+        rec = idx.record(doc)
+        if args.json:
+            print(json.dumps({"score": round(score, 4), **rec}, ensure_ascii=False))
+            continue
+        text = rec["de"] if args.lang == "de" else rec["en"] or rec["de"]
+        print(f"{score:7.3f}  {rec['req_id']:32s} {rec['legal_ref']:12s} {text[:90]}")
+    if not args.json:
+        print(f"{total} match(es); load {1000 * (t1 - t0):.1f} ms, query {1000 * (t2 - t1):.1f} ms")
+    if args.facets:
+        for facet, counts in idx.facet_counts(d for _, d in hits).items():
+            print(f"{facet}: " + ", ".join(f"{v} ({c})" for v, c in counts.items()))
+
+if __name__ == "__main__":
+    main()
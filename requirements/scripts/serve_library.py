@@ -0,0 +1,361 @@
+import asyncio, hashlib, json, sys, time, zlib, argparse
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+# Local read-only JSON service over the requirements library and audit question map.
+#
+#   python requirements/scripts/serve_library.py --port 8765
+#
+#   GET /health
+#   GET /requirements/<req_id>                      (req_id URL-encoded, e.g. DORA_2022_2554%7C30%7C2%7C-%7C001)
+#   GET /requirements?instrument=..&tag=..&evidence=..&legal_ref=..&offset=0&limit=50
+#   GET /questions
+#   GET /questions/<question_id>                    (with the ranked requirement summaries)
+#
+# Both files are loaded once into a Snapshot with dict indexes. Responses are cached (LRU) as
+# ready-to-send bytes and carry an ETag derived from the sha256 of both files, so If-None-Match
+# gets a 304. A watcher reloads in a worker thread when the files change and swaps the snapshot
+# in one assignment; a half-written or inconsistent pair (new library, old map) is not served.
+#
+#   python requirements/scripts/serve_library.py --loadtest http://127.0.0.1:8765 -n 20000 -c 16
+
+VERSION = "v0_1"
+LIBRARY = Path(f"requirements/library/requirements__{VERSION}.jsonl")
+QUESTION_MAP = Path(f"requirements/library/audit_question_map__{VERSION}.jsonl")
+
+CACHE_ENTRIES = 4096
+DEFAULT_LIMIT, MAX_LIMIT = 50, 1000
+RELOAD_POLL_S = 1.0
+SUMMARY_FIELDS = ("req_id", "instrument_code", "legal_ref", "topic_tags")
+
+
+def dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class Snapshot:
+    """
+    One consistent, immutable view of the library and the question map.
+    """
+    def __init__(self, lib_bytes, map_bytes):
+        self.reqs = [json.loads(l) for l in lib_bytes.decode("utf-8").splitlines() if l.strip()]
+        self.questions = [json.loads(l) for l in map_bytes.decode("utf-8").splitlines() if l.strip()]
+        self.sha256 = {
+            "library": hashlib.sha256(lib_bytes).hexdigest(),
+            "question_map": hashlib.sha256(map_bytes).hexdigest(),
+        }
+        self.etag = hashlib.sha256((self.sha256["library"] + self.sha256["question_map"]).encode()).hexdigest()[:20]
+        self.loaded_utc = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+        self.by_id = {}
+        self.by_key = {"legal_ref": {}, "instrument": {}, "tag": {}, "evidence": {}}
+        for i, r in enumerate(self.reqs):
+            if r["req_id"] in self.by_id:
+                raise ValueError(f"duplicate req_id {r['req_id']}")
+            self.by_id[r["req_id"]] = i
+            keys = {
+                "legal_ref": [r["legal_ref"]],
+                "instrument": [r["instrument_code"]],
+                "tag": r["topic_tags"],
+                "evidence": r["primary_evidence_types"] + r["supporting_evidence_types"],
+            }
+            for name, values in keys.items():
+                for v in dict.fromkeys(values):
+                    self.by_key[name].setdefault(v, []).append(i)
+
+        self.question_by_id = {}
+        for q in self.questions:
+            missing = [rid for rid in q["related_req_ids"] if rid not in self.by_id]
+            if missing:
+                raise ValueError(f"{q['question_id']} links {len(missing)} req_id(s) not in the library, "
+                                 f"e.g. {missing[0]} (question map older than the library?)")
+            self.question_by_id[q["question_id"]] = q
+
+    def summary(self, i):
+        r = self.reqs[i]
+        return {k: r[k] for k in SUMMARY_FIELDS}
+
+    def select(self, filters):
+        """
+        Library-order row numbers matching every (key -> any of values) filter.
+        """
+        rows = None
+        for key, values in filters.items():
+            hit = set()
+            for v in values:
+                hit.update(self.by_key[key].get(v, ()))
+            rows = hit if rows is None else rows & hit
+        return range(len(self.reqs)) if rows is None else sorted(rows)
+
+
+def file_state(paths):
+    out = []
+    for p in paths:
+        try:
+            st = p.stat()
+            out.append((st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            out.append(None)
+    return tuple(out)
+
+
+class LibraryService:
+    def __init__(self, library=LIBRARY, question_map=QUESTION_MAP, cache_entries=CACHE_ENTRIES):
+        self.paths = (library, question_map)
+        self.cache_entries = cache_entries
+        self.cache = OrderedDict()
+        self.snapshot = None
+        self.state = None
+        self.stats = {"requests": 0, "cache_hits": 0, "not_modified": 0, "reloads": 0, "reload_errors": 0}
+
+    def load(self):
+        """
+        Reads both files and builds a Snapshot (runs in a worker thread on reload).
+        """
+        state = file_state(self.paths)
+        lib_bytes, map_bytes = (p.read_bytes() for p in self.paths)
+        if file_state(self.paths) != state:
+            raise ValueError("files changed while reading")
+        return state, Snapshot(lib_bytes, map_bytes)
+
+    def install(self, state, snapshot):
+        # single reference swap: in-flight requests keep the snapshot they started with
+        self.snapshot, self.state = snapshot, state
+        self.cache.clear()
+
+    async def watch(self, poll_s):
+        pending = rejected = None
+        while True:
+            await asyncio.sleep(poll_s)
+            state = file_state(self.paths)
+            if state in (self.state, rejected) or None in state:
+                pending = None
+                continue
+            if state != pending:
+                # wait one more poll: the pipeline may still be writing
+                pending = state
+                continue
+            try:
+                new_state, snap = await asyncio.to_thread(self.load)
+            except (ValueError, KeyError, OSError) as e:
+                self.stats["reload_errors"] += 1
+                print(f"reload skipped: {e}", file=sys.stderr)
+                # not retried until one of the files changes again
+                pending, rejected = None, state
+                continue
+            self.install(new_state, snap)
+            self.stats["reloads"] += 1
+            pending = None
+            print(f"reloaded: {len(snap.reqs)} requirements, {len(snap.questions)} questions, etag {snap.etag}",
+                  file=sys.stderr)
+
+    # --- request handling -------------------------------------------------------------------
+
+    def respond(self, target, if_none_match=None):
+        """
+        -> (status, body bytes, etag). Bodies for the same snapshot and target are cached.
+        """
+        self.stats["requests"] += 1
+        snap = self.snapshot
+        key = target
+        hit = self.cache.get(key)
+        if hit is not None and hit[0] is snap:
+            self.cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            status, body, etag = hit[1]
+        else:
+            status, obj = self.route(snap, target)
+            body = dumps(obj)
+            etag = f'"{snap.etag}-{zlib.crc32(target.encode("utf-8")):08x}"'
+            if not target.startswith("/health"):    # live stats
+                self.cache[key] = (snap, (status, body, etag))
+                if len(self.cache) > self.cache_entries:
+                    self.cache.popitem(last=False)
+        if status == 200 and if_none_match is not None and etag in if_none_match:
+            self.stats["not_modified"] += 1
+            return 304, b"", etag
+        return status, body, etag
+
+    def route(self, snap, target):
+        url = urlsplit(target)
+        parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+        query = parse_qs(url.query)
+
+        if parts == ["health"]:
+            return 200, {"status": "ok", "version": VERSION, "requirements": len(snap.reqs),
+                         "questions": len(snap.questions), "sha256": snap.sha256, "etag": snap.etag,
+                         "loaded_utc": snap.loaded_utc, "stats": self.stats}
+
+        if parts[:1] == ["requirements"]:
+            if len(parts) == 2:
+                i = snap.by_id.get(parts[1])
+                if i is None:
+                    return 404, {"error": f"unknown req_id {parts[1]}"}
+                return 200, snap.reqs[i]
+            if len(parts) == 1:
+                unknown = set(query) - set(snap.by_key) - {"offset", "limit", "fields"}
+                if unknown:
+                    return 400, {"error": f"unknown parameter(s): {', '.join(sorted(unknown))}"}
+                try:
+                    offset = max(0, int(query.get("offset", ["0"])[0]))
+                    limit = min(MAX_LIMIT, max(0, int(query.get("limit", [str(DEFAULT_LIMIT)])[0])))
+                except ValueError:
+                    return 400, {"error": "offset and limit must be integers"}
+                rows = snap.select({k: v for k, v in query.items() if k in snap.by_key})
+                page = rows[offset:offset + limit]
+                full = query.get("fields", ["summary"])[0] == "full"
+                items = [snap.reqs[i] if full else snap.summary(i) for i in page]
+                return 200, {"total": len(rows), "offset": offset, "limit": limit, "items": items}
+
+        if parts[:1] == ["questions"]:
+            if len(parts) == 1:
+                return 200, {"total": len(snap.questions),
+                             "items": [{k: q[k] for k in ("question_id", "workflow", "text_en", "text_de")}
+                                       for q in snap.questions]}
+            if len(parts) == 2:
+                q = snap.question_by_id.get(parts[1])
+                if q is None:
+                    return 404, {"error": f"unknown question_id {parts[1]}"}
+                scores = q.get("related_scores") or [None] * len(q["related_req_ids"])
+                related = [dict(snap.summary(snap.by_id[rid]), score=s)
+                           for rid, s in zip(q["related_req_ids"], scores)]
+                return 200, {k: v for k, v in q.items() if k not in ("related_req_ids", "related_scores")} | \
+                    {"related": related}
+
+        return 404, {"error": f"no route for {url.path}"}
+
+
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+class HttpProtocol(asyncio.Protocol):
+    """
+    Minimal HTTP/1.1: GET/HEAD, keep-alive, pipelining; no request bodies.
+    """
+    def __init__(self, service):
+        self.service = service
+        self.buf = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buf += data
+        while True:
+            end = self.buf.find(b"\r\n\r\n")
+            if end < 0:
+                if len(self.buf) > 65536:
+                    self.transport.close()
+                return
+            head, self.buf = self.buf[:end].decode("latin-1"), self.buf[end + 4:]
+            lines = head.split("\r\n")
+            try:
+                method, target, version = lines[0].split(" ", 2)
+            except ValueError:
+                self.transport.close()
+                return
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+            if method not in ("GET", "HEAD"):
+                status, body, etag = 405, dumps({"error": "read-only service"}), None
+            else:
+                status, body, etag = self.service.respond(target, headers.get("if-none-match"))
+            out = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                   "Content-Type: application/json; charset=utf-8",
+                   f"Content-Length: {len(body)}"]
+            if etag:
+                out.append(f"ETag: {etag}")
+            if not keep_alive:
+                out.append("Connection: close")
+            self.transport.write(("\r\n".join(out) + "\r\n\r\n").encode("latin-1") +
+                                 (b"" if method == "HEAD" else body))
+            if not keep_alive:
+                self.transport.close()
+                return
+
+
+async def serve(args):
+    service = LibraryService(cache_entries=args.cache_entries)
+    service.install(*service.load())
+    snap = service.snapshot
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: HttpProtocol(service), args.host, args.port, reuse_address=True)
+    print(f"Serving {len(snap.reqs)} requirements, {len(snap.questions)} questions on "
+          f"http://{args.host}:{args.port} (etag {snap.etag})", file=sys.stderr)
+    watcher = asyncio.create_task(service.watch(args.poll)) if args.poll > 0 else None
+    try:
+        await server.serve_forever()
+    finally:
+        if watcher:
+            watcher.cancel()
+
+
+# --- load test client ---------------------------------------------------------------------------
+
+async def loadtest(base, n, concurrency, paths):
+    url = urlsplit(base)
+    host, port = url.hostname, url.port or 80
+    done = 0
+    statuses = {}
+
+    async def worker(k):
+        nonlocal done
+        reader, writer = await asyncio.open_connection(host, port)
+        i = k
+        while True:
+            if done >= n:
+                break
+            done += 1
+            path = paths[i % len(paths)]
+            i += concurrency
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+            head = await reader.readuntil(b"\r\n\r\n")
+            status = int(head.split(b" ", 2)[1])
+            length = int(head.lower().split(b"content-length:")[1].split(b"\r\n")[0])
+            await reader.readexactly(length)
+            statuses[status] = statuses.get(status, 0) + 1
+        writer.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(k) for k in range(concurrency)))
+    dt = time.perf_counter() - t0
+    print(f"{done} requests in {dt:.2f}s = {done / dt:,.0f} req/s over {concurrency} connections; status {statuses}")
+
+
+def sample_paths():
+    from urllib.parse import quote
+    reqs = [json.loads(l) for l in LIBRARY.read_text(encoding="utf-8").splitlines() if l.strip()]
+    qs = [json.loads(l) for l in QUESTION_MAP.read_text(encoding="utf-8").splitlines() if l.strip()]
+    paths = [f"/requirements/{quote(r['req_id'], safe='')}" for r in reqs]
+    paths += [f"/questions/{q['question_id']}" for q in qs]
+    paths += ["/requirements?tag=INCIDENT", "/requirements?instrument=EU_2024_2956&fields=full",
+              "/requirements?evidence=CONTRACT_CLAUSE&tag=TPRM"]
+    return paths
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve the requirements library and audit map as local JSON over HTTP.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--poll", type=float, default=RELOAD_POLL_S, help="seconds between reload checks (0: never)")
+    ap.add_argument("--cache-entries", type=int, default=CACHE_ENTRIES)
+    ap.add_argument("--loadtest", metavar="BASE_URL", help="run the load-test client against a running service")
+    ap.add_argument("-n", type=int, default=20000, help="loadtest: total requests")
+    ap.add_argument("-c", type=int, default=16, help="loadtest: concurrent keep-alive connections")
+    args = ap.parse_args()
+
+    try:
+        if args.loadtest:
+            asyncio.run(loadtest(args.loadtest, args.n, args.c, sample_paths()))
+        else:
+            asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
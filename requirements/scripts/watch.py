@@ -0,0 +1,288 @@
+import contextlib, ctypes, ctypes.util, hashlib, importlib.util, io, json, os, select, struct, sys, time, traceback, argparse
+from pathlib import Path
+import metrics
+import library_diff
+import run_pipeline
+
+# Watch mode: rebuild the affected artifacts on every edit under requirements/sources and
+# requirements/config, without re-launching the pipeline. Run from the repo root:
+#
+#   python requirements/scripts/watch.py            # inotify, polling where it is unavailable
+#   python requirements/scripts/watch.py --poll 0.5
+#
+# Which stages run is decided exactly as in run_pipeline.py (content fingerprints, unchanged
+# outputs stop the propagation), but they run in this process: numpy, scipy, lxml, the
+# classifier config etc. are imported once, so a run costs the work, not the interpreter start.
+# The slices come from the stages' own incremental paths:
+#   a changed source      01 re-hashes it (stat cache), 02 re-extracts that instrument/language
+#                         only (the other documents are hits of its extraction cache)
+#   audit questions       06 gets --changes with a library diff against the previous round's
+#                         library (kept in memory), so only edited / new questions are re-mapped
+#   library rows          07 gets the same diff and re-checks only the touched requirements
+# Outputs are published with temp file + rename (pipeline_io.temp_path), so readers never see
+# a partial file. When the scripts themselves were edited, the next event restarts the watcher.
+
+ROOTS = [Path("requirements/sources"), Path("requirements/config")]
+WATCH_DIR = Path("requirements/.cache/watch")
+LIBRARY = Path("requirements/library/requirements__v0_1.jsonl")
+DEBOUNCE = 0.2      # seconds without events that end a burst (editors write several times per save)
+
+# -------------------------
+# File events
+# -------------------------
+
+IN_ATTRIB, IN_CLOSE_WRITE = 0x4, 0x8
+IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+IN_Q_OVERFLOW, IN_ISDIR = 0x4000, 0x40000000
+EVENT = struct.Struct("iIII")   # struct inotify_event: wd, mask, cookie, len (+ name)
+
+def ignored(name: str) -> bool:
+    # editor swap / backup files and our own temp files
+    return name.startswith((".", "#")) or name.endswith(("~", ".swp", ".tmp"))
+
+class Inotify:
+    """
+    inotify(7) over ctypes, every directory below `roots` watched. wait() returns the changed paths.
+    """
+    MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, roots):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)   # AttributeError off Linux
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        self.roots = roots
+        for root in roots:
+            self.add_tree(root)
+
+    def add_tree(self, root: Path):
+        for d, _, _ in os.walk(root):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(d), self.MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {d}")
+            self.dirs[wd] = Path(d)
+
+    def wait(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, pos)
+                name = os.fsdecode(data[pos + EVENT.size:pos + EVENT.size + length].rstrip(b"\0"))
+                pos += EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed |= set(self.roots)    # events were lost; let the fingerprints sort it out
+                    continue
+                if wd not in self.dirs or ignored(name):
+                    continue
+                path = self.dirs[wd] / name
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path)
+                changed.add(path)
+
+    def close(self):
+        os.close(self.fd)
+
+class Poller:
+    """
+    Fallback: compares (size, mtime_ns) of every file below `roots` each `interval` seconds.
+    """
+    def __init__(self, roots, interval=0.5):
+        self.roots = roots
+        self.interval = interval
+        self.seen = self.scan()
+
+    def scan(self):
+        out = {}
+        for root in self.roots:
+            for d, _, names in os.walk(root):
+                for name in names:
+                    if not ignored(name):
+                        p = Path(d) / name
+                        with contextlib.suppress(FileNotFoundError):
+                            st = p.stat()
+                            out[p] = (st.st_size, st.st_mtime_ns)
+        return out
+
+    def wait(self, timeout):
+        end = time.monotonic() + (timeout if timeout is not None else float("inf"))
+        while True:
+            now = self.scan()
+            changed = {p for p in now.keys() | self.seen.keys() if now.get(p) != self.seen.get(p)}
+            self.seen = now
+            if changed or time.monotonic() >= end:
+                return changed
+            time.sleep(min(self.interval, max(0.0, end - time.monotonic())))
+
+    def close(self):
+        pass
+
+def file_events(roots, poll=None):
+    """
+    Inotify over `roots`, or a Poller when poll (seconds) is given or inotify is not available.
+    """
+    if poll is None:
+        try:
+            return Inotify(roots)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}); polling every 0.5s")
+            poll = 0.5
+    return Poller(roots, poll)
+
+def next_burst(events, debounce=DEBOUNCE):
+    """
+    Blocks until something changes, then collects events until `debounce` seconds pass without one.
+    """
+    changed = set()
+    while not changed:
+        changed = events.wait(None)
+    while True:
+        more = events.wait(debounce)
+        if not more:
+            return changed
+        changed |= more
+
+# -------------------------
+# In-process stages
+# -------------------------
+
+def run_in_process(name, stage, argv, verbose=False):
+    """
+    Executes a stage script as __main__ would, in this interpreter. Returns (ok, output, seconds).
+    The script module is executed afresh each time; the modules it imports stay loaded. It is
+    registered in sys.modules while it runs, so process pools (07 --jobs, 02 --workers) can
+    pickle its functions.
+    """
+    path = run_pipeline.SCRIPTS / stage["script"]
+    spec = importlib.util.spec_from_file_location(f"stage_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    out = sys.stdout if verbose else io.StringIO()
+    saved_argv, ok = sys.argv, True
+    t0 = time.perf_counter()
+    sys.argv = [str(path)] + argv
+    sys.modules[spec.name] = module
+    try:
+        with contextlib.redirect_stdout(out):
+            spec.loader.exec_module(module)
+            with metrics.stage(name):
+                module.main()
+    except SystemExit as e:
+        ok = e.code in (None, 0)
+        if not ok:
+            print(e.code, file=out)
+    except Exception:
+        ok = False
+        out.write(traceback.format_exc())
+    finally:
+        sys.argv = saved_argv
+        sys.modules.pop(spec.name, None)
+    return ok, ("" if verbose else out.getvalue()), time.perf_counter() - t0
+
+class Session:
+    """
+    Pipeline state between rounds: the run_pipeline state file, and the library (bytes) the
+    current question map / QC report were built from, for the --changes diffs.
+    """
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.state = run_pipeline.load_state()
+        self.file_sha = run_pipeline.FileHasher(self.state.setdefault("files", {}))
+        self.deps = run_pipeline.upstream(run_pipeline.STAGES)
+        self.library = None
+        self.diff = None
+
+    def changes(self):
+        """
+        Path of the library diff previous round -> now (written once per round), or None.
+        """
+        if self.diff is None and self.library is not None:
+            WATCH_DIR.mkdir(parents=True, exist_ok=True)
+            old = WATCH_DIR / "library_prev.jsonl"
+            old.write_bytes(self.library)
+            diff = library_diff.diff_libraries(old, LIBRARY)
+            self.diff = WATCH_DIR / "library_diff.json"
+            self.diff.write_text(json.dumps(diff, ensure_ascii=False), encoding="utf-8")
+        return self.diff
+
+    def stage_args(self, name):
+        if name in ("06", "07") and self.library is not None:
+            return ["--changes", str(self.changes())]
+        return []
+
+    def round(self):
+        """
+        Runs the dirty stages in DAG order. Returns (stages run, stages failed).
+        """
+        ran, failed = [], set()
+        self.diff = None
+        for name, stage in run_pipeline.STAGES.items():
+            if self.deps[name] & failed:
+                failed.add(name)
+                print(f"[{name}] skipped (upstream failed)")
+                continue
+            reason = run_pipeline.dirty_reason(name, self.state, self.file_sha)
+            if reason is None:
+                continue
+            fp = run_pipeline.fingerprint(stage, self.file_sha)
+            argv = self.stage_args(name)
+            ok, output, dt = run_in_process(name, stage, argv, self.verbose)
+            if not ok:
+                failed.add(name)
+                print(output, end="")
+                print(f"[{name}] FAILED after {dt:.2f}s")
+                continue
+            run_pipeline.record_run(self.state, name, fp, self.file_sha)
+            ran.append(name)
+            print(f"[{name}] {' '.join([stage['script']] + argv)} ({reason}) {dt:.2f}s")
+        # the next diffs start from what 06 / 07 were built from; after a failure, rebuild them in full
+        if {"06", "07"} & failed or not LIBRARY.exists():
+            self.library = None
+        else:
+            self.library = LIBRARY.read_bytes()
+        return ran, failed
+
+def code_sha():
+    h = hashlib.sha256()
+    for p in sorted(run_pipeline.SCRIPTS.glob("*.py")):
+        h.update(p.read_bytes())
+    return h.hexdigest()
+
+def main():
+    ap = argparse.ArgumentParser(description="Rebuild the affected pipeline artifacts whenever a source or config file changes.")
+    ap.add_argument("--poll", type=float, metavar="SECONDS", help="poll at this interval instead of using inotify")
+    ap.add_argument("--debounce", type=float, default=DEBOUNCE, help="quiet seconds that end a burst of events")
+    ap.add_argument("-v", "--verbose", action="store_true", help="stream stage output")
+    args = ap.parse_args()
+
+    session = Session(args.verbose)
+    ran, _ = session.round()
+    print(f"Up to date ({'ran ' + ', '.join(ran) if ran else 'nothing to run'}); watching "
+          f"{', '.join(map(str, ROOTS))}")
+    code = code_sha()
+    events = file_events(ROOTS, args.poll)
+    try:
+        while True:
+            changed = next_burst(events, args.debounce)
+            if code_sha() != code:
+                print("Pipeline code changed; restarting")
+                events.close()
+                os.execv(sys.executable, [sys.executable] + sys.argv)
+            t0 = time.perf_counter()
+            ran, failed = session.round()
+            names = ", ".join(sorted(str(p) for p in changed)[:3]) + (" ..." if len(changed) > 3 else "")
+            print(f"{names}: {'ran ' + ', '.join(ran) if ran else 'no stage affected'}"
+                  f"{' (FAILED ' + ', '.join(sorted(failed)) + ')' if failed else ''} in {time.perf_counter() - t0:.2f}s")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        events.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+import citations
+
+NUMBERS = {"2022/2554": "DORA_2022_2554", "2554/2022": "DORA_2022_2554"}
+
+def targets(text_en="", text_de="", req_id="EU_2024_1772|1|1|-|001"):
+    """
+    Node keys the requirement `req_id` with these texts cites, and the extraction counts.
+    """
+    nodes, edges, counts = citations.build_graph([{"req_id": req_id, "text_en": text_en, "text_de": text_de}], NUMBERS)
+    return sorted(nodes[j] for _, j, _ in edges), counts
+
+def test_point_with_instrument_suffix():
+    got, _ = targets("as referred to in Article 18(1), point (a), of Regulation (EU) 2022/2554;")
+    assert got == ["DORA_2022_2554|18|1|a"]
+
+def test_point_list_with_instrument_suffix():
+    got, _ = targets("Article 19(4), points (a), (b) and (c), of Regulation (EU) 2022/2554 within")
+    assert got == ["DORA_2022_2554|19|4|a", "DORA_2022_2554|19|4|b", "DORA_2022_2554|19|4|c"]
+
+def test_numbered_point_of_unknown_directive():
+    got, counts = targets("within the meaning of Article 2(1), point (35), of Directive 2014/59/EU; and")
+    assert got == []
+    assert counts["unknown_instrument"] == 1
+
+def test_de_letter_and_paragraph_of_unknown_regulation():
+    got, counts = targets(text_de="die in Artikel 7 Absatz 4 Buchstabe b und Absatz 5 der Verordnung (EU) Nr. 806/2014 genannten",
+                          req_id="DORA_2022_2554|19|6|-|001")
+    assert got == []
+    assert counts["unknown_instrument"] == 1
+
+def test_de_letter_list_with_instrument_suffix():
+    got, _ = targets(text_de="gemäß Artikel 19 Absatz 4 Buchstaben a, b und c der Verordnung (EU) 2022/2554 innerhalb")
+    assert got == ["DORA_2022_2554|19|4|a", "DORA_2022_2554|19|4|b", "DORA_2022_2554|19|4|c"]
+
+def test_unparsed_instrument_reference_is_dropped():
+    got, counts = targets("referred to in Article 3 of Commission Delegated Regulation laying down")
+    assert got == []
+    assert counts["unknown_instrument"] == 1
+
+def test_reference_within_citing_instrument():
+    got, _ = targets("referred to in Article 5(2) of this Regulation", req_id="DORA_2022_2554|6|1|-|001")
+    assert got == ["DORA_2022_2554|5|2"]